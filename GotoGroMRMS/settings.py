@@ -30,6 +30,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'members.instrumentation.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -64,13 +65,69 @@ WSGI_APPLICATION = 'GotoGroMRMS.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+# Database profile, 'sqlite' (default) or 'postgres', compare them with: python -m benchmarks.database_profiles
+DATABASE_PROFILE = os.getenv('DATABASE_PROFILE', 'sqlite')
+
+# Seconds a connection is reused across requests before it is closed, 0 opens a new one for every request
+DATABASE_CONN_MAX_AGE = int(os.getenv('DATABASE_CONN_MAX_AGE', 60))
+
+# PRAGMAs run on every new SQLite connection when SQLITE_TUNING is on:
+# WAL lets readers carry on while one connection writes, NORMAL sync is safe in WAL mode and avoids an fsync per commit,
+# busy_timeout waits this many milliseconds for a lock instead of failing with "database is locked",
+# mmap_size serves reads from a memory mapping of this many bytes of the file
+SQLITE_TUNING = os.getenv('SQLITE_TUNING', 'true').lower() != 'false'
+
+SQLITE_PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000)),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
 }
 
+if DATABASE_PROFILE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'gotogro'),
+            'USER': os.getenv('POSTGRES_USER', 'gotogro'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('POSTGRES_HOST', 'localhost'),
+            'PORT': os.getenv('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+
+            # Persistent connections are checked before reuse so a restarted server does not fail the next request
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+
+    # psycopg's connection pool can replace persistent connections, it needs psycopg[pool] installed
+    if os.getenv('POSTGRES_POOL', 'false').lower() == 'true':
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.getenv('POSTGRES_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.getenv('POSTGRES_POOL_MAX_SIZE', 10)),
+            },
+        }
+
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+
+    if SQLITE_TUNING:
+        DATABASES['default']['OPTIONS'] = {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+
+            # Writers take the write lock when the transaction begins, instead of failing to upgrade a read lock later
+            'transaction_mode': 'IMMEDIATE',
+        }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -107,6 +164,139 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_REDIRECT_URL = 'dashboard'
 
+# Number of sales shown per sales history page, ?page_size= can change it up to the maximum
+SALES_HISTORY_PAGE_SIZE = int(os.getenv('SALES_HISTORY_PAGE_SIZE', 50))
+
+SALES_HISTORY_MAX_PAGE_SIZE = 500
+
+# Number of transactions shown per transaction history page, ?page_size= can change it up to the maximum
+TRANSACTION_HISTORY_PAGE_SIZE = int(os.getenv('TRANSACTION_HISTORY_PAGE_SIZE', 50))
+
+TRANSACTION_HISTORY_MAX_PAGE_SIZE = 500
+
+# Number of rows fetched from the database at a time while streaming CSV exports
+EXPORT_CHUNK_SIZE = 2000
+
+# Notification rules evaluated for every sale and inventory change
+NOTIFICATION_RULES = [
+    'members.rules.HighPurchaseQuantityRule',
+    'members.rules.HighSalesAmountRule',
+    'members.rules.LowInventoryRule',
+]
+
+# Evaluate the rules on a background thread pool after the write commits, False runs them inline
+NOTIFICATION_RULES_ASYNC = os.getenv('NOTIFICATION_RULES_ASYNC', 'true').lower() != 'false'
+
+NOTIFICATION_WORKERS = int(os.getenv('NOTIFICATION_WORKERS', 2))
+
+# Number of unread notifications shown per page
+NOTIFICATIONS_PAGE_SIZE = 50
+
+NOTIFICATIONS_MAX_PAGE_SIZE = 500
+
+# Seconds after a notification is raised during which repeats are only counted on it, even once it is read
+NOTIFICATION_COOLDOWNS = {
+    'high_purchase_quantity': 0,
+    'high_sales_amount': 24 * 60 * 60,
+    'low_inventory': 60 * 60,
+}
+
+# Cache behind members.aggregates and the dashboard analytics: 'locmem' (default, per process), 'file' or 'redis'.
+# The redis backend works with any Redis-compatible server and needs the redis package installed.
+AGGREGATES_CACHE_BACKEND = os.getenv('AGGREGATES_CACHE_BACKEND', 'locmem')
+
+AGGREGATES_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'aggregates',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('AGGREGATES_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache', 'aggregates')),
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('AGGREGATES_CACHE_LOCATION', 'redis://127.0.0.1:6379/1'),
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'aggregates': AGGREGATES_CACHE_BACKENDS[AGGREGATES_CACHE_BACKEND],
+}
+
+# Cache alias used by members.aggregates, and seconds per-item figures stay cached at most
+AGGREGATES_CACHE = 'aggregates'
+
+AGGREGATES_CACHE_TIMEOUT = int(os.getenv('AGGREGATES_CACHE_TIMEOUT', 300))
+
+# Seconds dashboard analytics stay cached, sale writes also clear them
+DASHBOARD_CACHE_TIMEOUT = int(os.getenv('DASHBOARD_CACHE_TIMEOUT', 300))
+
+# Default and largest number of days covered by the dashboard analytics
+DASHBOARD_DAYS = 30
+
+DASHBOARD_MAX_DAYS = 366
+
+# Default and largest number of entries in the top items and members lists
+DASHBOARD_TOP_LIMIT = 10
+
+DASHBOARD_MAX_TOP_LIMIT = 50
+
+# Demand forecasting behind the recommended inventory levels, see members/forecasting.py
+# Model is 'moving_average' or 'exponential_smoothing'
+FORECAST_MODEL = os.getenv('FORECAST_MODEL', 'exponential_smoothing')
+
+# Days of sales history read for every item, ending with yesterday
+FORECAST_HISTORY_DAYS = 730
+
+# Days averaged by the moving average and used for the demand deviation
+FORECAST_WINDOW_DAYS = 28
+
+FORECAST_SMOOTHING_ALPHA = 0.2
+
+# Days between placing an order and receiving it, and between stock reviews
+FORECAST_LEAD_TIME_DAYS = 7
+
+FORECAST_REVIEW_DAYS = 7
+
+# Standard deviations of demand held as safety stock, 1.65 covers about 95% of days
+FORECAST_SERVICE_LEVEL_Z = 1.65
+
+# Number of inventory items forecast together
+FORECAST_BATCH_SIZE = 2000
+
+# Recommended level of new items and of items without sales in the history, as before forecasting
+FORECAST_DEFAULT_LEVEL = 100
+
+# Number of members per INSERT statement when importing members, see members/onboarding.py
+MEMBER_IMPORT_BATCH_SIZE = 1000
+
+# Processes hashing the passwords given to the import_members command, the admin upload never hashes any
+MEMBER_IMPORT_HASH_WORKERS = int(os.getenv('MEMBER_IMPORT_HASH_WORKERS', os.cpu_count() or 1))
+
+# Default and largest number of names suggested per kind by the search typeahead, see members/search.py
+SEARCH_SUGGESTION_LIMIT = 10
+
+SEARCH_MAX_SUGGESTION_LIMIT = 50
+
+# Bulk sale actions matching more sales than this run in the background, see members/bulk.py
+BULK_SALE_ACTION_SYNC_LIMIT = int(os.getenv('BULK_SALE_ACTION_SYNC_LIMIT', 20000))
+
+# Run background bulk sale actions on a worker thread after the request commits, False runs them inline
+BULK_SALE_ACTIONS_ASYNC = os.getenv('BULK_SALE_ACTIONS_ASYNC', 'true').lower() != 'false'
+
+# Per-view wall time, query count and SQL time, served in the Prometheus text format at /metrics/
+REQUEST_METRICS_ENABLED = os.getenv('REQUEST_METRICS_ENABLED', 'true').lower() != 'false'
+
+# Requests running more queries than this are logged as possible N+1 queries
+REQUEST_QUERY_BUDGET = int(os.getenv('REQUEST_QUERY_BUDGET', 30))
+
+# Bearer token that lets a scraper read /metrics/ without logging in, superusers can always read it
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
 LOGOUT_REDIRECT_URL = '/'
 
 if os.getenv('DJANGO_ENV') == 'production':
@@ -17,6 +17,9 @@ urlpatterns = [
         # URL pattern for user registration page, mapped to register view in members app
         path('register/', member_views.register, name='register'),
         
+        # URL pattern for imported members choosing a password from their invite link
+        path('invite/<uidb64>/<token>/', member_views.accept_invite, name='accept_invite'),
+
         # URL pattern for user profile page, mapped to profile view in members app
         path('profile/', member_views.profile, name='profile'),
 
@@ -42,11 +45,31 @@ urlpatterns = [
         # URL pattern for accessing dashboard, mapped to dashboard view
         path('dashboard/', member_views.dashboard, name='dashboard'),
 
+        # URL patterns for the cached sales analytics shown on the dashboard, as JSON
+        path('dashboard/revenue/', member_views.dashboard_revenue, name='dashboard_revenue'),
+
+        path('dashboard/top-items/', member_views.dashboard_top_items, name='dashboard_top_items'),
+
+        path('dashboard/top-members/', member_views.dashboard_top_members, name='dashboard_top_members'),
+
+        path('dashboard/low-stock/', member_views.dashboard_low_stock, name='dashboard_low_stock'),
+
         path('record-sale/', member_views.record_sale, name='record_sale'),
 
         path('sales-history/', member_views.sales_history, name='sales_history'),
 
+        # URL pattern for loading further sales history pages as JSON
+        path('sales-history/more/', member_views.sales_history_more, name='sales_history_more'),
+
         path('sales/update/<int:sale_id>/', member_views.update_sale, name='update_sale'),
+
+        # URL pattern for importing a batch of sales from a CSV/JSON upload or JSON body
+        path('sales/import/', member_views.import_sales, name='import_sales'),
+
+        # URL patterns for deleting or repricing every sale matching a set of filters, and the status of an action
+        path('sales/bulk/', member_views.bulk_sales, name='bulk_sales'),
+
+        path('sales/bulk/<int:action_id>/', member_views.bulk_sale_action, name='bulk_sale_action'),
         
         path('delete-sales/', member_views.delete_sales, name='delete_sales'),
 
@@ -59,12 +82,27 @@ urlpatterns = [
         path('export_sales/', member_views.export_sales_history, name='export_sales_history'),
 
         path('export_inventory/', member_views.export_inventory, name='export_inventory'),
+
+        # URL pattern for a member's statement of transactions and sales as CSV or JSON Lines
+        path('export_statement/', member_views.export_statement, name='export_statement'),
         
         path('notifications/', member_views.notifications, name='notifications'),
 
         path('notifications/read/<int:notification_id>/', member_views.mark_notification_read, name='mark_notification_read'),
 
+        # URL pattern for marking selected or all notifications as read in one request
+        path('notifications/read/', member_views.mark_notifications_read, name='mark_notifications_read'),
+
         path('inventory/recommendations/', member_views.inventory_recommendations, name='inventory_recommendations'),
+
+        # URL pattern for the search box typeahead, item and member names matching ?q= as JSON
+        path('search/suggestions/', member_views.search_suggestions, name='search_suggestions'),
+
+        # URL pattern for the hit and miss counters of the per-item aggregates cache
+        path('inventory/aggregates/stats/', member_views.aggregates_stats, name='aggregates_stats'),
+
+        # URL pattern for the per-view request metrics in the Prometheus text format
+        path('metrics/', member_views.metrics, name='metrics'),
         #  URL patterns for user login with Django login view with custom login template
         path('login/', auth_views.LoginView.as_view(template_name='members/login.html'), name='login'),
 
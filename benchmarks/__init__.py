@@ -0,0 +1,4 @@
+# benchmarks/__init__.py
+#
+# Benchmarks run against a throwaway database, never db.sqlite3. Run them from the project root, e.g.
+#   python -m benchmarks.export_memory --rows 1000000
@@ -0,0 +1,107 @@
+# benchmarks/common.py
+
+import os
+import random
+from contextlib import contextmanager
+from decimal import Decimal
+
+import django
+
+def setup():
+
+    # Configure Django the same way manage.py does
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'GotoGroMRMS.settings')
+    django.setup()
+
+
+@contextmanager
+def throwaway_database(verbosity=0, sqlite_file=None):
+
+    # Create and migrate a separate database like the test runner does, and drop it afterwards.
+    # SQLite test databases live in memory unless a file is given, which journal and locking tests need.
+    from django.db import connection
+    old_name = connection.settings_dict['NAME']
+    if sqlite_file and connection.vendor == 'sqlite':
+        connection.settings_dict['TEST']['NAME'] = sqlite_file
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+def percentile(values, fraction):
+
+    # Nearest-rank percentile of a list of measurements
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+class QueryCounter:
+    """
+    Database execute wrapper that counts the queries run while it is installed, see connection.execute_wrapper().
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def seed_sales(count, items=100, members=10, batch_size=5000, seed=0, days=None, stock=1000):
+    """
+    Adds count sales spread over the given number of inventory items and members, without firing signals.
+    With days, purchase dates are spread over that many days before today instead of all being now.
+    The inventory counters, daily sales rollup and search tables are rebuilt afterwards so views, reports and
+    searches see the new sales, and every item is restocked to have stock left.
+    """
+
+    from datetime import timedelta
+    from io import StringIO
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.db.models import F
+    from django.utils import timezone
+    from members import search
+    from members.models import DailySalesRollup, Inventory, Sale
+
+    now = timezone.now()
+
+    rng = random.Random(seed)
+
+    member_rows = list(User.objects.all()[:members])
+    for index in range(len(member_rows), members):
+        member_rows.append(User.objects.create_user(username=f'bench-member-{index}', first_name='Bench', last_name=str(index)))
+
+    item_rows = list(Inventory.objects.all()[:items])
+    if len(item_rows) < items:
+        Inventory.objects.bulk_create(
+            [Inventory(item_name=f'bench-item-{index}', remaining_quantity=1000) for index in range(len(item_rows), items)]
+        )
+        item_rows = list(Inventory.objects.all()[:items])
+
+    remaining = count
+    while remaining > 0:
+        batch = []
+        for _ in range(min(batch_size, remaining)):
+            quantity = rng.randint(1, 20)
+            price = Decimal(rng.randint(100, 5000)) / 100
+            batch.append(Sale(
+                member=rng.choice(member_rows),
+                item=rng.choice(item_rows),
+                purchase_quantity=quantity,
+                price_per_unit=price,
+                total_price=quantity * price,
+                purchase_date=now - timedelta(seconds=rng.randint(0, days * 86400)) if days else now,
+            ))
+        Sale.objects.bulk_create(batch)
+        remaining -= len(batch)
+
+    call_command('rebuild_inventory_counters', stdout=StringIO())
+    Inventory.objects.update(inventory_amount=F('total_purchase_quantity') + stock, remaining_quantity=stock)
+    DailySalesRollup.rebuild()
+    search.rebuild()
@@ -0,0 +1,159 @@
+# benchmarks/database_profiles.py
+#
+# Concurrent load against each database profile. Worker processes record sales and read the sales history at the
+# same time, as gunicorn workers would, and every request ends the way a real one does, so CONN_MAX_AGE decides
+# whether the connection is reused. Reports latency percentiles, throughput and failed requests
+# (e.g. "database is locked") per profile. Each profile runs in its own process because settings read the
+# environment at startup.
+#
+#   python -m benchmarks.database_profiles --profiles sqlite sqlite-untuned postgres --workers 8 --requests 200
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from benchmarks.common import percentile, setup, seed_sales, throwaway_database
+
+# Environment of each profile, see DATABASE_PROFILE and SQLITE_TUNING in settings
+PROFILES = {
+    'sqlite': {'DATABASE_PROFILE': 'sqlite', 'SQLITE_TUNING': 'true'},
+    'sqlite-untuned': {'DATABASE_PROFILE': 'sqlite', 'SQLITE_TUNING': 'false', 'DATABASE_CONN_MAX_AGE': '0'},
+    'postgres': {'DATABASE_PROFILE': 'postgres'},
+}
+
+
+def worker(index, requests, write_ratio, item_names, username):
+    setup()
+    from django.contrib.auth.models import User
+    from django.db import close_old_connections, connections
+    from django.test import Client
+    from django.urls import reverse
+    from members import rules
+
+    rng = random.Random(index)
+
+    # The test client's default host is not in ALLOWED_HOSTS outside the test runner
+    client = Client(HTTP_HOST='localhost')
+    client.force_login(User.objects.get(username=username))
+    close_old_connections()
+
+    latencies, failures = [], Counter()
+    started = time.time()
+    for _ in range(requests):
+        write = rng.random() < write_ratio
+        request_started = time.perf_counter()
+        failure = None
+        try:
+            if write:
+                response = client.post(reverse('record_sale'), {
+                    'item_name': rng.choice(item_names), 'purchase_quantity': 1, 'price_per_unit': '2.50',
+                })
+            else:
+                response = client.get(reverse('sales_history'))
+            if response.status_code >= 400:
+                failure = f'HTTP {response.status_code}'
+        except Exception as error:
+            failure = f'{type(error).__name__}: {error}'
+        finally:
+
+            # What request_finished does at the end of every real request
+            close_old_connections()
+        latencies.append(time.perf_counter() - request_started)
+        if failure:
+            failures[failure] += 1
+    finished = time.time()
+
+    rules.get_executor().shutdown(wait=True)
+    connections.close_all()
+    return latencies, failures, started, finished
+
+
+def run_load(args):
+    setup()
+    from django.contrib.auth.models import User
+    from django.db import connection, connections
+    from members.models import Inventory
+
+    with tempfile.TemporaryDirectory() as directory, throwaway_database(sqlite_file=os.path.join(directory, 'load.sqlite3')):
+        seed_sales(args.seed_sales, items=args.items, members=args.workers)
+        usernames = list(User.objects.order_by('pk').values_list('username', flat=True)[:args.workers])
+        item_names = list(Inventory.objects.values_list('item_name', flat=True))
+
+        # Worker processes read their settings from the environment, point them at the throwaway database
+        os.environ['SQLITE_PATH' if connection.vendor == 'sqlite' else 'POSTGRES_DB'] = str(connection.settings_dict['NAME'])
+        vendor = connection.vendor
+        connections.close_all()
+
+        with multiprocessing.get_context('spawn').Pool(args.workers) as pool:
+            results = pool.starmap(worker, [
+                (index, args.requests, args.write_ratio, item_names, usernames[index % len(usernames)])
+                for index in range(args.workers)
+            ])
+
+    latencies = [latency for result in results for latency in result[0]]
+    failures = sum((result[1] for result in results), Counter())
+    elapsed = max(result[3] for result in results) - min(result[2] for result in results)
+
+    return {
+        'vendor': vendor,
+        'workers': args.workers,
+        'requests': len(latencies),
+        'write_ratio': args.write_ratio,
+        'seconds': round(elapsed, 3),
+        'throughput_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'failed': sum(failures.values()),
+        'failures': dict(failures.most_common(5)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent sale recording and history reads per database profile.')
+    parser.add_argument('--profiles', nargs='+', default=['sqlite', 'sqlite-untuned'], choices=sorted(PROFILES))
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent worker processes.')
+    parser.add_argument('--requests', type=int, default=100, help='Requests per worker.')
+    parser.add_argument('--write-ratio', type=float, default=0.5, help='Share of requests that record a sale.')
+    parser.add_argument('--items', type=int, default=50, help='Inventory items sales are recorded against.')
+    parser.add_argument('--seed-sales', type=int, default=5000, help='Sales in the database before the run.')
+    parser.add_argument('--output', help='Write the results to this JSON file as well as stdout.')
+    parser.add_argument('--run', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Child process: measure the profile selected by the environment
+    if args.run:
+        print(json.dumps(run_load(args)))
+        return
+
+    options = [
+        '--workers', str(args.workers), '--requests', str(args.requests), '--write-ratio', str(args.write_ratio),
+        '--items', str(args.items), '--seed-sales', str(args.seed_sales),
+    ]
+    results = []
+    for profile in args.profiles:
+        child = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.database_profiles', '--run', *options],
+            env={**os.environ, **PROFILES[profile]}, capture_output=True, text=True,
+        )
+        if child.returncode:
+            error = (child.stderr.strip().splitlines() or ['failed'])[-1]
+            results.append({'profile': profile, 'error': error})
+        else:
+            results.append({'profile': profile, **json.loads(child.stdout.strip().splitlines()[-1])})
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# benchmarks/delete_sales.py
+#
+# Times deleting a large selection of sales, and checks the inventory counters match the sales left afterwards.
+# With --by filters the sales older than half the seeded days are repriced and then deleted through the bulk
+# actions of members/bulk.py instead of being selected by id.
+#
+#   python -m benchmarks.delete_sales --sales 200000 --delete 100000
+#   python -m benchmarks.delete_sales --sales 200000 --by filters
+
+import argparse
+import json
+import time
+
+from benchmarks.common import QueryCounter, setup, seed_sales, throwaway_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Duration of deleting many sales at once.')
+    parser.add_argument('--sales', type=int, default=200000, help='Number of sales seeded.')
+    parser.add_argument('--delete', type=int, default=100000, help='Number of those sales deleted in one request.')
+    parser.add_argument('--items', type=int, default=500, help='Number of inventory items.')
+    parser.add_argument('--days', type=int, default=365, help='Days the seeded sales are spread over.')
+    parser.add_argument('--by', choices=['ids', 'filters'], default='ids', help='Select the sales by id or by a date filter.')
+    parser.add_argument('--output', help='Write the results to this JSON file as well as stdout.')
+    args = parser.parse_args()
+
+    setup()
+    from django.contrib.auth.models import User
+    from datetime import timedelta
+    from django.db.models import Count, Sum
+    from django.utils import timezone
+    from members import bulk
+    from members.forms import BulkSaleActionForm
+    from members.ingest import delete_sales
+    from members.models import DailySalesRollup, Inventory, Sale
+
+    with throwaway_database() as connection:
+        admin = User.objects.create_superuser(username='bench-admin', password=None)
+        seed_sales(args.sales, items=args.items, days=args.days)
+
+        results = {'sales': args.sales}
+        queries = QueryCounter()
+        with connection.execute_wrapper(queries):
+            if args.by == 'filters':
+                cutoff = (timezone.localdate() - timedelta(days=args.days // 2)).isoformat()
+                for action in ('reprice', 'delete'):
+                    form = BulkSaleActionForm({'action': action, 'price': '3.00', 'end_date': cutoff})
+                    form.is_valid()
+                    sales = bulk.matching_sales(form, admin)
+                    started = time.perf_counter()
+                    affected = bulk.reprice(sales, form.cleaned_data['price']) if action == 'reprice' else bulk.delete(sales)
+                    results[f'{action}d' if action == 'delete' else 'repriced'] = affected
+                    results[f'{action}_seconds'] = round(time.perf_counter() - started, 3)
+            else:
+                sale_ids = list(Sale.objects.order_by('?').values_list('pk', flat=True)[:args.delete])
+                started = time.perf_counter()
+                results['deleted'] = delete_sales(sale_ids, admin)
+                results['seconds'] = round(time.perf_counter() - started, 3)
+
+        # Counters kept by the deletion must equal totals grouped from the sales that are left
+        totals = {
+            row['item_id']: (row['count'], row['quantity'], round(row['amount'], 2))
+            for row in Sale.objects.order_by().values('item_id').annotate(
+                count=Count('id'), quantity=Sum('purchase_quantity'), amount=Sum('total_price')
+            )
+        }
+        mismatched = sum(
+            1 for pk, sale_count, quantity, amount in Inventory.objects.values_list('pk', 'sale_count', 'total_purchase_quantity', 'total_sales_amount')
+            if (sale_count, quantity, round(amount, 2)) != totals.get(pk, (0, 0, 0))
+        )
+        rollup_quantity = DailySalesRollup.objects.aggregate(total=Sum('quantity'))['total'] or 0
+        sale_quantity = Sale.objects.aggregate(total=Sum('purchase_quantity'))['total'] or 0
+
+        results.update({
+            'queries': queries.count,
+            'mismatched_items': mismatched,
+            'rollup_matches': rollup_quantity == sale_quantity,
+        })
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# benchmarks/export_memory.py
+#
+# Measures peak Python memory while streaming the CSV exports at growing table sizes.
+# A flat peak across sizes shows the export does not hold the result set in memory.
+#
+#   python -m benchmarks.export_memory --rows 1000000 --steps 4
+
+import argparse
+import json
+import time
+import tracemalloc
+
+from benchmarks.common import setup, seed_sales, throwaway_database
+
+
+def consume(view, request):
+
+    # Read the streamed body chunk by chunk, as a WSGI server would
+    size = 0
+    for chunk in view(request).streaming_content:
+        size += len(chunk)
+    return size
+
+
+def measure(view, user, **params):
+    from django.test import RequestFactory
+
+    request = RequestFactory().get('/export/', params)
+    request.user = user
+
+    # Timing is taken without tracemalloc, which slows allocation heavy code down considerably
+    started = time.perf_counter()
+    size = consume(view, request)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    consume(view, request)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'seconds': round(elapsed, 3), 'peak_bytes': peak, 'response_bytes': size}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Peak memory of the streaming CSV exports.')
+    parser.add_argument('--rows', type=int, default=200000, help='Number of sales at the last step.')
+    parser.add_argument('--steps', type=int, default=4, help='Number of table sizes measured up to --rows.')
+    parser.add_argument('--output', help='Write the results to this JSON file as well as stdout.')
+    args = parser.parse_args()
+
+    setup()
+    from django.contrib.auth.models import User
+    from members.views import export_inventory, export_sales_history, export_statement
+
+    results = []
+    with throwaway_database():
+        admin = User.objects.create_superuser(username='bench-admin', password='bench-password')
+
+        seeded = 0
+        for step in range(1, args.steps + 1):
+            rows = args.rows * step // args.steps
+            seed_sales(rows - seeded)
+            seeded = rows
+
+            for name, view, params in [
+                ('sales_csv', export_sales_history, {}),
+                ('sales_csv_gzip', export_sales_history, {'gzip': '1'}),
+                ('inventory_csv', export_inventory, {}),
+
+                # The admin is one of the seeded members, so holds about a tenth of the sales
+                ('statement_jsonl', export_statement, {'file_format': 'jsonl'}),
+            ]:
+                result = {'export': name, 'rows': rows, **measure(view, admin, **params)}
+                results.append(result)
+                print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# benchmarks/forecasting.py
+#
+# Times the nightly forecast refresh over many inventory items with years of sales history.
+#
+#   python -m benchmarks.forecasting --items 10000 --sales 2000000 --days 730
+
+import argparse
+import json
+import time
+
+from benchmarks.common import QueryCounter, setup, seed_sales, throwaway_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Duration of refreshing every demand forecast.')
+    parser.add_argument('--items', type=int, default=10000, help='Number of inventory items.')
+    parser.add_argument('--sales', type=int, default=2000000, help='Number of sales spread over the items.')
+    parser.add_argument('--days', type=int, default=730, help='Days of history the sales are spread over.')
+    parser.add_argument('--output', help='Write the results to this JSON file as well as stdout.')
+    args = parser.parse_args()
+
+    setup()
+    from members.forecasting import MODELS, refresh_forecasts
+
+    results = []
+    with throwaway_database() as connection:
+        started = time.perf_counter()
+        seed_sales(args.sales, items=args.items, days=args.days)
+        seeded = time.perf_counter() - started
+
+        for model in MODELS:
+            queries = QueryCounter()
+            with connection.execute_wrapper(queries):
+                started = time.perf_counter()
+                count = refresh_forecasts(model=model)
+                elapsed = time.perf_counter() - started
+            results.append({
+                'model': model,
+                'items': count,
+                'sales': args.sales,
+                'days': args.days,
+                'seconds': round(elapsed, 3),
+                'queries': queries.count,
+            })
+
+    report = {'seed_seconds': round(seeded, 3), 'results': results}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
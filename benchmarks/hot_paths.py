@@ -0,0 +1,251 @@
+# benchmarks/hot_paths.py
+#
+# Scripted load on the sales hot paths. Each worker process plays a mix of weighted tasks: recording sales,
+# reading the sales history and inventory pages, and downloading both CSV exports.
+# Reports latency percentiles, throughput and queries per request for every task, as JSON that can be kept and
+# compared with a later run. Seeds a throwaway database unless --database points at one from benchmarks.seed_data,
+# which is copied first so the run does not change it.
+#
+#   python -m benchmarks.hot_paths --workers 4 --requests 200 --output before.json
+#   python -m benchmarks.hot_paths --workers 4 --requests 200 --compare before.json
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from benchmarks.common import QueryCounter, percentile, setup, seed_sales, throwaway_database
+
+ADMIN_USERNAME = 'bench-admin'
+
+
+def record_sale(client, rng, item_names):
+    from django.urls import reverse
+    return client.post(reverse('record_sale'), {
+        'item_name': rng.choice(item_names), 'purchase_quantity': rng.randint(1, 3), 'price_per_unit': '2.50',
+    })
+
+
+def get(url_name):
+    def task(client, rng, item_names):
+        from django.urls import reverse
+        response = client.get(reverse(url_name))
+
+        # Streamed bodies are read to the end, their queries run while they are sent
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response
+    return task
+
+
+# Task name: (relative weight, user, task), members record sales and read their history, staff do the rest
+TASKS = {
+    'record_sale': (5, 'member', record_sale),
+    'sales_history': (4, 'member', get('sales_history')),
+    'inventory_list': (3, 'staff', get('inventory_list')),
+    'inventory_recommendations': (1, 'staff', get('inventory_recommendations')),
+    'export_sales_history': (1, 'staff', get('export_sales_history')),
+    'export_inventory': (1, 'staff', get('export_inventory')),
+}
+
+
+def worker(index, requests, seed, tasks, item_names, member_username):
+    setup()
+    from django.contrib.auth.models import User
+    from django.db import close_old_connections, connection, connections
+    from django.test import Client
+    from members import rules
+
+
+    # The test client's default host is not in ALLOWED_HOSTS outside the test runner
+    clients = {'member': Client(HTTP_HOST='localhost'), 'staff': Client(HTTP_HOST='localhost')}
+    clients['member'].force_login(User.objects.get(username=member_username))
+    clients['staff'].force_login(User.objects.get(username=ADMIN_USERNAME))
+    close_old_connections()
+
+    rng = random.Random(seed * 1000 + index)
+    names = list(tasks)
+    weights = [TASKS[name][0] for name in names]
+
+    latencies, queries, failures = defaultdict(list), defaultdict(list), defaultdict(Counter)
+    started = time.time()
+    for _ in range(requests):
+        name = rng.choices(names, weights)[0]
+        _, user, task = TASKS[name]
+        counter = QueryCounter()
+        request_started = time.perf_counter()
+        failure = None
+        try:
+            with connection.execute_wrapper(counter):
+                response = task(clients[user], rng, item_names)
+            if response.status_code >= 400:
+                failure = f'HTTP {response.status_code}'
+        except Exception as error:
+            failure = f'{type(error).__name__}: {error}'
+        finally:
+            close_old_connections()
+        latencies[name].append(time.perf_counter() - request_started)
+        queries[name].append(counter.count)
+        if failure:
+            failures[name][failure] += 1
+    finished = time.time()
+
+    rules.get_executor().shutdown(wait=True)
+    connections.close_all()
+    return dict(latencies), dict(queries), dict(failures), started, finished
+
+
+def summarize(latencies, queries, failures, seconds):
+    return {
+        'requests': len(latencies),
+        'throughput_per_second': round(len(latencies) / seconds, 1) if seconds else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'queries_median': percentile(queries, 0.50),
+        'queries_max': max(queries, default=0),
+        'failed': sum(failures.values()),
+        'failures': dict(failures.most_common(5)),
+    }
+
+
+@contextmanager
+def benchmark_database(args, directory):
+
+    # The database the workers use, a copy of --database or a throwaway one seeded from the options
+    if args.database:
+        copy = os.path.join(directory, 'load.sqlite3')
+        shutil.copyfile(args.database, copy)
+        os.environ['DATABASE_PROFILE'] = 'sqlite'
+        os.environ['SQLITE_PATH'] = copy
+        setup()
+        from django.core.management import call_command
+        call_command('migrate', verbosity=0)
+        yield
+        return
+
+    setup()
+    with throwaway_database(sqlite_file=os.path.join(directory, 'load.sqlite3')):
+        seed_sales(args.sales, items=args.items, members=args.members, seed=args.seed, days=args.days)
+        yield
+
+
+def run(args):
+    with tempfile.TemporaryDirectory() as directory:
+        with benchmark_database(args, directory):
+            from django.contrib.auth.models import User
+            from django.db import connection, connections
+            from members.models import Inventory, Sale
+
+            if not User.objects.filter(username=ADMIN_USERNAME).exists():
+                User.objects.create_superuser(username=ADMIN_USERNAME, password=None)
+            members = list(User.objects.filter(is_superuser=False).order_by('pk').values_list('username', flat=True)[:args.workers])
+            item_names = list(Inventory.objects.order_by('pk').values_list('item_name', flat=True))
+            dataset = {
+                'members': User.objects.filter(is_superuser=False).count(),
+                'items': len(item_names),
+                'sales': Sale.objects.count(),
+            }
+
+            # Worker processes read their settings from the environment, point them at the benchmark database
+            os.environ['SQLITE_PATH' if connection.vendor == 'sqlite' else 'POSTGRES_DB'] = str(connection.settings_dict['NAME'])
+            vendor = connection.vendor
+            connections.close_all()
+
+            jobs = [
+                (index, args.requests, args.seed, args.tasks, item_names, members[index % len(members)])
+                for index in range(args.workers)
+            ]
+            with multiprocessing.get_context('spawn').Pool(args.workers) as pool:
+                results = pool.starmap(worker, jobs)
+
+    seconds = max(result[4] for result in results) - min(result[3] for result in results)
+    tasks = {}
+    for name in args.tasks:
+        latencies = [latency for result in results for latency in result[0].get(name, [])]
+        queries = [count for result in results for count in result[1].get(name, [])]
+        failures = sum((result[2].get(name, Counter()) for result in results), Counter())
+        tasks[name] = summarize(latencies, queries, failures, seconds)
+
+    return {
+        'commit': _commit(),
+        'vendor': vendor,
+        'dataset': dataset,
+        'workers': args.workers,
+        'seconds': round(seconds, 3),
+        'total': summarize(
+            [latency for result in results for values in result[0].values() for latency in values],
+            [count for result in results for values in result[1].values() for count in values],
+            sum((failures for result in results for failures in result[2].values()), Counter()),
+            seconds,
+        ),
+        'tasks': tasks,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns lines describing every task whose p95 latency or median query count grew by more than the tolerance
+    compared with a baseline run.
+    """
+
+    regressions = []
+    for name, current in results['tasks'].items():
+        previous = baseline.get('tasks', {}).get(name)
+        if not previous or not current['requests']:
+            continue
+        for metric in ('p95_ms', 'queries_median'):
+            if current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f'{name} {metric}: {previous[metric]} -> {current[metric]}')
+    return regressions
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latency, throughput and query counts of the sales hot paths.')
+    parser.add_argument('--database', help='SQLite file from benchmarks.seed_data to run against, instead of seeding one.')
+    parser.add_argument('--members', type=int, default=20, help='Members seeded when no --database is given.')
+    parser.add_argument('--items', type=int, default=200, help='Inventory items seeded when no --database is given.')
+    parser.add_argument('--sales', type=int, default=20000, help='Sales seeded when no --database is given.')
+    parser.add_argument('--days', type=int, default=90, help='Days the seeded sales are spread over.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the seeded data and the task mix.')
+    parser.add_argument('--workers', type=int, default=4, help='Concurrent worker processes.')
+    parser.add_argument('--requests', type=int, default=100, help='Requests per worker.')
+    parser.add_argument('--tasks', nargs='+', default=list(TASKS), choices=list(TASKS), help='Tasks in the mix.')
+    parser.add_argument('--output', help='Write the results to this JSON file as well as stdout.')
+    parser.add_argument('--compare', help='Results JSON of an earlier run, regressions make the exit status 1.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed growth before --compare reports a regression.')
+    args = parser.parse_args()
+
+    results = run(args)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for line in regressions:
+            print(f'Regression: {line}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# benchmarks/search.py
+#
+# Latency of the search typeahead and of sales history pages filtered by a search, over a throwaway database of
+# inventory items with generated product names, members and sales. Typeahead queries are the first letters of
+# one or two words of a random item name, the way they arrive while someone types.
+#
+#   python -m benchmarks.search --items 50000 --sales 1000000 --queries 500
+
+import argparse
+import json
+import random
+import time
+from unittest import mock
+
+from benchmarks.common import QueryCounter, percentile, setup, seed_sales, throwaway_database
+
+WORDS = (
+    'apple banana butter cheddar chicken chilli chocolate coconut coffee cookie cream crisp garlic ginger grape '
+    'green honey lemon lime mango milk mint noodle oat olive onion orange peach peanut pepper plain potato '
+    'raspberry rice salted sesame smoked soda sour spicy strawberry sugar tea toast tomato vanilla wheat yogurt'
+).split()
+
+SIZES = ('small', 'medium', 'large', '250g', '500g', '1kg', '6 pack', '12 pack')
+
+
+def item_names(count, rng):
+
+    # Distinct names of two or three product words and a size, e.g. "Spicy Peanut Noodle 500g"
+    names = set()
+    while len(names) < count:
+        words = rng.sample(WORDS, rng.randint(2, 3))
+        names.add(' '.join(word.title() for word in words) + f' {rng.choice(SIZES)} {len(names)}')
+    return sorted(names)
+
+
+def typeahead_queries(names, count, rng):
+    queries = []
+    for _ in range(count):
+        words = rng.choice(names).split()[:2]
+        typed = [words[0][:rng.randint(2, len(words[0]))]]
+        if rng.random() < 0.5:
+            typed.append(words[1][:rng.randint(1, len(words[1]))])
+        queries.append(' '.join(typed))
+    return queries
+
+
+def measure(call, queries):
+    latencies, counter = [], QueryCounter()
+    from django.db import connection
+    with connection.execute_wrapper(counter):
+        for query in queries:
+            started = time.perf_counter()
+            call(query)
+            latencies.append(time.perf_counter() - started)
+    return {
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'queries_per_call': round(counter.count / len(queries), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latency of the search typeahead and of searched sales history pages.')
+    parser.add_argument('--items', type=int, default=50000, help='Number of inventory items.')
+    parser.add_argument('--members', type=int, default=1000, help='Number of members.')
+    parser.add_argument('--sales', type=int, default=1000000, help='Number of sales.')
+    parser.add_argument('--queries', type=int, default=500, help='Typeahead queries timed per path.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+    parser.add_argument('--output', help='Write the results to this JSON file as well as stdout.')
+    args = parser.parse_args()
+
+    setup()
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from django.urls import reverse
+    from members import search
+    from members.models import Inventory
+
+    rng = random.Random(args.seed)
+    with throwaway_database():
+        names = item_names(args.items, rng)
+        Inventory.objects.bulk_create([Inventory(item_name=name) for name in names], batch_size=5000)
+        started = time.perf_counter()
+        seed_sales(args.sales, items=args.items, members=args.members, seed=args.seed, days=365)
+        seeded = time.perf_counter() - started
+
+        admin = User.objects.create_superuser(username='bench-admin', password=None)
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(admin)
+        queries = typeahead_queries(names, args.queries, rng)
+
+        def endpoint(query):
+            client.get(reverse('search_suggestions'), {'q': query})
+
+        def sales_page(query):
+            client.get(reverse('sales_history'), {'q': query})
+
+        results = {
+            'items': args.items,
+            'members': args.members,
+            'sales': args.sales,
+            'seed_seconds': round(seeded, 1),
+            'fts': search.uses_fts(),
+            'suggest_items': measure(lambda query: search.suggest_items(query, 10), queries),
+            'suggestions_endpoint': measure(endpoint, queries),
+            'sales_history_search': measure(sales_page, queries[:max(1, args.queries // 10)]),
+        }
+
+        # The same typeahead with the LIKE queries used where FTS5 is missing, for comparison
+        with mock.patch('members.search.uses_fts', return_value=False):
+            results['suggest_items_like'] = measure(lambda query: search.suggest_items(query, 10), queries[:max(1, args.queries // 10)])
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
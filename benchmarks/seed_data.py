@@ -0,0 +1,52 @@
+# benchmarks/seed_data.py
+#
+# Generates a reproducible dataset into a new SQLite file: members, inventory items and sales spread over the
+# last days. The same options and seed always produce the same data, so load runs on different commits compare.
+#
+#   python -m benchmarks.seed_data bench.sqlite3 --members 200 --items 1000 --sales 200000 --days 365
+#   python -m benchmarks.hot_paths --database bench.sqlite3
+
+import argparse
+import json
+import os
+import time
+
+from benchmarks.common import setup, seed_sales
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed a benchmark database with members, inventory items and sales.')
+    parser.add_argument('database', help='SQLite file to create, it must not exist yet.')
+    parser.add_argument('--members', type=int, default=100, help='Number of members.')
+    parser.add_argument('--items', type=int, default=500, help='Number of inventory items (SKUs).')
+    parser.add_argument('--sales', type=int, default=100000, help='Number of sales.')
+    parser.add_argument('--days', type=int, default=365, help='Days before today the sales are spread over.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+    args = parser.parse_args()
+
+    if os.path.exists(args.database):
+        parser.error(f'{args.database} already exists.')
+
+    # Settings read the database path from the environment when Django is set up
+    os.environ['DATABASE_PROFILE'] = 'sqlite'
+    os.environ['SQLITE_PATH'] = os.path.abspath(args.database)
+    setup()
+    from django.core.management import call_command
+
+    started = time.perf_counter()
+    call_command('migrate', verbosity=0)
+    seed_sales(args.sales, items=args.items, members=args.members, seed=args.seed, days=args.days)
+
+    print(json.dumps({
+        'database': args.database,
+        'members': args.members,
+        'items': args.items,
+        'sales': args.sales,
+        'days': args.days,
+        'seed': args.seed,
+        'seconds': round(time.perf_counter() - started, 3),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,89 @@
 from django.contrib import admin
-from .models import Profile, Transaction
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db.models import Q
+from django.template.response import TemplateResponse
+from django.urls import path
+from .exports import csv_lines, streaming_download
+from .models import Inventory, Profile, Sale, Transaction
+from . import onboarding, search
 
 # Register your models here.
-admin.site.register(Profile)
+@admin.register(Profile)
+class ProfileAdmin(admin.ModelAdmin):
+
+    # The change list links to a CSV upload that imports members in bulk
+    change_list_template = 'admin/members/profile/change_list.html'
+
+    search_fields = ['user__username', 'first_name', 'last_name']
+
+    def get_search_results(self, request, queryset, search_term):
+
+        # Names are looked up in the search tables of members.search instead of a LIKE over every row
+        if not search.words(search_term):
+            return queryset, False
+        return queryset.filter(user__in=search.member_ids(search_term)), False
+
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_members_view), name='members_profile_import'),
+        ] + super().get_urls()
+
+    def import_members_view(self, request):
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+
+        errors = []
+        if request.method == 'POST' and request.FILES.get('file'):
+            try:
+                # Passwords are not hashed in the request, every member chooses one through an invite instead
+                users = onboarding.import_members(onboarding.read_members(request.FILES['file']), passwords=False)
+            except ValidationError as error:
+                errors = error.messages
+            else:
+                # The invite links are downloaded straight away
+                rows = onboarding.invite_rows(users, request.build_absolute_uri('/'))
+                return streaming_download(csv_lines(['Username', 'Email', 'Invite Link'], rows), 'member_invites.csv', 'text/csv')
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Import members',
+            'errors': errors,
+            'columns': ', '.join((*onboarding.USER_FIELDS, *onboarding.PROFILE_FIELDS)),
+        }
+        return TemplateResponse(request, 'admin/members/profile/import_members.html', context)
+
+
 admin.site.register(Transaction)
+
+
+@admin.register(Inventory)
+class InventoryAdmin(admin.ModelAdmin):
+    list_display = ('item_name', 'inventory_amount', 'remaining_quantity', 'sale_count')
+    search_fields = ['item_name']
+
+    # Counters are kept by the sale signal handlers
+    readonly_fields = ('remaining_quantity', *Inventory.COUNTER_FIELDS)
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search.words(search_term):
+            return queryset, False
+        return queryset.filter(pk__in=search.item_ids(search_term)), False
+
+
+@admin.register(Sale)
+class SaleAdmin(admin.ModelAdmin):
+    list_display = ('purchase_date', 'item', 'member', 'purchase_quantity', 'price_per_unit', 'total_price')
+    list_select_related = ('item', 'member')
+    search_fields = ['item__item_name', 'member__username']
+    raw_id_fields = ('item', 'member')
+
+    # Counting every sale again for each page is slow on a large table
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+
+        # Sales of the matching items and members, found through Sale's item and member indexes
+        if not search.words(search_term):
+            return queryset, False
+        return queryset.filter(Q(item_id__in=search.item_ids(search_term)) | Q(member_id__in=search.member_ids(search_term))), False
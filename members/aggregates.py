@@ -0,0 +1,106 @@
+# members/aggregates.py
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from .models import Inventory, Sale
+from .utils import chunks
+
+# Per-item sale figures served from the cache named by AGGREGATES_CACHE, see CACHES in settings.
+# Entries are dropped by the Sale and Inventory signal handlers in members/signals.py once writes commit,
+# and expire after AGGREGATES_CACHE_TIMEOUT seconds in any case.
+
+HITS_KEY = 'aggregates:hits'
+MISSES_KEY = 'aggregates:misses'
+
+def get_cache():
+    return caches[settings.AGGREGATES_CACHE]
+
+
+def item_key(item_id):
+    return f'aggregates:item:{item_id}'
+
+
+def compute_items(item_ids):
+    """
+    Calculates the figures of the given items from their counters and latest sale, one query per batch of ids.
+    """
+
+    latest_price = Sale.objects.filter(item=OuterRef('pk')).order_by('-purchase_date', '-id').values('price_per_unit')[:1]
+
+    figures = {}
+    for batch in chunks(item_ids):
+        rows = Inventory.objects.filter(pk__in=batch).annotate(latest_price=Subquery(latest_price)).values_list(
+            'pk', 'sale_count', 'total_purchase_quantity', 'total_sales_amount', 'latest_price'
+        )
+        for item_id, sale_count, total_sold, total_sales_amount, latest in rows:
+            figures[item_id] = {
+                'sale_count': sale_count,
+                'total_sold': total_sold,
+                'total_sales_amount': total_sales_amount,
+                'latest_price': latest,
+                'average_quantity': total_sold / sale_count if sale_count else 0,
+            }
+    return figures
+
+
+def get_items(item_ids):
+    """
+    Returns {item_id: figures} for the given items, cached figures are used and only the misses are calculated.
+    """
+
+    item_ids = list(item_ids)
+    cache = get_cache()
+    cached = cache.get_many([item_key(item_id) for item_id in item_ids])
+
+    figures = {item_id: cached[item_key(item_id)] for item_id in item_ids if item_key(item_id) in cached}
+    missing = [item_id for item_id in item_ids if item_id not in figures]
+    if missing:
+        computed = compute_items(missing)
+        cache.set_many({item_key(item_id): values for item_id, values in computed.items()}, timeout=settings.AGGREGATES_CACHE_TIMEOUT)
+        figures.update(computed)
+
+    _count(HITS_KEY, len(item_ids) - len(missing))
+    _count(MISSES_KEY, len(missing))
+    return figures
+
+
+def invalidate(item_ids):
+    get_cache().delete_many([item_key(item_id) for item_id in item_ids])
+
+
+def invalidate_on_commit(item_ids):
+
+    # Dropping the entries before the write commits would let another request cache the old figures again
+    item_ids = set(item_ids)
+    transaction.on_commit(lambda: invalidate(item_ids))
+
+
+def _count(key, amount):
+
+    # Counters live in the cache itself so every worker sharing the cache reports together
+    if not amount:
+        return
+    cache = get_cache()
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        if not cache.add(key, amount, timeout=None):
+            cache.incr(key, amount)
+
+
+def stats():
+    """
+    Hit and miss counts of the per-item lookups since the cache was last cleared.
+    """
+
+    cache = get_cache()
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    return {
+        'backend': f'{type(cache).__module__}.{type(cache).__name__}',
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None,
+    }
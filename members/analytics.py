@@ -0,0 +1,132 @@
+# members/analytics.py
+
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+from .aggregates import get_cache
+from .models import DailySalesRollup, Inventory
+from .rules import LowInventoryRule
+
+# Dashboard figures are grouped from the daily sales rollup and kept in the aggregates cache until the timeout
+# or the next sale write.
+# Every cache key includes a version number, bumping it invalidates all cached figures at once.
+VERSION_KEY = 'dashboard:version'
+
+def get_version():
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def invalidate():
+    """
+    Drops every cached dashboard figure, called once the transaction that wrote sales commits.
+    """
+
+    cache = get_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, 1, timeout=None)
+
+
+def invalidate_on_commit():
+    transaction.on_commit(invalidate)
+
+
+def cached(name, compute, *params):
+
+    # Figures are stored per name and parameters under the current version
+    key = ':'.join(['dashboard', str(get_version()), name, *map(str, params)])
+    return get_cache().get_or_set(key, compute, timeout=settings.DASHBOARD_CACHE_TIMEOUT)
+
+
+def _since(days):
+    return timezone.localdate() - timedelta(days=days - 1)
+
+
+def _money(value):
+
+    # Sums come back with the backend's own precision, amounts are always shown with two decimals
+    return Decimal(value or 0).quantize(Decimal('0.01'))
+
+
+def _with_money(rows):
+    return [{**row, 'revenue': _money(row['revenue'])} for row in rows]
+
+
+def revenue_over_time(days):
+    """
+    Revenue, units and number of sales per day for the last days, including days without sales.
+    """
+
+    def compute():
+        start = _since(days)
+        totals = {
+            row['date']: row for row in DailySalesRollup.objects.filter(date__gte=start).order_by().values('date').annotate(
+                revenue=Sum('revenue'),
+                quantity=Sum('quantity'),
+                sales=Sum('sale_count'),
+            )
+        }
+        series = []
+        for offset in range(days):
+            date = start + timedelta(days=offset)
+            row = totals.get(date, {})
+            series.append({'date': date, 'revenue': _money(row.get('revenue')), 'quantity': row.get('quantity') or 0, 'sales': row.get('sales') or 0})
+        return series
+
+    return cached('revenue', compute, days)
+
+
+def top_items(days, limit):
+    """
+    Items with the highest revenue over the last days.
+    """
+
+    def compute():
+        return _with_money(DailySalesRollup.objects.filter(date__gte=_since(days)).order_by().values(
+            'item_id', item_name=F('item__item_name')
+        ).annotate(
+            revenue=Sum('revenue'),
+            quantity=Sum('quantity'),
+        ).order_by('-revenue', 'item_id')[:limit])
+
+    return cached('top_items', compute, days, limit)
+
+
+def top_members(days, limit):
+    """
+    Members with the highest spending over the last days.
+    """
+
+    def compute():
+        return _with_money(DailySalesRollup.objects.filter(date__gte=_since(days)).order_by().values(
+            'member_id', username=F('member__username')
+        ).annotate(
+            revenue=Sum('revenue'),
+            sales=Sum('sale_count'),
+        ).order_by('-revenue', 'member_id')[:limit])
+
+    return cached('top_members', compute, days, limit)
+
+
+def low_stock():
+    """
+    Number of items at or below the low inventory threshold, and below their recommended level.
+    """
+
+    def compute():
+        return Inventory.objects.aggregate(
+            items=Count('pk'),
+            low=Count('pk', filter=Q(remaining_quantity__lte=LowInventoryRule.threshold)),
+            below_recommended=Count('pk', filter=Q(remaining_quantity__lt=F('recommended_inventory_levels'))),
+        ) | {'threshold': LowInventoryRule.threshold}
+
+    return cached('low_stock', compute)
@@ -0,0 +1,231 @@
+# members/bulk.py
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from functools import lru_cache
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import TruncDate
+from django.urls import reverse
+from django.utils import timezone
+from .forms import BulkSaleActionForm
+from .ingest import delete_with_totals
+from .models import BulkSaleAction, DailySalesRollup, Inventory, Sale
+from . import aggregates, analytics
+
+logger = logging.getLogger(__name__)
+
+# Deletes and reprices of every sale matching a BulkSaleActionForm, each written as a single DELETE or UPDATE.
+# Counters, stock and daily totals are adjusted from GROUP BY queries over the matching sales taken before the
+# write, so an action costs one update per item and day touched instead of one per sale.
+
+def matching_sales(form, user):
+    """
+    Sales matching a valid BulkSaleActionForm that the user may change, members only match their own sales.
+    """
+
+    sales = Sale.objects.all() if user.is_superuser else Sale.objects.filter(member=user)
+    return form.filter_sales(sales)
+
+
+def summarize(sales, price=None):
+    """
+    Number of matching sales with their units, amount and items, and the amount they would have at a new price.
+    """
+
+    summary = sales.aggregate(
+        matched=Count('id'),
+        quantity=Sum('purchase_quantity'),
+        amount=Sum('total_price'),
+        items=Count('item', distinct=True),
+    )
+    summary['quantity'] = summary['quantity'] or 0
+    summary['amount'] = _cents(summary['amount'])
+    if price is not None:
+        summary['repriced_amount'] = summary['quantity'] * price
+    return summary
+
+
+def delete(sales):
+    """
+    Deletes the matching sales in one statement and restores stock, counters and daily totals, returns the count.
+    """
+
+    with transaction.atomic():
+        sales = _lock(sales)
+        per_item = _per_item(sales)
+        per_day = _per_day(sales)
+
+        deleted = delete_with_totals([sales], [row[:4] for row in per_item], per_day)
+
+    return deleted
+
+
+def reprice(sales, price):
+    """
+    Sets a new price per unit on the matching sales in one statement and moves the sales amounts of their items and
+    days by the difference, returns the number of sales repriced.
+    """
+
+    with transaction.atomic():
+        sales = _lock(sales)
+        per_item = _per_item(sales)
+
+        # The new total of the largest sale must still fit the column
+        largest = max((row[4] for row in per_item), default=0)
+        Sale._meta.get_field('total_price').clean(largest * price, None)
+
+        per_day = _per_day(sales)
+        repriced = sales.update(price_per_unit=price, total_price=F('purchase_quantity') * price)
+
+        for item_id, quantity, amount, count, _ in per_item:
+            Inventory.apply_sale_delta(item_id, 0, quantity * price - amount, 0)
+        DailySalesRollup.apply_sales(
+            (item_id, member_id, day, 0, quantity * price - revenue, 0) for item_id, member_id, day, quantity, revenue, count in per_day
+        )
+
+        analytics.invalidate_on_commit()
+        aggregates.invalidate_on_commit(row[0] for row in per_item)
+
+    return repriced
+
+
+def _lock(sales):
+
+    # Every sale write locks its item first, so locking the matching items in id order holds their sales still until
+    # the action commits, and the id bound leaves out sales recorded meanwhile for other items
+    list(Inventory.objects.select_for_update().filter(pk__in=sales.values('item_id')).order_by('pk').values_list('pk', flat=True))
+    last = Sale.objects.order_by('-pk').values_list('pk', flat=True).first()
+    return sales.filter(pk__lte=last or 0)
+
+
+def _per_item(sales):
+
+    # (item_id, quantity, amount, count, largest quantity) of the matching sales, in item id order
+    rows = sales.order_by().values('item_id').annotate(
+        quantity=Sum('purchase_quantity'),
+        amount=Sum('total_price'),
+        sale_count=Count('id'),
+        largest=Max('purchase_quantity'),
+    ).order_by('item_id').values_list('item_id', 'quantity', 'amount', 'sale_count', 'largest')
+    return [(item_id, quantity, _cents(amount), count, largest) for item_id, quantity, amount, count, largest in rows]
+
+
+def _per_day(sales):
+
+    # (item_id, member_id, day, quantity, revenue, count) of the matching sales, days as grouped by the rollup
+    rows = sales.annotate(day=TruncDate('purchase_date')).order_by().values('item_id', 'member_id', 'day').annotate(
+        quantity=Sum('purchase_quantity'),
+        revenue=Sum('total_price'),
+        sale_count=Count('id'),
+    ).values_list('item_id', 'member_id', 'day', 'quantity', 'revenue', 'sale_count')
+    return [(item_id, member_id, day, quantity, _cents(revenue), count) for item_id, member_id, day, quantity, revenue, count in rows]
+
+
+def _cents(value):
+
+    # Sums come back with the backend's own precision, SQLite adds them up as floating point
+    return Decimal(str(value or 0)).quantize(Decimal('0.01'))
+
+
+def start(form, user, matched):
+    """
+    Records the action of a valid BulkSaleActionForm and runs it, or queues it when the form asks for the background
+    or more than BULK_SALE_ACTION_SYNC_LIMIT sales match. Returns the BulkSaleAction.
+    """
+
+    action = BulkSaleAction.objects.create(action=form.cleaned_data['action'], filters=form.stored_data(), requested_by=user)
+    if form.cleaned_data['background'] or matched > settings.BULK_SALE_ACTION_SYNC_LIMIT:
+        queue(action)
+        return action
+    return run(action)
+
+
+def run(action):
+    """
+    Runs a pending BulkSaleAction with its filters validated again, marks it done with the number of sales changed
+    or failed with the reason. Actions already taken by another worker are left alone.
+    """
+
+    if not BulkSaleAction.objects.filter(pk=action.pk, status='pending').update(status='running'):
+        action.refresh_from_db()
+        return action
+
+    try:
+        form = BulkSaleActionForm(action.filters)
+        if not form.is_valid():
+            raise ValidationError([message for errors in form.errors.values() for message in errors])
+
+        sales = matching_sales(form, action.requested_by)
+        if action.action == 'reprice':
+            affected = reprice(sales, form.cleaned_data['price'])
+        else:
+            affected = delete(sales)
+
+    except ValidationError as error:
+        _finish(action, 'failed', error=' '.join(error.messages))
+    except Exception as error:
+        _finish(action, 'failed', error=f'{type(error).__name__}: {error}')
+        raise
+    else:
+        _finish(action, 'done', affected=affected)
+    return action
+
+
+def _finish(action, status, affected=0, error=''):
+    action.status, action.affected, action.error, action.finished_at = status, affected, error, timezone.now()
+    action.save(update_fields=['status', 'affected', 'error', 'finished_at'])
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+
+    # A single worker runs background actions one after another, in the order they were requested
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix='bulk-sale-actions')
+
+
+def _run_queued(action_id):
+
+    # Worker threads keep their own connections, drop any that went stale between actions
+    close_old_connections()
+    try:
+        action = BulkSaleAction.objects.select_related('requested_by').filter(pk=action_id).first()
+        if action:
+            run(action)
+    except Exception:
+        logger.exception('Bulk sale action %s failed', action_id)
+    finally:
+        close_old_connections()
+
+
+def queue(action):
+    """
+    Runs the action on the background worker once the current transaction commits.
+    Actions still pending after a restart are run by the run_bulk_sale_actions command.
+    """
+
+    def submit():
+        if settings.BULK_SALE_ACTIONS_ASYNC:
+            get_executor().submit(_run_queued, action.pk)
+        else:
+            _run_queued(action.pk)
+
+    transaction.on_commit(submit)
+
+
+def describe(action):
+
+    # JSON view of an action for the bulk sales endpoint and its status page
+    return {
+        'id': action.pk,
+        'action': action.action,
+        'status': action.status,
+        'affected': action.affected,
+        'error': action.error,
+        'created_at': action.created_at,
+        'finished_at': action.finished_at,
+        'status_url': reverse('bulk_sale_action', args=[action.pk]),
+    }
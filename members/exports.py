@@ -0,0 +1,75 @@
+# members/exports.py
+
+import csv
+import zlib
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+# Rows are joined into chunks of roughly this many characters before being sent
+STREAM_BUFFER_SIZE = 64 * 1024
+
+class Echo:
+    """
+    File-like object whose write() returns the value instead of storing it, used by csv.writer.
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(header, rows):
+
+    # Yield each formatted CSV line without keeping earlier lines around
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def jsonl_lines(fields, rows):
+
+    # Yield one JSON object per line (JSON Lines), dates and decimals are written the way Django serializes them
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(fields, row))) + '\n'
+
+
+def buffered(lines, size=STREAM_BUFFER_SIZE):
+
+    # Group small lines into larger chunks so the response is not sent one row at a time
+    buffer, length = [], 0
+    for line in lines:
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def gzipped(chunks):
+
+    # Compress the stream incrementally, wbits=31 writes a gzip header and trailer
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def streaming_download(lines, filename, content_type, compress=False):
+    """
+    Returns a StreamingHttpResponse that sends the lines as an attachment, optionally gzip compressed.
+    """
+
+    chunks = buffered(lines)
+    if compress:
+        chunks = gzipped(chunks)
+        filename = f'{filename}.gz'
+        content_type = 'application/gzip'
+
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
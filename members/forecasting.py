@@ -0,0 +1,158 @@
+# members/forecasting.py
+
+from datetime import date, timedelta
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Func, IntegerField, OuterRef, Subquery, Sum
+from django.utils import timezone
+from .models import DailySalesRollup, DemandForecast, Inventory
+
+# Demand arrays hold one row per inventory item and one column per day, oldest day first
+
+EPOCH = date(1970, 1, 1)
+
+class EpochDay(Func):
+    """
+    Days since 1970-01-01 of a date, computed by the database so grouped rows need no date conversion in Python.
+    """
+
+    output_field = IntegerField()
+    template = "(%(expressions)s - DATE '1970-01-01')"
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='CAST(julianday(%(expressions)s) - 2440587.5 AS INTEGER)', **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='(TO_DAYS(%(expressions)s) - 719528)', **extra_context)
+
+
+def moving_average(demand):
+
+    # Mean daily demand over the most recent window of days
+    return demand[:, -settings.FORECAST_WINDOW_DAYS:].mean(axis=1)
+
+
+def exponential_smoothing(demand):
+
+    # Simple exponential smoothing, every step updates the level of all items at once
+    alpha = settings.FORECAST_SMOOTHING_ALPHA
+    level = demand[:, 0].copy()
+    for day in range(1, demand.shape[1]):
+        level += alpha * (demand[:, day] - level)
+    return level
+
+
+# Forecasting models selectable through FORECAST_MODEL
+MODELS = {
+    'moving_average': moving_average,
+    'exponential_smoothing': exponential_smoothing,
+}
+
+
+def demand_series(item_ids, start, end):
+    """
+    Returns the units sold of each item on every day from start up to but excluding end, from one grouped query
+    over the daily sales rollup.
+    item_ids must be a sorted array.
+    """
+
+    days = (end - start).days
+    demand = np.zeros((len(item_ids), days))
+    if not len(item_ids) or days <= 0:
+        return demand
+
+    rows = DailySalesRollup.objects.filter(
+        item_id__gte=item_ids[0],
+        item_id__lte=item_ids[-1],
+        date__gte=start,
+        date__lt=end,
+    ).order_by().values('item_id', day=EpochDay('date')).annotate(
+        quantity=Sum('quantity')
+    ).values_list('item_id', 'day', 'quantity')
+
+    totals = np.array(list(rows.iterator()), dtype=np.int64).reshape(-1, 3)
+    if not len(totals):
+        return demand
+
+    # Rows are placed by searching the sorted ids, sales of items created after the ids were read are dropped
+    positions = np.minimum(np.searchsorted(item_ids, totals[:, 0]), len(item_ids) - 1)
+    known = item_ids[positions] == totals[:, 0]
+    demand[positions[known], totals[known, 1] - (start - EPOCH).days] = totals[known, 2]
+    return demand
+
+
+def forecast(demand, model):
+    """
+    Applies a forecasting model to demand series and returns the daily demand, its deviation,
+    the safety stock, the reorder point and the recommended inventory level of every row.
+    """
+
+    if model not in MODELS:
+        raise ValueError(f'Unknown forecasting model "{model}", use one of {", ".join(MODELS)}.')
+
+    daily_demand = MODELS[model](demand) if demand.shape[1] else np.zeros(len(demand))
+    deviation = demand[:, -settings.FORECAST_WINDOW_DAYS:].std(axis=1) if demand.shape[1] else np.zeros(len(demand))
+
+    # Safety stock covers demand above the forecast until the next delivery after a review
+    cover_days = settings.FORECAST_LEAD_TIME_DAYS + settings.FORECAST_REVIEW_DAYS
+    safety_stock = np.ceil(settings.FORECAST_SERVICE_LEVEL_Z * deviation * np.sqrt(cover_days))
+    reorder_point = np.ceil(daily_demand * settings.FORECAST_LEAD_TIME_DAYS + safety_stock)
+    recommended_level = np.ceil(daily_demand * cover_days + safety_stock)
+
+    # Items that never sold in the history keep the default level instead of a forecast of nothing
+    recommended_level = np.where(demand.any(axis=1), recommended_level, settings.FORECAST_DEFAULT_LEVEL)
+
+    return daily_demand, deviation, safety_stock, reorder_point, recommended_level
+
+
+def refresh_forecasts(model=None, batch_size=None, today=None):
+    """
+    Recalculates the forecast and recommended inventory level of every item in batches, returns the number of items.
+    History runs up to the end of the day before today so a partial day does not drag the forecast down.
+    """
+
+    model = model or settings.FORECAST_MODEL
+    batch_size = batch_size or settings.FORECAST_BATCH_SIZE
+    if model not in MODELS:
+        raise ValueError(f'Unknown forecasting model "{model}", use one of {", ".join(MODELS)}.')
+
+    end = today or timezone.localdate()
+    start = end - timedelta(days=settings.FORECAST_HISTORY_DAYS)
+    item_ids = np.fromiter(Inventory.objects.order_by('pk').values_list('pk', flat=True), dtype=np.int64)
+    computed_at = timezone.now()
+
+    for offset in range(0, len(item_ids), batch_size):
+        batch = item_ids[offset:offset + batch_size]
+        results = zip(batch.tolist(), *forecast(demand_series(batch, start, end), model))
+
+        forecasts = [
+            DemandForecast(
+                inventory_id=item_id,
+                model=model,
+                daily_demand=float(daily_demand),
+                demand_deviation=float(deviation),
+                safety_stock=int(safety_stock),
+                reorder_point=int(reorder_point),
+                recommended_level=int(recommended_level),
+                computed_at=computed_at,
+            )
+            for item_id, daily_demand, deviation, safety_stock, reorder_point, recommended_level in results
+        ]
+
+        with transaction.atomic():
+            DemandForecast.objects.bulk_create(
+                forecasts,
+                update_conflicts=True,
+                unique_fields=['inventory'],
+                update_fields=[field.name for field in DemandForecast._meta.concrete_fields if not field.primary_key],
+            )
+
+            # Copy the new levels onto the batch's items with one UPDATE
+            Inventory.objects.filter(pk__gte=batch[0], pk__lte=batch[-1], forecast__isnull=False).update(
+                recommended_inventory_levels=Subquery(
+                    DemandForecast.objects.filter(inventory=OuterRef('pk')).values('recommended_level')
+                )
+            )
+
+    return len(item_ids)
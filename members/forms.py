@@ -1,11 +1,13 @@
 # members/forms.py
 
+from datetime import datetime, time, timedelta
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm, PasswordChangeForm
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
-from .models import Profile, Sale, Inventory
+from django.utils import timezone
+from .models import BulkSaleAction, Profile, Sale, Inventory
 
 # Form for registering new user
 class UserRegisterForm(UserCreationForm):
@@ -92,10 +94,20 @@ class ProfileUpdateForm(forms.ModelForm):
 
 
 class SaleUpdateForm(forms.ModelForm):
+
+    # Item is entered by name, the view resolves it to an inventory record
+    item_name = forms.CharField(max_length=255)
+
+    field_order = ['item_name', 'purchase_quantity', 'price_per_unit']
     
     class Meta:
         model = Sale
-        fields = ['item_name', 'purchase_quantity', 'price_per_unit']
+        fields = ['purchase_quantity', 'price_per_unit']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.fields['item_name'].initial = self.instance.item_name
 
 class CustomPasswordChangeForm(PasswordChangeForm):
     old_password = forms.CharField(label='Old Password', widget=forms.PasswordInput)
@@ -110,4 +122,142 @@ class CustomPasswordChangeForm(PasswordChangeForm):
 class InventoryUpdateForm(forms.ModelForm):
     class Meta:
         model = Inventory
-        fields = ['inventory_amount']
\ No newline at end of file
+        fields = ['inventory_amount']
+
+# Form for an optional date range read from the query string, whole days in the current time zone
+class DateRangeForm(forms.Form):
+
+    start_date = forms.DateField(required=False)
+    end_date = forms.DateField(required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start_date = cleaned_data.get('start_date')
+        end_date = cleaned_data.get('end_date')
+
+        # Ensure the date range is not reversed
+        if start_date and end_date and start_date > end_date:
+            raise forms.ValidationError("The start date must not be after the end date.")
+
+        return cleaned_data
+
+    def filter_dates(self, queryset, field):
+
+        # Dates are compared as whole days in the current time zone so an index on the field can be used
+        start_date = self.cleaned_data.get('start_date')
+        end_date = self.cleaned_data.get('end_date')
+        if start_date:
+            queryset = queryset.filter(**{f'{field}__gte': timezone.make_aware(datetime.combine(start_date, time.min))})
+        if end_date:
+            queryset = queryset.filter(**{f'{field}__lt': timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min))})
+        return queryset
+
+
+# Form for the optional filters of the CSV exports, read from the query string
+class SaleFilterForm(DateRangeForm):
+
+    # Item names, the parameter can be repeated to select several items
+    item = forms.Field(required=False, widget=forms.MultipleHiddenInput)
+
+    # Compress the export with gzip
+    gzip = forms.BooleanField(required=False)
+
+    def filter_sales(self, sales):
+        sales = self.filter_dates(sales, 'purchase_date')
+        if self.cleaned_data.get('item'):
+            sales = sales.filter(item__item_name__in=self.cleaned_data['item'])
+        return sales
+
+    def filter_inventory(self, inventories):
+        if self.cleaned_data.get('item'):
+            inventories = inventories.filter(item_name__in=self.cleaned_data['item'])
+        return inventories
+
+
+# Form for a delete or reprice of every sale matching the filters, posted to the bulk sales endpoint
+class BulkSaleActionForm(DateRangeForm):
+
+    action = forms.ChoiceField(choices=BulkSaleAction.ACTIONS)
+
+    # Item names, the parameter can be repeated to select several items
+    item = forms.Field(required=False, widget=forms.MultipleHiddenInput)
+
+    # Username of the member whose sales are matched, only superusers can act on another member's sales
+    member = forms.CharField(required=False)
+
+    # Range of the price per unit, both ends included
+    min_price = forms.DecimalField(required=False, min_value=0, max_digits=10, decimal_places=2)
+    max_price = forms.DecimalField(required=False, min_value=0, max_digits=10, decimal_places=2)
+
+    # New price per unit of the matching sales when repricing
+    price = forms.DecimalField(required=False, min_value=0, max_digits=10, decimal_places=2)
+
+    # Only report what the action would change
+    dry_run = forms.BooleanField(required=False)
+
+    # Run the action after responding, large matches always run in the background
+    background = forms.BooleanField(required=False)
+
+    # Confirms an action on every sale the user may change, required when no filter is given
+    all = forms.BooleanField(required=False)
+
+    # Filters of which at least one must be given unless all is confirmed
+    FILTER_FIELDS = ('start_date', 'end_date', 'item', 'member', 'min_price', 'max_price')
+
+    # Fields kept with a background action and validated again when it runs
+    STORED_FIELDS = ('action', *FILTER_FIELDS, 'price', 'all')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        min_price = cleaned_data.get('min_price')
+        max_price = cleaned_data.get('max_price')
+
+        if min_price is not None and max_price is not None and min_price > max_price:
+            raise forms.ValidationError("The minimum price must not be above the maximum price.")
+        if cleaned_data.get('action') == 'reprice' and cleaned_data.get('price') is None:
+            raise forms.ValidationError("A new price is required to reprice sales.")
+
+        # Ensure an action without filters was meant to change every sale
+        if not cleaned_data.get('all') and all(cleaned_data.get(name) in (None, '', []) for name in self.FILTER_FIELDS):
+            raise forms.ValidationError("Give at least one filter, or confirm the action on every sale with all.")
+
+        return cleaned_data
+
+    def filter_sales(self, sales):
+
+        # Items and members are matched through subqueries so the DELETE or UPDATE needs no join
+        sales = self.filter_dates(sales, 'purchase_date')
+        if self.cleaned_data.get('item'):
+            sales = sales.filter(item__in=Inventory.objects.filter(item_name__in=self.cleaned_data['item']))
+        if self.cleaned_data.get('member'):
+            sales = sales.filter(member__in=User.objects.filter(username=self.cleaned_data['member']))
+        if self.cleaned_data.get('min_price') is not None:
+            sales = sales.filter(price_per_unit__gte=self.cleaned_data['min_price'])
+        if self.cleaned_data.get('max_price') is not None:
+            sales = sales.filter(price_per_unit__lte=self.cleaned_data['max_price'])
+        return sales
+
+    def stored_data(self):
+
+        # Cleaned values as form data that can be saved as JSON
+        data = {}
+        for name in self.STORED_FIELDS:
+            value = self.cleaned_data.get(name)
+            if value not in (None, '', [], False):
+                data[name] = value if isinstance(value, list) else str(value)
+        return data
+
+
+# Form for the options of a member statement export, read from the query string
+class StatementFilterForm(DateRangeForm):
+
+    file_format = forms.ChoiceField(choices=[('csv', 'CSV'), ('jsonl', 'JSON Lines')], required=False)
+
+    # Username of the member, only superusers can export another member's statement
+    member = forms.CharField(required=False)
+
+    # Compress the export with gzip
+    gzip = forms.BooleanField(required=False)
+
+    def clean_file_format(self):
+        return self.cleaned_data.get('file_format') or 'csv'
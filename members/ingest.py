@@ -0,0 +1,299 @@
+# members/ingest.py
+
+import csv
+import io
+import json
+from collections import defaultdict
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import DailySalesRollup, Inventory, Sale
+from .rules import SaleEvent, publish
+from . import aggregates, analytics, search
+from .utils import chunks
+
+# Columns every imported sale must provide, purchase_date is optional and defaults to the import time
+REQUIRED_FIELDS = ('member', 'item_name', 'purchase_quantity', 'price_per_unit')
+
+# Validation stops reporting after this many problems
+MAX_ERRORS = 100
+
+def read_sales(file, file_format):
+    """
+    Reads sale rows from an uploaded or opened file, either CSV with a header row or a JSON list of objects.
+    """
+
+    try:
+        if file_format == 'json':
+            data = json.load(file)
+            if isinstance(data, dict):
+                data = data.get('sales', [])
+            if not isinstance(data, list):
+                raise ValidationError('JSON input must be a list of sales or an object with a "sales" list.')
+            return data
+
+        if file_format == 'csv':
+            text = io.TextIOWrapper(file, encoding='utf-8-sig') if isinstance(file.read(0), bytes) else file
+            return list(csv.DictReader(text))
+
+    except (ValueError, csv.Error) as error:
+        raise ValidationError(f'Could not read the sales: {error}')
+
+    raise ValidationError(f'Unsupported format "{file_format}", use csv or json.')
+
+
+def clean_sales(rows):
+    """
+    Validates raw sale rows and returns them with members resolved, raises ValidationError listing every bad row.
+    """
+
+    errors = []
+    usernames = {str(row.get('member') or '').strip() for row in rows if isinstance(row, dict)}
+    members = {}
+    for batch in chunks(usernames):
+        members.update(User.objects.filter(username__in=batch).values_list('username', 'id'))
+
+    quantity_field = Sale._meta.get_field('purchase_quantity')
+    price_field = Sale._meta.get_field('price_per_unit')
+    total_field = Sale._meta.get_field('total_price')
+
+    cleaned = []
+    for number, row in enumerate(rows, start=1):
+        if len(errors) >= MAX_ERRORS:
+            break
+        if not isinstance(row, dict):
+            errors.append(f'Row {number}: expected an object with sale fields.')
+            continue
+
+        missing = [field for field in REQUIRED_FIELDS if row.get(field) in (None, '')]
+        if missing:
+            errors.append(f'Row {number}: missing {", ".join(missing)}.')
+            continue
+
+        member = str(row['member']).strip()
+        item_name = str(row['item_name']).strip()
+        try:
+            # Model field validation also enforces the column's digit limits
+            purchase_quantity = quantity_field.clean(_whole_number(row['purchase_quantity']), None)
+            price_per_unit = price_field.clean(row['price_per_unit'], None)
+            total_field.clean(purchase_quantity * price_per_unit, None)
+        except ValidationError as error:
+            errors.append(f'Row {number}: {" ".join(error.messages)}')
+            continue
+
+        purchase_date = timezone.now()
+        if row.get('purchase_date'):
+            try:
+                purchase_date = parse_datetime(str(row['purchase_date']))
+            except ValueError:
+                # Well formed dates that do not exist, e.g. February 30th
+                purchase_date = None
+            if purchase_date is None:
+                errors.append(f'Row {number}: purchase_date must be an ISO 8601 date and time.')
+                continue
+            if timezone.is_naive(purchase_date):
+                purchase_date = timezone.make_aware(purchase_date)
+
+        if member not in members:
+            errors.append(f'Row {number}: unknown member "{member}".')
+        elif not item_name or len(item_name) > 255:
+            errors.append(f'Row {number}: item_name must be between 1 and 255 characters.')
+        elif purchase_quantity < 1:
+            errors.append(f'Row {number}: purchase_quantity must be at least 1.')
+        elif price_per_unit < 0:
+            errors.append(f'Row {number}: price_per_unit must not be negative.')
+        else:
+            cleaned.append({
+                'member_id': members[member],
+                'member': member,
+                'item_name': item_name,
+                'purchase_quantity': purchase_quantity,
+                'price_per_unit': price_per_unit,
+                'purchase_date': purchase_date,
+            })
+
+    if errors:
+        raise ValidationError(errors)
+    return cleaned
+
+
+def _whole_number(value):
+
+    # Quantities are never rounded, so 1.5 or a boolean is an error rather than 1
+    try:
+        if isinstance(value, bool):
+            raise ValueError
+        number = Decimal(str(value).strip())
+        if not number.is_finite() or number != number.to_integral_value():
+            raise ValueError
+    except (ValueError, ArithmeticError):
+        raise ValidationError('purchase_quantity must be a whole number.')
+    return int(number)
+
+
+def import_sales(rows, triggered_by=None, batch_size=None):
+    """
+    Validates and records a batch of sales in one transaction, returns the number of sales created.
+    Inventory counters are updated once per item and the notification rules see the batch as a whole.
+    """
+
+    cleaned = clean_sales(rows)
+    if not cleaned:
+        return 0
+
+    with transaction.atomic():
+        items = _get_or_create_items({row['item_name'] for row in cleaned})
+
+        # Check the batch against available stock with the item rows locked
+        requested = defaultdict(int)
+        for row in cleaned:
+            requested[row['item_name']] += row['purchase_quantity']
+        shortages = [
+            f'Purchase quantity of {quantity} exceeds available inventory ({items[name].remaining_quantity}) for {name}.'
+            for name, quantity in requested.items() if quantity > items[name].remaining_quantity
+        ]
+        if shortages:
+            raise ValidationError(shortages[:MAX_ERRORS])
+
+        # Stock is reserved with one counter update per item that only matches while enough is left, as single
+        # sales are, so a concurrent import cannot oversell where the row locks above are not enforced, e.g. SQLite
+        deltas = defaultdict(lambda: [0, Decimal(0), 0])
+        for row in cleaned:
+            delta = deltas[items[row['item_name']].pk]
+            delta[0] += row['purchase_quantity']
+            delta[1] += row['purchase_quantity'] * row['price_per_unit']
+            delta[2] += 1
+        for item_id, (quantity, amount, count) in sorted(deltas.items()):
+            if not Inventory.apply_sale_delta(item_id, quantity, amount, count, check_stock=True):
+                item = Inventory.objects.get(pk=item_id)
+                raise ValidationError(
+                    f'Purchase quantity of {quantity} exceeds available inventory ({item.remaining_quantity}) for {item.item_name}.'
+                )
+
+        sales = [
+            Sale(
+                member_id=row['member_id'],
+                item=items[row['item_name']],
+                purchase_quantity=row['purchase_quantity'],
+                price_per_unit=row['price_per_unit'],
+                total_price=row['purchase_quantity'] * row['price_per_unit'],
+                purchase_date=row['purchase_date'],
+            )
+            for row in cleaned
+        ]
+        Sale.objects.bulk_create(sales, batch_size=batch_size)
+
+        # bulk_create skips the sale signals, so the daily totals are applied in bulk as well
+        DailySalesRollup.apply_sales(
+            (sale.item.pk, sale.member_id, sale.purchase_date, sale.purchase_quantity, sale.total_price, 1) for sale in sales
+        )
+
+        # bulk_create skips the signals that drop cached figures
+        analytics.invalidate_on_commit()
+        aggregates.invalidate_on_commit(deltas)
+
+        # Notification rules run on the whole batch after the import commits
+        publish(*[
+            SaleEvent(
+                action='recorded',
+                item_id=items[row['item_name']].pk,
+                item_name=row['item_name'],
+                purchase_quantity=row['purchase_quantity'],
+                member_id=row['member_id'],
+                member_username=row['member'],
+                triggered_by_id=triggered_by.pk if triggered_by else None,
+                triggered_by_username=triggered_by.username if triggered_by else '',
+            )
+            for row in cleaned
+        ])
+
+    return len(sales)
+
+
+def delete_sales(sale_ids, user):
+    """
+    Deletes the given sales that the user may delete in one transaction, returns the number of sales deleted.
+    Members can only delete their own sales, superusers any sale, other ids are ignored.
+    Stock, counters and daily totals are restored with one update per item instead of one per sale.
+    """
+
+    sale_ids = {int(sale_id) for sale_id in sale_ids}
+    sales = Sale.objects.all() if user.is_superuser else Sale.objects.filter(member=user)
+
+    with transaction.atomic():
+        rows = []
+        for batch in chunks(sale_ids):
+            rows.extend(sales.select_for_update().filter(pk__in=batch).values_list(
+                'pk', 'item_id', 'member_id', 'purchase_date', 'purchase_quantity', 'total_price'
+            ))
+        if not rows:
+            return 0
+
+        deltas = defaultdict(lambda: [0, Decimal(0), 0])
+        for sale_id, item_id, member_id, purchase_date, quantity, total_price in rows:
+            delta = deltas[item_id]
+            delta[0] += quantity
+            delta[1] += total_price
+            delta[2] += 1
+
+        delete_with_totals(
+            [Sale.objects.filter(pk__in=batch) for batch in chunks([row[0] for row in rows])],
+            [(item_id, *delta) for item_id, delta in deltas.items()],
+            [(item_id, member_id, purchase_date, quantity, total_price, 1) for sale_id, item_id, member_id, purchase_date, quantity, total_price in rows],
+        )
+
+    return len(rows)
+
+
+def delete_with_totals(batches, per_item, per_day):
+    """
+    Deletes the sales of each queryset in batches and takes their totals off stock, counters and daily totals,
+    returns the number of sales deleted. per_item holds (item_id, quantity, amount, count) and per_day
+    (item_id, member_id, date, quantity, revenue, count) of the deleted sales, the caller locks them beforehand.
+    """
+
+    # Nothing references a sale, so rows are deleted directly without loading them or sending
+    # a post_delete signal for each, everything those handlers do is applied in bulk below
+    deleted = sum(sales._raw_delete(sales.db) for sales in batches)
+
+    # Items are updated in id order so concurrent deletions lock them in the same order
+    for item_id, quantity, amount, count in sorted(per_item):
+        Inventory.apply_sale_delta(item_id, -quantity, -amount, -count)
+    DailySalesRollup.apply_sales(
+        (item_id, member_id, day, -quantity, -revenue, -count) for item_id, member_id, day, quantity, revenue, count in per_day
+    )
+
+    analytics.invalidate_on_commit()
+    aggregates.invalidate_on_commit(row[0] for row in per_item)
+    return deleted
+
+
+def _get_or_create_items(item_names):
+
+    # Missing items are created with the default inventory amount, then every item row is locked
+    existing = set()
+    for batch in chunks(item_names):
+        existing.update(Inventory.objects.filter(item_name__in=batch).values_list('item_name', flat=True))
+
+    default_amount = Inventory._meta.get_field('inventory_amount').default
+    Inventory.objects.bulk_create([
+        Inventory(
+            item_name=name,
+            inventory_amount=default_amount,
+            remaining_quantity=default_amount,
+            recommended_inventory_levels=settings.FORECAST_DEFAULT_LEVEL,
+        )
+        for name in item_names - existing
+    ], ignore_conflicts=True)
+
+    items = {}
+    for batch in chunks(item_names):
+        items.update((item.item_name, item) for item in Inventory.objects.select_for_update().filter(item_name__in=batch))
+
+    # bulk_create skips the signal that adds new names to the search table
+    search.index_items(items[name] for name in item_names - existing)
+    return items
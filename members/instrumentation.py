@@ -0,0 +1,180 @@
+# members/instrumentation.py
+
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Wall time, query count and SQL time of every request, per view, kept in memory by each worker process.
+# render() writes them in the Prometheus text format served by the metrics view.
+
+# Upper bounds in seconds of the request duration histogram
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class QueryRecorder:
+    """
+    Database execute wrapper that counts queries, their total time and how often each statement repeats,
+    see connection.execute_wrapper().
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+            # Parameters are left out so the same query run for every row of a loop is counted as one statement
+            self.statements[sql] += 1
+
+    def most_repeated(self):
+        return self.statements.most_common(1)[0] if self.statements else (None, 0)
+
+
+class ViewMetrics:
+
+    def __init__(self):
+        self.requests = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.over_budget = 0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+
+
+_lock = threading.Lock()
+_views = defaultdict(ViewMetrics)
+
+def record(view, seconds, recorder):
+    with _lock:
+        metrics = _views[view]
+        metrics.requests += 1
+        metrics.seconds += seconds
+        metrics.queries += recorder.count
+        metrics.sql_seconds += recorder.seconds
+        metrics.over_budget += recorder.count > settings.REQUEST_QUERY_BUDGET
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                metrics.buckets[index] += 1
+
+
+def reset():
+    with _lock:
+        _views.clear()
+
+
+def snapshot():
+    """
+    Returns {view: ViewMetrics} copies of the figures recorded so far by this process.
+    """
+
+    with _lock:
+        copies = {}
+        for view, metrics in _views.items():
+            copy = ViewMetrics()
+            copy.__dict__.update(metrics.__dict__, buckets=list(metrics.buckets))
+            copies[view] = copy
+        return copies
+
+
+def render():
+    """
+    The recorded figures in the Prometheus text exposition format.
+    """
+
+    views = sorted(snapshot().items())
+    lines = []
+
+    def family(name, kind, description, samples):
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for suffix, labels, value in samples:
+            label_text = ','.join(f'{key}="{_escape(label)}"' for key, label in labels)
+            lines.append(f'{name}{suffix}{{{label_text}}} {value}')
+
+    def per_view(attribute):
+        return [('', [('view', view)], getattr(metrics, attribute)) for view, metrics in views]
+
+    family('gotogro_requests_total', 'counter', 'Requests handled per view.', per_view('requests'))
+
+    histogram = []
+    for view, metrics in views:
+        for bound, count in zip(DURATION_BUCKETS, metrics.buckets):
+            histogram.append(('_bucket', [('view', view), ('le', bound)], count))
+        histogram.append(('_bucket', [('view', view), ('le', '+Inf')], metrics.requests))
+        histogram.append(('_sum', [('view', view)], round(metrics.seconds, 6)))
+        histogram.append(('_count', [('view', view)], metrics.requests))
+    family('gotogro_request_duration_seconds', 'histogram', 'Wall time of requests per view.', histogram)
+
+    family('gotogro_request_queries_total', 'counter', 'Database queries run by requests per view.', per_view('queries'))
+    family('gotogro_request_sql_seconds_total', 'counter', 'Time spent in database queries per view.', [
+        ('', labels, round(value, 6)) for _, labels, value in per_view('sql_seconds')
+    ])
+    family('gotogro_request_query_budget_exceeded_total', 'counter', 'Requests that ran more queries than REQUEST_QUERY_BUDGET.', per_view('over_budget'))
+
+    return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _view_name(request):
+
+    # Requests that did not resolve to a view are grouped together so unknown paths cannot grow the metrics
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unresolved'
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Measures every request and logs a warning naming the most repeated statement when a request runs more
+    queries than REQUEST_QUERY_BUDGET, which is usually a query run once per row (N+1).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REQUEST_METRICS_ENABLED:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+
+        # Streaming exports query while the body is sent, so they are measured once it has been sent
+        if response.streaming and not response.is_async:
+            response.streaming_content = self.stream(response.streaming_content, request, recorder, started)
+        else:
+            self.finish(request, recorder, started)
+        return response
+
+    def stream(self, content, request, recorder, started):
+        try:
+            with connection.execute_wrapper(recorder):
+                yield from content
+        finally:
+            self.finish(request, recorder, started)
+
+    def finish(self, request, recorder, started):
+        view = _view_name(request)
+        record(view, time.perf_counter() - started, recorder)
+
+        if recorder.count > settings.REQUEST_QUERY_BUDGET:
+            statement, repeats = recorder.most_repeated()
+            logger.warning(
+                'Possible N+1 queries in %s (%s %s): %d queries over a budget of %d, repeated %d times: %s',
+                view, request.method, request.path, recorder.count, settings.REQUEST_QUERY_BUDGET, repeats, statement,
+            )
@@ -0,0 +1,99 @@
+# members/ledger.py
+
+import heapq
+from datetime import datetime, time
+from decimal import Decimal
+from django.conf import settings
+from django.db.models import F, Q, RowRange, Sum, Window
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from .models import MonthlyTransactionTotal, Sale, Transaction
+from .pagination import paginate_keyset
+
+# A member's transaction history is read newest first in keyset pages on (date, id).
+# Balances are the running total of every transaction of the member up to and including the row,
+# whatever date range is shown, and month to date figures restart on the first day of every month.
+
+ORDERING = ('date', 'id')
+
+def history_page(user, filters, cursor=None, page_size=50):
+    """
+    Returns one page of the user's transactions, filtered by a DateRangeForm, with balances and month to date sums.
+    """
+
+    transactions = filters.filter_dates(Transaction.objects.filter(user=user), 'date')
+    page = paginate_keyset(transactions.values('id', 'date', 'amount', 'description'), ORDERING, cursor, page_size)
+    add_balances(user, page.items)
+    return page
+
+
+def add_balances(user, rows):
+    """
+    Sets 'balance' and 'month_to_date' on transaction rows ordered newest first.
+    Window functions run over the rows from the start of the oldest row's month up to the newest row, and
+    earlier months come from their monthly totals, so the cost does not grow with the length of the history.
+    """
+
+    if not rows:
+        return rows
+
+    newest, oldest = rows[0], rows[-1]
+    month = timezone.localdate(oldest['date']).replace(day=1)
+    opening = MonthlyTransactionTotal.objects.filter(user=user, month__lt=month).aggregate(total=Sum('total'))['total'] or 0
+
+    order = [F('date').asc(), F('id').asc()]
+    frame = RowRange(start=None, end=0)
+    span = Transaction.objects.filter(user=user, date__gte=timezone.make_aware(datetime.combine(month, time.min))).filter(
+        Q(date__lt=newest['date']) | Q(date=newest['date'], id__lte=newest['id'])
+    ).annotate(
+        running_total=Window(Sum('amount'), order_by=order, frame=frame),
+        month_to_date=Window(Sum('amount'), partition_by=[TruncMonth('date')], order_by=order, frame=frame),
+    ).values_list('id', 'running_total', 'month_to_date')
+
+    totals = {pk: (running_total, month_to_date) for pk, running_total, month_to_date in span}
+    for row in rows:
+        running_total, month_to_date = totals[row['id']]
+        row['balance'] = _money(opening + running_total)
+        row['month_to_date'] = _money(month_to_date)
+    return rows
+
+
+def monthly_totals(user, rows):
+    """
+    Totals of the months the rows fall in, newest month first.
+    """
+
+    months = {timezone.localdate(row['date']).replace(day=1) for row in rows}
+    return list(MonthlyTransactionTotal.objects.filter(user=user, month__in=months).order_by('-month').values(
+        'month', 'total', 'transaction_count'
+    ))
+
+
+# Columns of a statement, transactions leave quantity and price per unit empty
+STATEMENT_FIELDS = ('type', 'date', 'description', 'quantity', 'price_per_unit', 'amount')
+
+def statement_rows(member, filters):
+    """
+    Returns an iterator over the member's transactions and sales in a DateRangeForm's range, ordered by date.
+    Both tables are read through .iterator() and merged as they stream, so no more than a chunk of each is held.
+    """
+
+    transactions = filters.filter_dates(Transaction.objects.filter(user=member), 'date').order_by('date', 'id').values_list(
+        'date', 'description', 'amount'
+    ).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+    sales = filters.filter_dates(Sale.objects.filter(member=member), 'purchase_date').order_by('purchase_date', 'id').values_list(
+        'purchase_date', 'item__item_name', 'purchase_quantity', 'price_per_unit', 'total_price'
+    ).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+    return heapq.merge(
+        (('transaction', date, description, None, None, amount) for date, description, amount in transactions),
+        (('sale', *row) for row in sales),
+        key=lambda row: row[1],
+    )
+
+
+def _money(value):
+
+    # Window sums come back with the backend's own precision, amounts are always shown with two decimals
+    return Decimal(value or 0).quantize(Decimal('0.01'))
@@ -0,0 +1,37 @@
+# members/management/commands/import_sales.py
+
+import os
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from members.ingest import import_sales, read_sales
+
+class Command(BaseCommand):
+    help = 'Import a CSV or JSON file of sales in one transaction.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header row or JSON list of sales.')
+        parser.add_argument('--format', choices=['csv', 'json'], help='Input format, taken from the file extension by default.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of rows per INSERT statement.')
+        parser.add_argument('--triggered-by', help='Username recorded on low inventory notifications.')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+
+        triggered_by = None
+        if options['triggered_by']:
+            try:
+                triggered_by = User.objects.get(username=options['triggered_by'])
+            except User.DoesNotExist:
+                raise CommandError(f'Unknown user "{options["triggered_by"]}".')
+
+        try:
+            with open(options['path'], 'rb') as file:
+                rows = read_sales(file, file_format)
+            created = import_sales(rows, triggered_by=triggered_by, batch_size=options['batch_size'])
+        except OSError as error:
+            raise CommandError(error)
+        except ValidationError as error:
+            raise CommandError('\n'.join(error.messages))
+
+        self.stdout.write(self.style.SUCCESS(f'Imported {created} sales.'))
@@ -0,0 +1,45 @@
+# members/management/commands/rebuild_inventory_counters.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum, Count
+from members.models import Inventory, Sale
+from members import aggregates, analytics
+
+class Command(BaseCommand):
+    help = 'Recalculate the running sale counters of every inventory item from the Sale table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of inventory rows written per UPDATE batch.')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+
+        # One grouped pass over Sale for every item
+        totals = {
+            row['item_id']: row for row in Sale.objects.order_by().values('item_id').annotate(
+                sale_count=Count('id'),
+                total_purchase_quantity=Sum('purchase_quantity'),
+                total_sales_amount=Sum('total_price'),
+            )
+        }
+
+        inventories = list(Inventory.objects.select_for_update())
+        for inventory in inventories:
+            row = totals.get(inventory.pk, {})
+            inventory.sale_count = row.get('sale_count', 0)
+            inventory.total_purchase_quantity = row.get('total_purchase_quantity') or 0
+            inventory.total_sales_amount = row.get('total_sales_amount') or 0
+            inventory.calculate_remaining_quantity()
+
+        Inventory.objects.bulk_update(
+            inventories,
+            Inventory.COUNTER_FIELDS + ('remaining_quantity',),
+            batch_size=options['batch_size'],
+        )
+
+        # bulk_update skips the signals that drop cached figures
+        analytics.invalidate_on_commit()
+        aggregates.invalidate_on_commit(inventory.pk for inventory in inventories)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt counters for {len(inventories)} inventory items.'))
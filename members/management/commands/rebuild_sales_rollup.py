@@ -0,0 +1,16 @@
+# members/management/commands/rebuild_sales_rollup.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from members.models import DailySalesRollup
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily sales totals per item and member from the Sale table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Number of rollup rows inserted per batch.')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        count = DailySalesRollup.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} daily sales rollup rows.'))
@@ -0,0 +1,19 @@
+# members/management/commands/rebuild_search_index.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from members import search
+
+class Command(BaseCommand):
+    help = 'Rebuild the search tables of inventory item and member names.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Number of names inserted per batch.')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        if not search.uses_fts():
+            self.stdout.write('This database has no search tables, searches match names with LIKE queries.')
+            return
+        items, members = search.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {items} inventory items and {members} members.'))
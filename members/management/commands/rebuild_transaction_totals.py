@@ -0,0 +1,16 @@
+# members/management/commands/rebuild_transaction_totals.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from members.models import MonthlyTransactionTotal
+
+class Command(BaseCommand):
+    help = 'Rebuild the monthly transaction totals per member from the Transaction table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Number of rows inserted per batch.')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        count = MonthlyTransactionTotal.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} monthly transaction totals.'))
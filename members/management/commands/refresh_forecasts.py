@@ -0,0 +1,22 @@
+# members/management/commands/refresh_forecasts.py
+
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from members.forecasting import MODELS, refresh_forecasts
+
+class Command(BaseCommand):
+    help = (
+        'Forecast the demand of every inventory item and refresh the recommended inventory levels. '
+        'Meant to run nightly, e.g. from cron: 0 2 * * * python manage.py refresh_forecasts'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=sorted(MODELS), help=f'Forecasting model, defaults to FORECAST_MODEL ({settings.FORECAST_MODEL}).')
+        parser.add_argument('--batch-size', type=int, help='Number of inventory items forecast together.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = refresh_forecasts(model=options['model'], batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Refreshed forecasts for {count} inventory items in {elapsed:.1f}s.'))
@@ -0,0 +1,17 @@
+# members/management/commands/run_bulk_sale_actions.py
+
+from django.core.management.base import BaseCommand
+from members import bulk
+from members.models import BulkSaleAction
+
+class Command(BaseCommand):
+    help = 'Run bulk sale actions still pending, such as those queued before the server stopped.'
+
+    def handle(self, *args, **options):
+        actions = BulkSaleAction.objects.filter(status='pending').select_related('requested_by').order_by('created_at', 'id')
+        for action in actions:
+            bulk.run(action)
+            if action.status == 'done':
+                self.stdout.write(self.style.SUCCESS(f'Action {action.pk}: {action.action} of {action.affected} sales done.'))
+            else:
+                self.stdout.write(self.style.ERROR(f'Action {action.pk}: {action.action} failed, {action.error}'))
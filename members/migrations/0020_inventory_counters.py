@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:23
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_counters(apps, schema_editor):
+    Inventory = apps.get_model('members', 'Inventory')
+    Sale = apps.get_model('members', 'Sale')
+
+    totals = {
+        row['item_name']: row for row in Sale.objects.order_by().values('item_name').annotate(
+            sale_count=Count('id'),
+            total_purchase_quantity=Sum('purchase_quantity'),
+            total_sales_amount=Sum('total_price'),
+        )
+    }
+
+    inventories = list(Inventory.objects.all())
+    for inventory in inventories:
+        row = totals.get(inventory.item_name)
+        if row:
+            inventory.sale_count = row['sale_count']
+            inventory.total_purchase_quantity = row['total_purchase_quantity'] or 0
+            inventory.total_sales_amount = row['total_sales_amount'] or 0
+        inventory.remaining_quantity = inventory.inventory_amount - inventory.total_purchase_quantity
+
+    Inventory.objects.bulk_update(inventories, ['sale_count', 'total_purchase_quantity', 'total_sales_amount', 'remaining_quantity'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0019_inventory_recommended_inventory_levels'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventory',
+            name='sale_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='inventory',
+            name='total_purchase_quantity',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='inventory',
+            name='total_sales_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
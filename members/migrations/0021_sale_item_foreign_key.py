@@ -0,0 +1,24 @@
+from django.conf import settings
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0020_inventory_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='item',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='sales', to='members.inventory'),
+        ),
+        migrations.AlterField(
+            model_name='sale',
+            name='item_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+from django.db.models import Count, Sum
+
+
+def link_sales_to_inventory(apps, schema_editor):
+    Inventory = apps.get_model('members', 'Inventory')
+    Sale = apps.get_model('members', 'Sale')
+
+    for item_name in Sale.objects.order_by().values_list('item_name', flat=True).distinct():
+        inventory, created = Inventory.objects.get_or_create(item_name=item_name)
+        Sale.objects.filter(item_name=item_name).update(item=inventory)
+
+        # Items that only existed on sales start with counters built from those sales
+        if created:
+            totals = Sale.objects.filter(item=inventory).aggregate(
+                sale_count=Count('id'),
+                total_purchase_quantity=Sum('purchase_quantity'),
+                total_sales_amount=Sum('total_price'),
+            )
+            inventory.sale_count = totals['sale_count']
+            inventory.total_purchase_quantity = totals['total_purchase_quantity'] or 0
+            inventory.total_sales_amount = totals['total_sales_amount'] or 0
+            inventory.remaining_quantity = inventory.inventory_amount - inventory.total_purchase_quantity
+            inventory.save()
+
+
+def restore_item_names(apps, schema_editor):
+    Sale = apps.get_model('members', 'Sale')
+
+    for sale in Sale.objects.select_related('item'):
+        sale.item_name = sale.item.item_name
+        sale.save(update_fields=['item_name'])
+
+
+# Sales are linked in a migration of their own, PostgreSQL cannot alter the table in the transaction that updated it
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0021_sale_item_foreign_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(link_sales_to_inventory, restore_item_names),
+    ]
@@ -0,0 +1,36 @@
+from django.conf import settings
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0022_link_sales_to_inventory'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sale',
+            name='item',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='sales', to='members.inventory'),
+        ),
+        migrations.RemoveField(
+            model_name='sale',
+            name='item_name',
+        ),
+        migrations.AlterField(
+            model_name='sale',
+            name='member',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['item', 'purchase_date'], name='sale_item_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['member', 'purchase_date'], name='sale_member_date_idx'),
+        ),
+    ]
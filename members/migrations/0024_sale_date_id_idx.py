@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0023_sale_item_required'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['purchase_date', 'id'], name='sale_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:33
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0024_sale_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sale',
+            name='purchase_date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
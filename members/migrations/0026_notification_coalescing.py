@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:38
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_created_at(apps, schema_editor):
+    Notification = apps.get_model('members', 'Notification')
+    Notification.objects.update(last_seen_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0025_sale_purchase_date_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='last_seen_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(copy_created_at, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='notification',
+            name='occurrences',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='subject',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['type', 'subject', 'created_at'], name='notification_subject_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_read', False), models.Q(('subject', ''), _negated=True)), fields=('type', 'subject'), name='unique_open_notification'),
+        ),
+    ]
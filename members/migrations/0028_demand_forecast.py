@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:58
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0027_notification_inbox_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DemandForecast',
+            fields=[
+                ('inventory', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='forecast', serialize=False, to='members.inventory')),
+                ('model', models.CharField(max_length=50)),
+                ('daily_demand', models.FloatField(default=0)),
+                ('demand_deviation', models.FloatField(default=0)),
+                ('safety_stock', models.IntegerField(default=0)),
+                ('reorder_point', models.IntegerField(default=0)),
+                ('recommended_level', models.IntegerField(default=0)),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
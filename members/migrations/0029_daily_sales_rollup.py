@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def populate_rollup(apps, schema_editor):
+    DailySalesRollup = apps.get_model('members', 'DailySalesRollup')
+    Sale = apps.get_model('members', 'Sale')
+
+    rows = Sale.objects.annotate(date=TruncDate('purchase_date')).order_by().values('date', 'item_id', 'member_id').annotate(
+        quantity=Sum('purchase_quantity'),
+        revenue=Sum('total_price'),
+        sale_count=Count('id'),
+    )
+    DailySalesRollup.objects.bulk_create([DailySalesRollup(**row) for row in rows], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0028_demand_forecast'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('sale_count', models.IntegerField(default=0)),
+                ('item', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='members.inventory')),
+                ('member', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['member', 'date'], name='rollup_member_date_idx'), models.Index(fields=['date'], name='rollup_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('item', 'date', 'member'), name='unique_daily_sales')],
+            },
+        ),
+        migrations.RunPython(populate_rollup, migrations.RunPython.noop),
+    ]
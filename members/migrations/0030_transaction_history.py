@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def populate_monthly_totals(apps, schema_editor):
+    MonthlyTransactionTotal = apps.get_model('members', 'MonthlyTransactionTotal')
+    Transaction = apps.get_model('members', 'Transaction')
+
+    rows = Transaction.objects.annotate(month=TruncMonth('date', output_field=models.DateField())).order_by().values('user_id', 'month').annotate(
+        total=Sum('amount'),
+        transaction_count=Count('id'),
+    )
+    MonthlyTransactionTotal.objects.bulk_create([MonthlyTransactionTotal(**row) for row in rows], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0029_daily_sales_rollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyTransactionTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('transaction_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'date', 'id'], name='transaction_user_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='monthlytransactiontotal',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='monthly_transaction_totals', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='monthlytransactiontotal',
+            constraint=models.UniqueConstraint(fields=('user', 'month'), name='unique_monthly_transaction_total'),
+        ),
+        migrations.RunPython(populate_monthly_totals, migrations.RunPython.noop),
+    ]
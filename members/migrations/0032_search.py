@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:05
+
+from django.db import OperationalError, migrations, transaction
+
+# Search tables and indexes of members/search.py: FTS5 tables on SQLite filled from the existing names, trigram
+# indexes on PostgreSQL for the UPPER(name) LIKE queries Django writes for icontains.
+
+def create_search(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                schema_editor.execute(
+                    'CREATE VIRTUAL TABLE members_item_search USING fts5('
+                    "item_name, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+                )
+                schema_editor.execute(
+                    'CREATE VIRTUAL TABLE members_member_search USING fts5('
+                    "username, first_name, last_name, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+                )
+        except OperationalError:
+            # SQLite built without FTS5, searches fall back to LIKE queries
+            return
+        schema_editor.execute('INSERT INTO members_item_search (rowid, item_name) SELECT id, item_name FROM members_inventory')
+        schema_editor.execute(
+            'INSERT INTO members_member_search (rowid, username, first_name, last_name) '
+            'SELECT id, username, first_name, last_name FROM auth_user'
+        )
+
+    elif vendor == 'postgresql':
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        except Exception:
+            # Without the extension (or the right to create it) searches still work, only slower
+            return
+        for table, column in (
+            ('members_inventory', 'item_name'),
+            ('auth_user', 'username'),
+            ('auth_user', 'first_name'),
+            ('auth_user', 'last_name'),
+        ):
+            schema_editor.execute(
+                f'CREATE INDEX IF NOT EXISTS {table}_{column}_trgm_idx ON {table} USING gin (UPPER({column}::text) gin_trgm_ops)'
+            )
+
+
+def drop_search(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS members_item_search')
+        schema_editor.execute('DROP TABLE IF EXISTS members_member_search')
+    elif vendor == 'postgresql':
+        for index in ('members_inventory_item_name', 'auth_user_username', 'auth_user_first_name', 'auth_user_last_name'):
+            schema_editor.execute(f'DROP INDEX IF EXISTS {index}_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('members', '0031_bulk_sale_actions'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search, drop_search),
+    ]
@@ -1,8 +1,15 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
-from django.db.models import Sum, Avg
+from django.db.models import Count, Sum, F, Q
+from django.db.models.functions import TruncDate, TruncMonth
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from django.utils import timezone
+from .utils import chunks
 
 # Models to store the information for each user
 class Profile(models.Model):
@@ -53,17 +60,99 @@ class Transaction(models.Model):
     # Short description for transaction
     description = models.CharField(max_length=255)
 
+    class Meta:
+        indexes = [
+            # Serves a member's history newest first and keyset pages of it
+            models.Index(fields=['user', 'date', 'id'], name='transaction_user_date_idx'),
+        ]
+
     # String representing transaction model, shows username, amount, and date
     def __str__(self):
         return f"{self.user.username} - {self.amount} on {self.date}"
 
+
+class MonthlyTransactionTotal(models.Model):
+
+    # Transaction totals per member and month, kept in step with Transaction by the signal handlers below.
+    # Balances before a month are summed from these rows, so they cost the same however long the history is.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='monthly_transaction_totals', db_index=False)
+
+    # First day of the month in the current time zone
+    month = models.DateField()
+
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    transaction_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'month'], name='unique_monthly_transaction_total'),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} - {self.user_id}: {self.total}"
+
+    @classmethod
+    def apply_transactions(cls, changes):
+        """
+        Adds (user_id, date, amount, count) changes to the monthly totals, negative values take transactions out.
+        """
+
+        totals = defaultdict(lambda: [Decimal(0), 0])
+        for user_id, date, amount, count in changes:
+            total = totals[(user_id, timezone.localdate(date).replace(day=1))]
+            total[0] += Decimal(str(amount))
+            total[1] += count
+        totals = {key: total for key, total in totals.items() if any(total)}
+        if not totals:
+            return
+
+        with transaction.atomic():
+            existing = {}
+            for user_id in {user_id for user_id, month in totals}:
+                months = [month for key_user_id, month in totals if key_user_id == user_id]
+                rows = cls.objects.select_for_update().filter(user_id=user_id, month__in=months)
+                existing.update(((row.user_id, row.month), row) for row in rows)
+
+            changed, created = [], []
+            for (user_id, month), (amount, count) in totals.items():
+                row = existing.get((user_id, month))
+                if row:
+                    row.total += amount
+                    row.transaction_count += count
+                    changed.append(row)
+                elif count > 0:
+                    created.append(cls(user_id=user_id, month=month, total=amount, transaction_count=count))
+
+            cls.objects.bulk_update(changed, ['total', 'transaction_count'])
+            cls.objects.bulk_create(created)
+
+    @classmethod
+    def rebuild(cls, batch_size=5000):
+
+        # Replace every row with totals grouped from the Transaction table, months follow the current time zone
+        cls.objects.all().delete()
+        rows = Transaction.objects.annotate(month=TruncMonth('date', output_field=models.DateField())).order_by().values('user_id', 'month').annotate(
+            total=Sum('amount'),
+            transaction_count=Count('id'),
+        )
+        return len(cls.objects.bulk_create([cls(**row) for row in rows.iterator()], batch_size=batch_size))
+
+# Raised when a sale would take more stock than an inventory item has remaining
+class InsufficientStockError(Exception):
+
+    def __init__(self, item_id, available):
+        self.item_id = item_id
+        self.available = available
+        super().__init__(f"Only {available} remaining for inventory item {item_id}.")
+
+
 class Sale(models.Model):
 
-    # Link to member
-    member = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Link to member, indexed through the (member, purchase_date) index below
+    member = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
 
-    # Name of purchased item
-    item_name = models.CharField(max_length=255)
+    # Link to purchased inventory item, items with recorded sales cannot be deleted
+    item = models.ForeignKey('Inventory', on_delete=models.PROTECT, related_name='sales', db_index=False)
 
     # Number of items purchased
     purchase_quantity = models.IntegerField(default=1)
@@ -74,14 +163,32 @@ class Sale(models.Model):
     # Total cost of purchase
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
 
-    # Time of purchase
-    purchase_date = models.DateTimeField(auto_now_add=True)
+    # Time of purchase, defaults to now but can be set when importing past sales
+    purchase_date = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Per-item and per-member lookups become range scans ordered by date
+            models.Index(fields=['item', 'purchase_date'], name='sale_item_date_idx'),
+            models.Index(fields=['member', 'purchase_date'], name='sale_member_date_idx'),
+
+            # Newest-first keyset pages over all sales
+            models.Index(fields=['purchase_date', 'id'], name='sale_date_id_idx'),
+        ]
+
+    # Name of purchased item, kept for templates and exports
+    @property
+    def item_name(self):
+        return self.item.item_name
 
     def save(self, *args, **kwargs):
 
         #Calculate total price before saving
         self.total_price = self.purchase_quantity * self.price_per_unit
-        super().save(*args, **kwargs)
+
+        # The stock reservation in post_save rolls the write back if it fails
+        with transaction.atomic():
+            super().save(*args, **kwargs)
         
         
     def __str__(self):
@@ -91,42 +198,233 @@ class Sale(models.Model):
 
 class Inventory(models.Model):
     
+    # Running counters kept in sync with Sale rows by the signal handlers below, never written by save()
+    COUNTER_FIELDS = ('sale_count', 'total_purchase_quantity', 'total_sales_amount')
+
     item_name = models.CharField(max_length=255, unique=True)
     inventory_amount = models.IntegerField(default=1000)
     remaining_quantity = models.IntegerField(default=0)
     recommended_inventory_levels = models.IntegerField(default=0)
 
+    # Number of sales recorded for item
+    sale_count = models.IntegerField(default=0)
+
+    # Sum of purchase quantities across all sales of item
+    total_purchase_quantity = models.IntegerField(default=0)
+
+    # Sum of total prices across all sales of item
+    total_sales_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
     def __str__(self):
         return f"{self.item_name} - Inventory: {self.inventory_amount}, Remaining: {self.remaining_quantity}"
 
     def calculate_remaining_quantity(self):
 
-        # Calculate the total purchase quantity from related sales
-        total_purchase_quantity = Sale.objects.filter(item_name=self.item_name).aggregate(
-            total=models.Sum('purchase_quantity')
-        )['total'] or 0
-
-        # Calculate remaining quantity
-        self.remaining_quantity = self.inventory_amount - total_purchase_quantity
-
-    def calculate_recommended_level(self):
-        
-        # Calculate average sales for item
-        avg_sales = Sale.objects.filter(item_name=self.item_name).aggregate(
-            Avg('purchase_quantity')
-        )['purchase_quantity__avg'] or 0
-        
-        # Set recommended level as twice the average sale quantity
-        self.recommended_inventory_levels = int(avg_sales * 2) if avg_sales else 100
+        # Calculate remaining quantity from the running purchase quantity counter
+        self.remaining_quantity = self.inventory_amount - self.total_purchase_quantity
 
     def save(self, *args, **kwargs):
 
-        # Update remaining quantity and recommended levels before saving
+        # Update remaining quantity before saving, recommended levels come from members.forecasting
         self.calculate_remaining_quantity()
-        self.calculate_recommended_level()
+
+        # New items start at the level forecasting gives items without sales, until the next refresh
+        if self._state.adding and not self.recommended_inventory_levels:
+            self.recommended_inventory_levels = settings.FORECAST_DEFAULT_LEVEL
+
+        # Leave the counters alone on updates so a stale instance cannot overwrite concurrent increments
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+
+        # On updates remaining quantity is worked out in the UPDATE from the stored counter, so a sale recorded after
+        # the instance was loaded keeps its stock reserved
+        stored = not self._state.adding and 'remaining_quantity' in (kwargs.get('update_fields') or ())
+        if stored:
+            self.remaining_quantity = self.inventory_amount - F('total_purchase_quantity')
         super().save(*args, **kwargs)
+        if stored:
+            self.refresh_from_db(fields=['remaining_quantity', *self.COUNTER_FIELDS])
+
+    @classmethod
+    def apply_sale_delta(cls, item_id, quantity, amount, count, check_stock=False):
+
+        # Adjust the counters and derived columns in a single UPDATE, SET expressions read the pre-update row
+        total_purchase_quantity = F('total_purchase_quantity') + quantity
+        sale_count = F('sale_count') + count
+        inventory = cls.objects.filter(pk=item_id)
+
+        # Reserving stock only matches the row while enough is left, so concurrent sales cannot oversell
+        if check_stock and quantity > 0:
+            inventory = inventory.filter(remaining_quantity__gte=quantity)
+
+        return inventory.update(
+            sale_count=sale_count,
+            total_purchase_quantity=total_purchase_quantity,
+            total_sales_amount=F('total_sales_amount') + Decimal(str(amount)),
+            remaining_quantity=F('inventory_amount') - total_purchase_quantity,
+        )
     
 
+class DemandForecast(models.Model):
+
+    # Latest demand forecast of an inventory item, refreshed in bulk by members.forecasting
+    inventory = models.OneToOneField(Inventory, on_delete=models.CASCADE, primary_key=True, related_name='forecast')
+
+    # Forecasting model that produced the figures, see FORECAST_MODEL
+    model = models.CharField(max_length=50)
+
+    # Expected units sold per day and the standard deviation of daily demand
+    daily_demand = models.FloatField(default=0)
+    demand_deviation = models.FloatField(default=0)
+
+    # Units held against demand above the forecast, and the remaining quantity at which to reorder
+    safety_stock = models.IntegerField(default=0)
+    reorder_point = models.IntegerField(default=0)
+
+    # Stock to hold after a reorder, copied to Inventory.recommended_inventory_levels
+    recommended_level = models.IntegerField(default=0)
+
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.inventory.item_name} - {self.daily_demand:.2f} per day, reorder at {self.reorder_point}"
+
+
+class DailySalesRollup(models.Model):
+
+    # Sales totals per day, item and member, kept in step with Sale by the signal handlers below
+    date = models.DateField()
+    item = models.ForeignKey(Inventory, on_delete=models.CASCADE, related_name='daily_sales', db_index=False)
+    member = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+
+    # Units sold, revenue and number of sales on the day
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    sale_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # One row per day, item and member, also serves per-item lookups by date
+            models.UniqueConstraint(fields=['item', 'date', 'member'], name='unique_daily_sales'),
+        ]
+        indexes = [
+            models.Index(fields=['member', 'date'], name='rollup_member_date_idx'),
+            models.Index(fields=['date'], name='rollup_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.item_id} / {self.member_id}: {self.quantity} sold"
+
+    @classmethod
+    def apply_sales(cls, changes):
+        """
+        Adds (item_id, member_id, purchase_date, quantity, revenue, count) changes to the rollup, negative values take sales out.
+        The purchase date can also be a day in the current time zone, as grouped by TruncDate.
+        """
+
+        # Changes to the same day, item and member are merged first
+        totals = defaultdict(lambda: [0, Decimal(0), 0])
+        for item_id, member_id, purchase_date, quantity, revenue, count in changes:
+            day = timezone.localdate(purchase_date) if isinstance(purchase_date, datetime) else purchase_date
+            total = totals[(day, item_id, member_id)]
+            total[0] += quantity
+            total[1] += Decimal(str(revenue))
+            total[2] += count
+        totals = {key: total for key, total in totals.items() if any(total)}
+        if not totals:
+            return
+
+        # Existing rows of the affected items and days are locked and updated, missing ones created
+        dates = [date for date, item_id, member_id in totals]
+        with transaction.atomic():
+            existing = {}
+            for batch in chunks({item_id for date, item_id, member_id in totals}):
+                rows = cls.objects.select_for_update().filter(item_id__in=batch, date__gte=min(dates), date__lte=max(dates)).values_list(
+                    'date', 'item_id', 'member_id', 'quantity', 'revenue', 'sale_count'
+                )
+                existing.update(((date, item_id, member_id), values) for date, item_id, member_id, *values in rows)
+
+            rows = []
+            for key, (quantity, revenue, count) in totals.items():
+                date, item_id, member_id = key
+                if key in existing:
+                    previous_quantity, previous_revenue, previous_count = existing[key]
+                    quantity += previous_quantity
+                    revenue += previous_revenue
+                    count += previous_count
+                elif count <= 0:
+                    continue
+                rows.append(cls(date=date, item_id=item_id, member_id=member_id, quantity=quantity, revenue=revenue, sale_count=count))
+
+            # New totals of changed and created rows are written together, one upsert per batch instead of
+            # an UPDATE with a CASE per row
+            cls.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['item', 'date', 'member'],
+                update_fields=['quantity', 'revenue', 'sale_count'],
+            )
+
+    @classmethod
+    def rebuild(cls, batch_size=5000):
+
+        # Replace every row with totals grouped from the Sale table, days follow the current time zone
+        cls.objects.all().delete()
+        rows = Sale.objects.annotate(date=TruncDate('purchase_date')).order_by().values('date', 'item_id', 'member_id').annotate(
+            quantity=Sum('purchase_quantity'),
+            revenue=Sum('total_price'),
+            sale_count=Count('id'),
+        )
+
+        batch, count = [], 0
+        for row in rows.iterator():
+            batch.append(cls(**row))
+            if len(batch) >= batch_size:
+                cls.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        cls.objects.bulk_create(batch)
+        return count + len(batch)
+
+
+class BulkSaleAction(models.Model):
+
+    # A delete or reprice of every sale matching a set of filters, see members/bulk.py.
+    # Large actions run in the background and the row reports their progress, every action is kept as a record.
+    ACTIONS = [
+        ('delete', 'Delete'),
+        ('reprice', 'Reprice'),
+    ]
+
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    action = models.CharField(max_length=10, choices=ACTIONS)
+
+    # Form data of the filters and new price, validated again when the action runs
+    filters = models.JSONField(default=dict)
+
+    requested_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bulk_sale_actions')
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+
+    # Number of sales deleted or repriced, and why the action failed
+    affected = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_action_display()} sales ({self.get_status_display()}) by {self.requested_by_id}"
+
+
 class Notification(models.Model):
 
     NOTIFICATION_TYPES = [
@@ -141,25 +439,87 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     triggered_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
 
+    # What the notification is about (e.g. "item:12"), repeats of the same type and subject are merged into one row
+    subject = models.CharField(max_length=255, blank=True, default='')
+
+    # Number of times the rule fired for this notification and when it last did
+    occurrences = models.IntegerField(default=1)
+    last_seen_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            # At most one unread notification per type and subject
+            models.UniqueConstraint(
+                fields=['type', 'subject'],
+                condition=Q(is_read=False) & ~Q(subject=''),
+                name='unique_open_notification',
+            ),
+        ]
+        indexes = [
+            # Most recent notification for a type and subject, used for the cooldown check
+            models.Index(fields=['type', 'subject', 'created_at'], name='notification_subject_idx'),
+
+            # Unread inbox pages, newest first
+            models.Index(fields=['is_read', 'last_seen_at', 'id'], name='notification_inbox_idx'),
+        ]
+
     def __str__(self):
         return f"{self.get_type_display()} - {self.message[:50]}"
     
     
-@receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    if created:
-        Profile.objects.create(user=instance)
+@receiver(pre_save, sender=Sale)
+def remember_sale_values(sender, instance, **kwargs):
 
-@receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
+    # Keep the stored values of an existing sale so post_save can apply only the difference
+    instance._previous_values = None
+    if instance.pk and not instance._state.adding:
+        instance._previous_values = Sale.objects.filter(pk=instance.pk).values(
+            'item_id', 'member_id', 'purchase_quantity', 'total_price', 'purchase_date'
+        ).first()
 
 @receiver(post_save, sender=Sale)
-def create_or_update_inventory(sender, instance, **kwargs):
-
-    # Get or create the Inventory object based on the sale's item_name
-    inventory, created = Inventory.objects.get_or_create(item_name=instance.item_name)
-
-    # Save the inventory to trigger remaining quantity calculation
-    inventory.save()
-
+def create_or_update_inventory(sender, instance, created, **kwargs):
+
+    # Undo the previous values of an updated sale before counting the new ones
+    previous = getattr(instance, '_previous_values', None)
+    changes = [(instance.item_id, instance.member_id, instance.purchase_date, instance.purchase_quantity, instance.total_price, 1)]
+    if previous:
+        Inventory.apply_sale_delta(previous['item_id'], -previous['purchase_quantity'], -previous['total_price'], -1)
+        changes.append((
+            previous['item_id'], previous['member_id'], previous['purchase_date'], -previous['purchase_quantity'], -previous['total_price'], -1
+        ))
+
+    if not Inventory.apply_sale_delta(instance.item_id, instance.purchase_quantity, instance.total_price, 1, check_stock=True):
+        available = Inventory.objects.filter(pk=instance.item_id).values_list('remaining_quantity', flat=True).first() or 0
+        raise InsufficientStockError(instance.item_id, available)
+
+    DailySalesRollup.apply_sales(changes)
+
+@receiver(post_delete, sender=Sale)
+def remove_sale_from_inventory(sender, instance, **kwargs):
+
+    # Take the deleted sale out of the item's counters and daily totals
+    Inventory.apply_sale_delta(instance.item_id, -instance.purchase_quantity, -instance.total_price, -1)
+    DailySalesRollup.apply_sales([
+        (instance.item_id, instance.member_id, instance.purchase_date, -instance.purchase_quantity, -instance.total_price, -1)
+    ])
+
+@receiver(pre_save, sender=Transaction)
+def remember_transaction_values(sender, instance, **kwargs):
+
+    # Keep the stored values of an existing transaction so post_save can move its amount between months
+    instance._previous_values = None
+    if instance.pk and not instance._state.adding:
+        instance._previous_values = Transaction.objects.filter(pk=instance.pk).values('user_id', 'date', 'amount').first()
+
+@receiver(post_save, sender=Transaction)
+def add_transaction_to_monthly_totals(sender, instance, **kwargs):
+    changes = [(instance.user_id, instance.date, instance.amount, 1)]
+    previous = getattr(instance, '_previous_values', None)
+    if previous:
+        changes.append((previous['user_id'], previous['date'], -previous['amount'], -1))
+    MonthlyTransactionTotal.apply_transactions(changes)
+
+@receiver(post_delete, sender=Transaction)
+def remove_transaction_from_monthly_totals(sender, instance, **kwargs):
+    MonthlyTransactionTotal.apply_transactions([(instance.user_id, instance.date, -instance.amount, -1)])
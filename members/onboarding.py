@@ -0,0 +1,173 @@
+# members/onboarding.py
+
+import csv
+import io
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from .ingest import MAX_ERRORS
+from .models import Profile
+from . import search
+from .utils import chunks
+
+# Columns of an imported member, username and email are required and password is optional.
+# Members without a password get an unusable one and an invite link to choose their own.
+USER_FIELDS = ('username', 'email', 'first_name', 'last_name')
+
+PROFILE_FIELDS = ('address', 'phone_number', 'preferences', 'postcode', 'suburb', 'city')
+
+REQUIRED_FIELDS = ('username', 'email')
+
+class InviteTokenGenerator(PasswordResetTokenGenerator):
+    """
+    Invite tokens work like password reset tokens, choosing a password or logging in makes them invalid.
+    They expire after PASSWORD_RESET_TIMEOUT seconds.
+    """
+
+    key_salt = 'members.onboarding.InviteTokenGenerator'
+
+
+invite_tokens = InviteTokenGenerator()
+
+def read_members(file):
+    """
+    Reads member rows from an uploaded or opened CSV file with a header row.
+    """
+
+    try:
+        text = io.TextIOWrapper(file, encoding='utf-8-sig') if isinstance(file.read(0), bytes) else file
+        return list(csv.DictReader(text))
+    except (ValueError, csv.Error) as error:
+        raise ValidationError(f'Could not read the members: {error}')
+
+
+def clean_members(rows):
+    """
+    Validates raw member rows, raises ValidationError listing every bad row, duplicate and existing username.
+    """
+
+    errors = []
+    fields = {name: User._meta.get_field(name) for name in USER_FIELDS}
+    fields.update((name, Profile._meta.get_field(name)) for name in PROFILE_FIELDS)
+
+    usernames = {str(row.get('username') or '').strip() for row in rows}
+    existing = set()
+    for batch in chunks(usernames):
+        existing.update(User.objects.filter(username__in=batch).values_list('username', flat=True))
+
+    cleaned, seen = [], set()
+    for number, row in enumerate(rows, start=1):
+        if len(errors) >= MAX_ERRORS:
+            break
+
+        missing = [field for field in REQUIRED_FIELDS if not str(row.get(field) or '').strip()]
+        if missing:
+            errors.append(f'Row {number}: missing {", ".join(missing)}.')
+            continue
+
+        try:
+            # Model field validation enforces lengths, the username characters and the email format
+            values = {name: field.clean(str(row.get(name) or '').strip(), None) for name, field in fields.items()}
+        except ValidationError as error:
+            errors.append(f'Row {number}: {" ".join(error.messages)}')
+            continue
+
+        username = values['username']
+        if username in existing:
+            errors.append(f'Row {number}: username "{username}" is already taken.')
+        elif username in seen:
+            errors.append(f'Row {number}: username "{username}" appears more than once.')
+        else:
+            seen.add(username)
+            cleaned.append({**values, 'password': row.get('password') or None})
+
+    if errors:
+        raise ValidationError(errors)
+    return cleaned
+
+
+def hash_passwords(passwords, workers=1):
+    """
+    Hashes passwords across a pool of processes, hashing is CPU bound so threads would not run it in parallel.
+    Only the import_members command uses more than one worker, web requests must not fork their process.
+    """
+
+    if workers <= 1 or len(passwords) < 2:
+        return [make_password(password) for password in passwords]
+
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+
+def import_members(rows, batch_size=None, hash_workers=1, passwords=True):
+    """
+    Validates and creates members with their profiles in one transaction, returns the new users.
+    Passwords are hashed before the transaction starts so the database is not locked while they are.
+    With passwords=False the password column is ignored and every member is left to accept an invite.
+    """
+
+    cleaned = clean_members(rows)
+    if not cleaned:
+        return []
+    if not passwords:
+        cleaned = [{**row, 'password': None} for row in cleaned]
+
+    batch_size = batch_size or settings.MEMBER_IMPORT_BATCH_SIZE
+    hashed = iter(hash_passwords([row['password'] for row in cleaned if row['password']], hash_workers))
+
+    users = [
+        User(
+            password=next(hashed) if row['password'] else make_password(None),
+            **{name: row[name] for name in USER_FIELDS},
+        )
+        for row in cleaned
+    ]
+
+    with transaction.atomic():
+
+        # bulk_create skips the post_save receiver that creates profiles, so they are created alongside
+        User.objects.bulk_create(users, batch_size=batch_size)
+        if any(user.pk is None for user in users):
+            _load_primary_keys(users)
+        Profile.objects.bulk_create([
+            Profile(user=user, **{name: row[name] for name in ('first_name', 'last_name', *PROFILE_FIELDS)})
+            for user, row in zip(users, cleaned)
+        ], batch_size=batch_size)
+
+        # Nor does it send the signal that adds member names to the search table
+        search.index_members(users)
+
+    return users
+
+
+def _load_primary_keys(users):
+
+    # Backends that cannot return ids from a bulk insert leave them unset
+    ids = {}
+    for batch in chunks([user.username for user in users]):
+        ids.update(User.objects.filter(username__in=batch).values_list('username', 'pk'))
+    for user in users:
+        user.pk = ids[user.username]
+
+
+def invite_path(user):
+    """
+    Path of the page where an imported member chooses a password.
+    """
+
+    return reverse('accept_invite', args=[urlsafe_base64_encode(force_bytes(user.pk)), invite_tokens.make_token(user)])
+
+
+def invite_rows(users, base_url=''):
+
+    # Username, email and invite link of every member still without a usable password
+    for user in users:
+        if not user.has_usable_password():
+            yield user.username, user.email, base_url.rstrip('/') + invite_path(user)
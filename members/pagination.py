@@ -0,0 +1,94 @@
+# members/pagination.py
+
+import base64
+import json
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+class KeysetPage:
+    """
+    One page of a keyset paginated queryset, with the cursor of the next page.
+    """
+
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(values):
+
+    # Cursor is the url safe base64 of the last row's ordering values
+    raw = json.dumps([str(value) for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(model, fields, cursor):
+
+    # Invalid cursors start again from the first page
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw_values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        if len(raw_values) != len(fields):
+            return None
+        return [model._meta.get_field(name).to_python(value) for name, value in zip(fields, raw_values)]
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+def get_bounded_int(request, name, default, maximum):
+
+    # Positive integer query parameter, invalid values fall back to the default and large ones to the maximum
+    try:
+        value = int(request.GET.get(name, default))
+    except (TypeError, ValueError):
+        value = default
+    return max(1, min(value, maximum))
+
+
+def get_page_size(request, default, maximum):
+
+    # Page size can be requested through the query string but never above the maximum
+    return get_bounded_int(request, 'page_size', default, maximum)
+
+
+def paginate_keyset(queryset, fields, cursor=None, page_size=50):
+    """
+    Returns the page of rows that follow the cursor, newest first, ordered by the given fields.
+    The last field must be unique so that every row has a distinct position.
+    """
+
+    queryset = queryset.order_by(*[f'-{name}' for name in fields])
+
+    values = decode_cursor(queryset.model, fields, cursor) if cursor else None
+    if values:
+
+        # Rows strictly after the cursor in descending (fields) order
+        condition = Q()
+        for index, name in enumerate(fields):
+            step = Q(**{f'{name}__lt': values[index]})
+            for previous_name, previous_value in zip(fields[:index], values[:index]):
+                step &= Q(**{previous_name: previous_value})
+            condition |= step
+        queryset = queryset.filter(condition)
+
+    # Fetch one extra row to know whether another page exists
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor([
+            last[name] if isinstance(last, dict) else getattr(last, name) for name in fields
+        ])
+
+    return KeysetPage(items, next_cursor)
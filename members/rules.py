@@ -0,0 +1,266 @@
+# members/rules.py
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import timedelta
+from functools import lru_cache
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import DailySalesRollup, Inventory, Notification
+from .utils import chunks
+
+logger = logging.getLogger(__name__)
+
+# Events are small snapshots of what happened, rules load anything else they need when evaluated
+
+@dataclass(frozen=True)
+class SaleEvent:
+
+    # 'recorded' for new sales, 'updated' for edited ones
+    action: str
+    item_id: int
+    item_name: str
+    purchase_quantity: int
+    member_id: int
+    member_username: str
+
+    # User whose request caused the event
+    triggered_by_id: int = None
+    triggered_by_username: str = ''
+
+
+@dataclass(frozen=True)
+class InventoryEvent:
+
+    item_id: int
+    item_name: str
+    triggered_by_id: int = None
+
+
+class Rule:
+    """
+    Base class of the notification rules, subclasses list the events they handle and build unsaved Notifications.
+    """
+
+    notification_type = None
+    event_types = ()
+
+    # Seconds after a notification is raised during which repeats never open a new one, see NOTIFICATION_COOLDOWNS
+    cooldown = 0
+
+    def get_cooldown(self):
+        return timedelta(seconds=settings.NOTIFICATION_COOLDOWNS.get(self.notification_type, self.cooldown))
+
+    def applies_to(self, event):
+        return isinstance(event, self.event_types)
+
+    def evaluate(self, events):
+
+        # Rules that need no database access check each event on its own
+        for event in events:
+            notification = self.check(event)
+            if notification:
+                yield notification
+
+    def check(self, event):
+        return None
+
+
+class HighPurchaseQuantityRule(Rule):
+
+    notification_type = 'high_purchase_quantity'
+    event_types = (SaleEvent,)
+    minimum = 100
+    maximum = 1000
+
+    def check(self, event):
+        if not self.minimum <= event.purchase_quantity <= self.maximum:
+            return None
+
+        if event.action == 'updated':
+            return Notification(
+                type=self.notification_type,
+                subject=f'member:{event.member_id}:item:{event.item_id}',
+                message=f"{event.triggered_by_username} updated purchase quantity to a high value of {event.purchase_quantity} for {event.item_name}.",
+                triggered_by_id=event.triggered_by_id,
+            )
+
+        return Notification(
+            type=self.notification_type,
+            subject=f'member:{event.member_id}:item:{event.item_id}',
+            message=f"{event.member_username} recorded a high purchase quantity of {event.purchase_quantity} for {event.item_name}. Verification is required.",
+            triggered_by_id=event.member_id,
+        )
+
+
+class HighSalesAmountRule(Rule):
+
+    notification_type = 'high_sales_amount'
+    event_types = (SaleEvent,)
+    limit = 100000
+
+    def evaluate(self, events):
+
+        # One grouped query over the daily totals for every member and item pair with newly recorded sales
+        pairs = {(event.member_id, event.item_id): event for event in events if event.action == 'recorded'}
+        if not pairs:
+            return
+
+        item_ids = {item_id for member_id, item_id in pairs}
+        totals = []
+        for batch in chunks(item_ids):
+            totals.extend(DailySalesRollup.objects.filter(item_id__in=batch).order_by().values('member_id', 'item_id').annotate(
+                total=Sum('revenue')
+            ).filter(total__gt=self.limit))
+
+        for total in totals:
+            event = pairs.get((total['member_id'], total['item_id']))
+            if not event:
+                continue
+            yield Notification(
+                type=self.notification_type,
+                subject=f'member:{event.member_id}:item:{event.item_id}',
+                message=f"{event.member_username} has exceeded a sales total of {self.limit:,} for {event.item_name}. Verification is required.",
+                triggered_by_id=event.member_id,
+            )
+
+
+class LowInventoryRule(Rule):
+
+    notification_type = 'low_inventory'
+    event_types = (SaleEvent, InventoryEvent)
+    threshold = 50
+
+    def applies_to(self, event):
+
+        # Editing an existing sale does not raise low inventory alerts
+        return super().applies_to(event) and getattr(event, 'action', 'recorded') == 'recorded'
+
+    def evaluate(self, events):
+
+        # Remaining quantities are read once for every item in the batch
+        triggered_by = {event.item_id: event.triggered_by_id for event in events}
+        for batch in chunks(triggered_by):
+            low_items = Inventory.objects.filter(pk__in=batch, remaining_quantity__lte=self.threshold)
+
+            for item in low_items.only('item_name', 'remaining_quantity'):
+                yield Notification(
+                    type=self.notification_type,
+                    subject=f'item:{item.pk}',
+                    message=f"Inventory for {item.item_name} is low: {item.remaining_quantity} remaining.",
+                    triggered_by_id=triggered_by[item.pk],
+                )
+
+
+@lru_cache(maxsize=None)
+def load_rules(paths):
+    return [import_string(path)() for path in paths]
+
+
+def get_rules():
+    return load_rules(tuple(settings.NOTIFICATION_RULES))
+
+
+def evaluate(events):
+    """
+    Runs every configured rule over a batch of events and saves the resulting notifications.
+    """
+
+    notifications = []
+    for rule in get_rules():
+        matching = [event for event in events if rule.applies_to(event)]
+        if matching:
+            notifications.extend(save_coalesced(rule, list(rule.evaluate(matching))))
+    return notifications
+
+
+def save_coalesced(rule, notifications):
+    """
+    Saves a rule's notifications with one open row per subject: repeats bump the unread notification's counter,
+    and within the rule's cooldown they are counted on the latest notification even if it was already read.
+    Returns the notifications that were newly created.
+    """
+
+    # Repeats within the batch collapse first, the latest message wins
+    grouped = {}
+    for notification in notifications:
+        key = notification.subject or object()
+        if key in grouped:
+            grouped[key].occurrences += 1
+            grouped[key].message = notification.message
+            grouped[key].triggered_by_id = notification.triggered_by_id
+        else:
+            grouped[key] = notification
+
+    now = timezone.now()
+    cooldown_start = now - rule.get_cooldown()
+    created = []
+    for notification in grouped.values():
+        notification.last_seen_at = now
+        if notification.subject and _bump(notification, cooldown_start):
+            continue
+        try:
+            with transaction.atomic():
+                notification.save()
+            created.append(notification)
+        except IntegrityError:
+
+            # Another worker opened the same notification first
+            _bump(notification, cooldown_start)
+    return created
+
+
+def _bump(notification, cooldown_start):
+
+    # Count the repeat on the open notification, or on the latest one while the cooldown lasts
+    same_subject = Notification.objects.filter(type=notification.type, subject=notification.subject)
+    changes = {
+        'occurrences': F('occurrences') + notification.occurrences,
+        'last_seen_at': notification.last_seen_at,
+        'message': notification.message,
+        'triggered_by_id': notification.triggered_by_id,
+    }
+    if same_subject.filter(is_read=False).update(**changes):
+        return True
+
+    latest = same_subject.filter(created_at__gte=cooldown_start).order_by('-created_at').values_list('pk', flat=True).first()
+    return bool(latest and Notification.objects.filter(pk=latest).update(**changes))
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(max_workers=settings.NOTIFICATION_WORKERS, thread_name_prefix='notification-rules')
+
+
+def _run(events):
+
+    # Worker threads keep their own connections, drop any that went stale between tasks
+    close_old_connections()
+    try:
+        evaluate(events)
+    except Exception:
+        logger.exception('Evaluating notification rules failed for %d events', len(events))
+    finally:
+        close_old_connections()
+
+
+def publish(*events):
+    """
+    Queues events for rule evaluation once the current transaction commits, so requests do not wait on the rules.
+    """
+
+    events = list(events)
+    if not events:
+        return
+
+    def submit():
+        if settings.NOTIFICATION_RULES_ASYNC:
+            get_executor().submit(_run, events)
+        else:
+            evaluate(events)
+
+    transaction.on_commit(submit)
@@ -0,0 +1,195 @@
+# members/search.py
+
+import re
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from .models import Inventory
+from .utils import chunks
+
+# Name search over inventory items and members, behind the typeahead and the sales history and inventory filters.
+# On SQLite the names are copied into FTS5 tables, kept in step by the signal handlers in members/signals.py and
+# searched by word prefix. Other backends match every word anywhere in the names, PostgreSQL with trigram indexes.
+# Sales are never indexed themselves, they are found through their matching items and members with Sale's indexes.
+
+ITEM_TABLE = 'members_item_search'
+
+MEMBER_TABLE = 'members_member_search'
+
+MEMBER_FIELDS = ('username', 'first_name', 'last_name')
+
+# Words of a query, quotes and FTS5 operators are dropped, and extra words are ignored
+WORD = re.compile(r'\w+')
+
+MAX_WORDS = 8
+
+def words(query):
+    return WORD.findall(query or '')[:MAX_WORDS]
+
+
+# Databases already seen with the FTS5 tables, a missing table is checked again on every call so the tables are
+# picked up as soon as the migration creates them
+FTS_DATABASES = set()
+
+def uses_fts():
+    """
+    True when the FTS5 tables exist on the database, the migration skips them where SQLite lacks FTS5.
+    """
+
+    if connection.vendor != 'sqlite':
+        return False
+    name = str(connection.settings_dict['NAME'])
+    if name not in FTS_DATABASES and _has_fts_tables():
+        FTS_DATABASES.add(name)
+    return name in FTS_DATABASES
+
+
+def _has_fts_tables():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT COUNT(*) FROM sqlite_master WHERE name IN (%s, %s)', [ITEM_TABLE, MEMBER_TABLE])
+        return cursor.fetchone()[0] == 2
+
+
+def _match(query):
+
+    # Every word must start a word of the name, e.g. "choc mil" finds "Chocolate Milk"
+    return ' '.join(f'"{word}"*' for word in words(query))
+
+
+def _contains(fields, query):
+
+    # Every word must appear in one of the fields
+    condition = Q()
+    for word in words(query):
+        condition &= Q(*[Q(**{f'{field}__icontains': word}) for field in fields], _connector=Q.OR)
+    return condition
+
+
+def item_ids(query):
+    """
+    Subquery of the ids of the inventory items matching the query, for item_id__in and pk__in filters.
+    """
+
+    if uses_fts():
+        return RawSQL(f'SELECT rowid FROM {ITEM_TABLE} WHERE {ITEM_TABLE} MATCH %s', [_match(query)])
+    return Inventory.objects.filter(_contains(['item_name'], query)).values('pk')
+
+
+def member_ids(query):
+    """
+    Subquery of the ids of the members whose username or names match the query.
+    """
+
+    if uses_fts():
+        return RawSQL(f'SELECT rowid FROM {MEMBER_TABLE} WHERE {MEMBER_TABLE} MATCH %s', [_match(query)])
+    return User.objects.filter(_contains(MEMBER_FIELDS, query)).values('pk')
+
+
+def suggest_items(query, limit):
+    """
+    Best matching items as {'id', 'item_name'}, for the typeahead.
+    """
+
+    if not words(query):
+        return []
+    if uses_fts():
+        return _suggest(ITEM_TABLE, ['id', 'item_name'], query, limit)
+
+    # Names starting with the query come first, then the rest alphabetically
+    return list(Inventory.objects.filter(_contains(['item_name'], query)).annotate(
+        position=Case(When(item_name__istartswith=query.strip(), then=Value(0)), default=Value(1), output_field=IntegerField())
+    ).order_by('position', 'item_name').values('id', 'item_name')[:limit])
+
+
+def suggest_members(query, limit):
+    """
+    Best matching members as {'id', 'username', 'first_name', 'last_name'}, for the typeahead.
+    """
+
+    if not words(query):
+        return []
+    if uses_fts():
+        return _suggest(MEMBER_TABLE, ['id', *MEMBER_FIELDS], query, limit)
+
+    return list(User.objects.filter(_contains(MEMBER_FIELDS, query)).annotate(
+        position=Case(When(username__istartswith=query.strip(), then=Value(0)), default=Value(1), output_field=IntegerField())
+    ).order_by('position', 'username').values('id', *MEMBER_FIELDS)[:limit])
+
+
+def _suggest(table, fields, query, limit):
+
+    # Names are read from the FTS table itself, best bm25 rank first
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid, {", ".join(fields[1:])} FROM {table} WHERE {table} MATCH %s ORDER BY rank LIMIT %s', [_match(query), limit]
+        )
+        return [dict(zip(fields, row)) for row in cursor.fetchall()]
+
+
+def index_items(items, replace=True):
+    """
+    Adds or replaces the names of inventory items in the search table.
+    """
+
+    _index(ITEM_TABLE, ['item_name'], [(item.pk, item.item_name) for item in items], replace)
+
+
+def index_members(users, replace=True):
+    _index(MEMBER_TABLE, list(MEMBER_FIELDS), [(user.pk, *(getattr(user, field) for field in MEMBER_FIELDS)) for user in users], replace)
+
+
+def remove_items(ids):
+    _remove(ITEM_TABLE, ids)
+
+
+def remove_members(ids):
+    _remove(MEMBER_TABLE, ids)
+
+
+def _index(table, fields, rows, replace):
+    if not rows or not uses_fts():
+        return
+
+    # FTS5 tables have no unique key besides the rowid, so rows are replaced by deleting them first
+    if replace:
+        _remove(table, [row[0] for row in rows])
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {table} (rowid, {", ".join(fields)}) VALUES (%s{", %s" * len(fields)})', rows
+        )
+
+
+def _remove(table, ids):
+    if not uses_fts():
+        return
+
+    with connection.cursor() as cursor:
+        for batch in chunks(list(ids)):
+            cursor.execute(f'DELETE FROM {table} WHERE rowid IN ({", ".join(["%s"] * len(batch))})', batch)
+
+
+def rebuild(batch_size=5000):
+    """
+    Fills the search tables again from every inventory item and member, returns the number of each indexed.
+    """
+
+    if not uses_fts():
+        return 0, 0
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {ITEM_TABLE}')
+        cursor.execute(f'DELETE FROM {MEMBER_TABLE}')
+
+    counts = []
+    for model, fields, index in ((Inventory, ['item_name'], index_items), (User, MEMBER_FIELDS, index_members)):
+        batch, count = [], 0
+        for row in model.objects.only(*fields).iterator(chunk_size=batch_size):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                index(batch, replace=False)
+                count += len(batch)
+                batch = []
+        index(batch, replace=False)
+        counts.append(count + len(batch))
+    return tuple(counts)
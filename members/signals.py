@@ -1,13 +1,86 @@
 # members/signals.py
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from .models import Profile
+from .models import Profile, Sale, Inventory
+from . import aggregates, analytics, search
 
 @receiver(post_save, sender=User)
-def create_or_update_user_profile(sender, instance, created, **kwargs):
+def create_or_update_user_profile(sender, instance, created, raw=False, update_fields=None, **kwargs):
     """
-    Creates or updates the Profile associated with the User.
+    Creates the Profile of a new User, and afterwards copies the user's names onto it when they change.
+    Saves that cannot change the names, such as the last_login update on every login, run no profile query.
     """
-    Profile.objects.get_or_create(user=instance)
+
+    # Fixtures carry their own profile rows
+    if raw:
+        return
+
+    if created:
+        Profile.objects.create(user=instance, first_name=instance.first_name, last_name=instance.last_name)
+        return
+
+    if update_fields is not None and not {'first_name', 'last_name'} & set(update_fields):
+        return
+
+    # The UPDATE only matches, and writes, a profile whose names differ
+    names = {'first_name': instance.first_name, 'last_name': instance.last_name}
+    Profile.objects.filter(user=instance).exclude(**names).update(**names)
+
+    # Keep an already loaded profile in step so saving it later does not put the old names back
+    profile = instance._state.fields_cache.get('profile')
+    if profile is not None:
+        for name, value in names.items():
+            setattr(profile, name, value)
+
+@receiver([post_save, post_delete], sender=Sale)
+@receiver([post_save, post_delete], sender=Inventory)
+def invalidate_dashboard(sender, **kwargs):
+    """
+    Drops the cached dashboard figures once a sale or inventory write commits.
+    """
+    analytics.invalidate_on_commit()
+
+@receiver([post_save, post_delete], sender=Sale)
+def invalidate_sale_aggregates(sender, instance, **kwargs):
+    """
+    Drops the cached figures of the sale's item, and of the item it was moved from, once the write commits.
+    """
+    previous = getattr(instance, '_previous_values', None) or {}
+    aggregates.invalidate_on_commit({instance.item_id, previous.get('item_id', instance.item_id)})
+
+@receiver([post_save, post_delete], sender=Inventory)
+def invalidate_inventory_aggregates(sender, instance, **kwargs):
+    aggregates.invalidate_on_commit([instance.pk])
+
+
+@receiver(pre_save, sender=Inventory)
+def remember_inventory_name(sender, instance, update_fields=None, **kwargs):
+
+    # Keep the stored name of an existing item so post_save only indexes it again when it changes
+    instance._previous_item_name = None
+    if not instance._state.adding and (update_fields is None or 'item_name' in update_fields):
+        instance._previous_item_name = Inventory.objects.filter(pk=instance.pk).values_list('item_name', flat=True).first()
+
+@receiver(post_save, sender=Inventory)
+def index_inventory_name(sender, instance, created, update_fields=None, **kwargs):
+
+    # Stock edits and other saves that leave the name alone do not touch the search table
+    if not created and getattr(instance, '_previous_item_name', None) in (None, instance.item_name):
+        return
+    search.index_items([instance])
+
+@receiver(post_delete, sender=Inventory)
+def remove_inventory_name(sender, instance, **kwargs):
+    search.remove_items([instance.pk])
+
+@receiver(post_save, sender=User)
+def index_member_names(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not set(search.MEMBER_FIELDS) & set(update_fields):
+        return
+    search.index_members([instance])
+
+@receiver(post_delete, sender=User)
+def remove_member_names(sender, instance, **kwargs):
+    search.remove_members([instance.pk])
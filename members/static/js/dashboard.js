@@ -0,0 +1,47 @@
+// Fill the dashboard analytics panels from the cached JSON endpoints
+document.addEventListener("DOMContentLoaded", function () {
+    const panels = document.getElementById("sales-analytics");
+    if (!panels) {
+        return;
+    }
+
+    // Render rows of values into a table body
+    const fillTable = (id, rows, columns) => {
+        const body = document.getElementById(id);
+        body.innerHTML = "";
+        rows.forEach(function (row) {
+            const tr = document.createElement("tr");
+            columns.forEach(function (column) {
+                const td = document.createElement("td");
+                td.textContent = row[column];
+                tr.appendChild(td);
+            });
+            body.appendChild(tr);
+        });
+    };
+
+    const load = (url) => fetch(url, { credentials: "same-origin" }).then((response) => response.json());
+
+    load(panels.dataset.revenueUrl).then(function (data) {
+
+        // Revenue bars are scaled to the best day in the period
+        const best = Math.max(1, ...data.series.map((day) => Number(day.revenue)));
+        fillTable("revenue-rows", data.series.map(function (day) {
+            return { date: day.date, revenue: day.revenue, sales: day.sales, bar: "█".repeat(Math.round(20 * Number(day.revenue) / best)) };
+        }), ["date", "revenue", "sales", "bar"]);
+    });
+
+    load(panels.dataset.topItemsUrl).then(function (data) {
+        fillTable("top-item-rows", data.items, ["item_name", "quantity", "revenue"]);
+    });
+
+    load(panels.dataset.topMembersUrl).then(function (data) {
+        fillTable("top-member-rows", data.members, ["username", "sales", "revenue"]);
+    });
+
+    load(panels.dataset.lowStockUrl).then(function (data) {
+        document.getElementById("low-stock-count").textContent = data.low;
+        document.getElementById("below-recommended-count").textContent = data.below_recommended;
+        document.getElementById("low-stock-threshold").textContent = data.threshold;
+    });
+});
@@ -0,0 +1,36 @@
+// Suggest item and member names in the search boxes from the typeahead endpoint
+document.addEventListener("DOMContentLoaded", function () {
+    document.querySelectorAll("input[data-suggestions-url]").forEach(function (input) {
+        const list = document.getElementById(input.getAttribute("list"));
+        let timer = null;
+        let latest = 0;
+
+        input.addEventListener("input", function () {
+            clearTimeout(timer);
+            const query = input.value.trim();
+            if (query.length < 2) {
+                list.innerHTML = "";
+                return;
+            }
+
+            // Wait for a pause in typing, and drop answers to queries that have been typed over since
+            timer = setTimeout(function () {
+                const request = ++latest;
+                fetch(input.dataset.suggestionsUrl + "?q=" + encodeURIComponent(query), { credentials: "same-origin" })
+                    .then((response) => response.json())
+                    .then(function (data) {
+                        if (request !== latest) {
+                            return;
+                        }
+                        const names = data.items.map((item) => item.item_name).concat((data.members || []).map((member) => member.username));
+                        list.innerHTML = "";
+                        names.forEach(function (name) {
+                            const option = document.createElement("option");
+                            option.value = name;
+                            list.appendChild(option);
+                        });
+                    });
+            }, 150);
+        });
+    });
+});
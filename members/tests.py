@@ -1,6 +1,27 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
-from .models import Profile, Transaction
+from django.db import OperationalError, connection, transaction
+from django.db.models import Sum
+from django.urls import reverse
+from django.utils import timezone
+import numpy as np
+from . import aggregates, forecasting, ingest, instrumentation, onboarding, rules, search
+from .models import Profile, Transaction, Sale, Inventory, Notification, InsufficientStockError, DemandForecast, DailySalesRollup, MonthlyTransactionTotal, BulkSaleAction
 
 class MemberDatabaseIntegrationTests(TestCase):
 
@@ -28,3 +49,1296 @@ class MemberDatabaseIntegrationTests(TestCase):
         self.assertEqual(transaction.amount, 100)
         self.assertEqual(transaction.description, "Test transaction")
         self.assertEqual(transaction.user.username, 'testuser')
+
+
+def create_sale(member, item_name, purchase_quantity, price_per_unit):
+    # Record a sale against the named inventory item, creating the item if needed
+    item, created = Inventory.objects.get_or_create(item_name=item_name)
+    return Sale.objects.create(member=member, item=item, purchase_quantity=purchase_quantity, price_per_unit=price_per_unit)
+
+
+def create_sale_on(member, item_name, purchase_quantity, day):
+    # Record a sale at midday of the given date
+    sale = create_sale(member, item_name, purchase_quantity, 1)
+    sale.purchase_date = timezone.make_aware(datetime.combine(day, datetime.min.time()) + timedelta(hours=12))
+    sale.save()
+    return sale
+
+
+class InventoryListQueryTests(TestCase):
+
+    def setUp(self):
+        aggregates.get_cache().clear()
+        self.user = User.objects.create_user(username='staff', password='password')
+        self.client.force_login(self.user)
+
+    def create_sales(self, item_name, quantities, price_per_unit):
+        for quantity in quantities:
+            create_sale(self.user, item_name, quantity, price_per_unit)
+
+    def test_inventory_list_annotates_sales_totals(self):
+        # Latest sale price and summed quantity are shown per item, items without sales default to 0
+        self.create_sales('Apples', [2, 3], 1.50)
+        self.create_sales('Apples', [1], 2.00)
+        Inventory.objects.create(item_name='Pears')
+
+        response = self.client.get(reverse('inventory_list'))
+        inventories = {inventory.item_name: inventory for inventory in response.context['inventories']}
+
+        self.assertEqual(inventories['Apples'].total_purchase_quantity, 6)
+        self.assertEqual(inventories['Apples'].price_per_unit, Decimal('2.00'))
+        self.assertEqual(inventories['Pears'].total_purchase_quantity, 0)
+        self.assertIsNone(inventories['Pears'].price_per_unit)
+
+    def test_inventory_list_query_count_is_constant(self):
+        # The number of queries must not grow with the number of inventory items
+        self.create_sales('Item 0', [1], 1)
+        with CaptureQueriesContext(connection) as few_items:
+            self.client.get(reverse('inventory_list'))
+
+        for index in range(1, 20):
+            self.create_sales(f'Item {index}', [1, 2], 1)
+        with CaptureQueriesContext(connection) as many_items:
+            self.client.get(reverse('inventory_list'))
+
+        self.assertEqual(len(few_items), len(many_items))
+
+
+class InventoryCounterTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='staff', password='password')
+
+    def test_counters_follow_sale_create_update_and_delete(self):
+        sale = create_sale(self.user, 'Milk', 4, Decimal('2.50'))
+        create_sale(self.user, 'Milk', 2, Decimal('2.50'))
+
+        inventory = Inventory.objects.get(item_name='Milk')
+        self.assertEqual((inventory.sale_count, inventory.total_purchase_quantity), (2, 6))
+        self.assertEqual(inventory.total_sales_amount, Decimal('15.00'))
+        self.assertEqual(inventory.remaining_quantity, 994)
+
+        # Moving a sale to another item takes it out of the old item's counters
+        sale.item = Inventory.objects.create(item_name='Bread')
+        sale.save()
+        inventory.refresh_from_db()
+        self.assertEqual((inventory.sale_count, inventory.total_purchase_quantity), (1, 2))
+        self.assertEqual(Inventory.objects.get(item_name='Bread').total_purchase_quantity, 4)
+
+        sale.delete()
+        bread = Inventory.objects.get(item_name='Bread')
+        self.assertEqual((bread.sale_count, bread.total_purchase_quantity, bread.remaining_quantity), (0, 0, 1000))
+
+    def test_saving_stale_inventory_keeps_counters(self):
+        inventory = Inventory.objects.create(item_name='Eggs')
+        create_sale(self.user, 'Eggs', 3, 1)
+
+        # The instance loaded before the sale must not overwrite the counters
+        inventory.inventory_amount = 500
+        inventory.save()
+        inventory.refresh_from_db()
+        self.assertEqual(inventory.total_purchase_quantity, 3)
+        self.assertEqual(inventory.remaining_quantity, 497)
+
+    def test_saving_stale_inventory_keeps_stock_reserved(self):
+        inventory = Inventory.objects.create(item_name='Flour', inventory_amount=10)
+        Inventory.apply_sale_delta(inventory.pk, 8, 8, 1, check_stock=True)
+
+        # The instance loaded before the sale must not give its stock back, so a later oversell is still refused
+        inventory.save()
+        self.assertEqual(inventory.remaining_quantity, 2)
+        self.assertEqual(Inventory.apply_sale_delta(inventory.pk, 10, 10, 1, check_stock=True), 0)
+        self.assertEqual(Inventory.objects.get(pk=inventory.pk).remaining_quantity, 2)
+
+    def test_rebuild_command_repairs_drifted_counters(self):
+        create_sale(self.user, 'Tea', 5, 1)
+        Inventory.objects.filter(item_name='Tea').update(sale_count=9, total_purchase_quantity=99, remaining_quantity=0)
+        tea = Inventory.objects.get(item_name='Tea')
+        aggregates.get_cache().clear()
+        self.assertEqual(aggregates.get_items([tea.pk])[tea.pk]['total_sold'], 99)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_inventory_counters', stdout=StringIO())
+
+        inventory = Inventory.objects.get(item_name='Tea')
+        self.assertEqual((inventory.sale_count, inventory.total_purchase_quantity, inventory.remaining_quantity), (1, 5, 995))
+
+        # Cached figures of the repaired items are dropped
+        self.assertEqual(aggregates.get_items([tea.pk])[tea.pk]['total_sold'], 5)
+
+
+class DailySalesRollupTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='staff', password='password')
+        self.other = User.objects.create_user(username='other', password='password')
+        self.today = timezone.localdate()
+
+    def rollup(self):
+        return sorted(DailySalesRollup.objects.filter(sale_count__gt=0).values_list(
+            'date', 'item__item_name', 'member__username', 'quantity', 'revenue', 'sale_count'
+        ))
+
+    def test_rollup_follows_sale_create_update_and_delete(self):
+        yesterday = self.today - timedelta(days=1)
+        sale = create_sale_on(self.user, 'Milk', 2, yesterday)
+        create_sale_on(self.user, 'Milk', 3, yesterday)
+        self.assertEqual(self.rollup(), [(yesterday, 'Milk', 'staff', 5, Decimal('5.00'), 2)])
+
+        # Moving a sale to another day and member takes it out of the old row
+        sale.member = self.other
+        sale.purchase_date += timedelta(days=1)
+        sale.purchase_quantity = 4
+        sale.save()
+        self.assertEqual(self.rollup(), [
+            (yesterday, 'Milk', 'staff', 3, Decimal('3.00'), 1),
+            (self.today, 'Milk', 'other', 4, Decimal('4.00'), 1),
+        ])
+
+        sale.delete()
+        self.assertEqual(self.rollup(), [(yesterday, 'Milk', 'staff', 3, Decimal('3.00'), 1)])
+
+    def test_import_and_rebuild_agree(self):
+        rows = [
+            {'member': 'staff', 'item_name': 'Tea', 'purchase_quantity': 1, 'price_per_unit': '4.00', 'purchase_date': '2024-03-01T09:00:00'},
+            {'member': 'staff', 'item_name': 'Tea', 'purchase_quantity': 2, 'price_per_unit': '4.00', 'purchase_date': '2024-03-01T18:00:00'},
+            {'member': 'other', 'item_name': 'Tea', 'purchase_quantity': 1, 'price_per_unit': '4.00', 'purchase_date': '2024-03-02T09:00:00'},
+        ]
+        ingest.import_sales(rows)
+        imported = self.rollup()
+        self.assertEqual(len(imported), 2)
+
+        DailySalesRollup.objects.update(quantity=0)
+        call_command('rebuild_sales_rollup', stdout=StringIO())
+        self.assertEqual(self.rollup(), imported)
+
+    def test_high_sales_amount_rule_reads_rollup(self):
+        sale = create_sale(self.user, 'Gold', 2, 60000)
+        event = rules.SaleEvent('recorded', sale.item_id, 'Gold', 2, self.user.pk, 'staff')
+
+        with CaptureQueriesContext(connection) as queries:
+            notifications = list(rules.HighSalesAmountRule().evaluate([event]))
+
+        self.assertEqual(len(notifications), 1)
+        self.assertFalse([query for query in queries if 'FROM "members_sale"' in query['sql']])
+
+
+class SaleItemForeignKeyTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='staff', password='password')
+        self.client.force_login(self.user)
+
+    def test_record_sale_links_sale_to_inventory(self):
+        self.client.post(reverse('record_sale'), {'item_name': 'Rice', 'purchase_quantity': 3, 'price_per_unit': '4.00'})
+
+        sale = Sale.objects.get()
+        self.assertEqual(sale.item.item_name, 'Rice')
+        self.assertEqual(sale.item_name, 'Rice')
+        self.assertEqual(sale.item.remaining_quantity, 997)
+
+    def test_update_sale_moves_sale_to_named_item(self):
+        sale = create_sale(self.user, 'Rice', 3, 4)
+
+        self.client.post(reverse('update_sale', args=[sale.id]), {'item_name': 'Flour', 'purchase_quantity': 2, 'price_per_unit': '4.00'})
+
+        sale.refresh_from_db()
+        self.assertEqual(sale.item.item_name, 'Flour')
+        self.assertEqual(Inventory.objects.get(item_name='Rice').total_purchase_quantity, 0)
+        self.assertEqual(Inventory.objects.get(item_name='Flour').total_purchase_quantity, 2)
+
+    def test_inventory_with_sales_is_protected(self):
+        sale = create_sale(self.user, 'Rice', 3, 4)
+
+        self.client.post(reverse('delete_inventory'), {'inventories': [sale.item_id]})
+
+        self.assertTrue(Inventory.objects.filter(pk=sale.item_id).exists())
+
+    def test_sales_history_query_count_is_constant(self):
+        create_sale(self.user, 'Item 0', 1, 1)
+        with CaptureQueriesContext(connection) as few_sales:
+            self.client.get(reverse('sales_history'))
+
+        for index in range(1, 10):
+            create_sale(self.user, f'Item {index}', 1, 1)
+        with CaptureQueriesContext(connection) as many_sales:
+            self.client.get(reverse('sales_history'))
+
+        self.assertEqual(len(few_sales), len(many_sales))
+
+
+@override_settings(SALES_HISTORY_PAGE_SIZE=3)
+class SalesHistoryPaginationTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='password')
+        self.client.force_login(self.admin)
+        for index in range(7):
+            create_sale(self.admin, f'Item {index}', 1, 1)
+
+        # Identical dates force the id tie-breaker to order the pages
+        Sale.objects.update(purchase_date=timezone.now())
+
+    def test_pages_cover_every_sale_once(self):
+        seen, cursor = [], None
+        while True:
+            params = {'cursor': cursor} if cursor else {}
+            page = self.client.get(reverse('sales_history'), params).context['sales']
+            self.assertLessEqual(len(page), 3)
+            seen.extend(sale.id for sale in page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+
+        self.assertEqual(seen, list(Sale.objects.order_by('-id').values_list('id', flat=True)))
+
+    def test_load_more_endpoint_returns_json_page(self):
+        first = self.client.get(reverse('sales_history_more'), {'page_size': 5}).json()
+        second = self.client.get(reverse('sales_history_more'), {'cursor': first['next_cursor'], 'page_size': 5}).json()
+
+        self.assertEqual(len(first['sales']), 5)
+        self.assertEqual(len(second['sales']), 2)
+        self.assertIsNone(second['next_cursor'])
+        self.assertEqual(first['sales'][0]['member__username'], 'admin')
+
+    def test_invalid_cursor_starts_from_first_page(self):
+        response = self.client.get(reverse('sales_history'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(len(response.context['sales']), 3)
+
+
+class StreamingExportTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='password', first_name='Ada', last_name='Lee')
+        self.client.force_login(self.admin)
+        self.old_sale = create_sale(self.admin, 'Milk', 2, Decimal('1.50'))
+        Sale.objects.filter(pk=self.old_sale.pk).update(purchase_date=timezone.make_aware(datetime(2024, 1, 15, 12)))
+        create_sale(self.admin, 'Bread', 1, Decimal('3.00'))
+
+    def read_csv(self, response):
+        return list(csv.reader(StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_sales_export_streams_every_row(self):
+        response = self.client.get(reverse('export_sales_history'))
+
+        self.assertTrue(response.streaming)
+        rows = self.read_csv(response)
+        self.assertEqual(rows[0][:3], ['First Name', 'Last Name', 'Item Name'])
+        self.assertEqual([row[2] for row in rows[1:]], ['Milk', 'Bread'])
+        self.assertEqual(rows[1][:2], ['Ada', 'Lee'])
+
+    def test_sales_export_filters_by_date_range_and_item(self):
+        by_date = self.read_csv(self.client.get(reverse('export_sales_history'), {'start_date': '2024-01-01', 'end_date': '2024-01-15'}))
+        by_item = self.read_csv(self.client.get(reverse('export_sales_history'), {'item': ['Bread']}))
+
+        self.assertEqual([row[2] for row in by_date[1:]], ['Milk'])
+        self.assertEqual([row[2] for row in by_item[1:]], ['Bread'])
+
+    def test_reversed_date_range_is_rejected(self):
+        response = self.client.get(reverse('export_sales_history'), {'start_date': '2024-02-01', 'end_date': '2024-01-01'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_inventory_export_can_be_gzipped(self):
+        response = self.client.get(reverse('export_inventory'), {'gzip': '1'})
+
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="inventory.csv.gz"')
+        rows = list(csv.reader(StringIO(gzip.decompress(b''.join(response.streaming_content)).decode())))
+        self.assertEqual(rows[1:], [['Milk', '1000', '998'], ['Bread', '1000', '999']])
+
+
+@override_settings(NOTIFICATION_RULES_ASYNC=False)
+class BulkSaleImportTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='password')
+        self.member = User.objects.create_user(username='member', password='password')
+        self.client.force_login(self.admin)
+
+    def test_command_imports_csv_in_one_batch(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as file:
+            file.write('member,item_name,purchase_quantity,price_per_unit,purchase_date\n')
+            file.write('member,Milk,2,1.50,2024-03-01T09:00:00\n')
+            file.write('member,Milk,3,1.50,\n')
+            file.write('admin,Bread,960,2.00,\n')
+        self.addCleanup(os.remove, file.name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_sales', file.name, '--triggered-by', 'admin', stdout=StringIO())
+
+        milk = Inventory.objects.get(item_name='Milk')
+        self.assertEqual((milk.sale_count, milk.total_purchase_quantity, milk.remaining_quantity), (2, 5, 995))
+        self.assertEqual(Sale.objects.filter(item=milk).earliest('purchase_date').purchase_date.year, 2024)
+        self.assertEqual(Inventory.objects.get(item_name='Bread').remaining_quantity, 40)
+        self.assertEqual(sorted(Notification.objects.values_list('type', flat=True)), ['high_purchase_quantity', 'low_inventory'])
+
+    def test_endpoint_imports_json_body(self):
+        sales = [{'member': 'member', 'item_name': 'Tea', 'purchase_quantity': 1, 'price_per_unit': '4.00'}] * 3
+
+        response = self.client.post(reverse('import_sales'), json.dumps({'sales': sales}), content_type='application/json')
+
+        self.assertEqual(response.json(), {'created': 3})
+        self.assertEqual(Inventory.objects.get(item_name='Tea').total_sales_amount, Decimal('12.00'))
+
+    def test_invalid_rows_reject_the_whole_batch(self):
+        sales = [
+            {'member': 'member', 'item_name': 'Tea', 'purchase_quantity': 1, 'price_per_unit': '4.00'},
+            {'member': 'nobody', 'item_name': 'Tea', 'purchase_quantity': 'many', 'price_per_unit': '4.00'},
+            {'member': 'nobody', 'item_name': 'Tea', 'purchase_quantity': 1, 'price_per_unit': '4.00'},
+        ]
+
+        response = self.client.post(reverse('import_sales'), json.dumps(sales), content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.json()['errors']), 2)
+        self.assertFalse(Sale.objects.exists())
+
+    def test_fractional_quantities_and_impossible_dates_are_row_errors(self):
+        sale = {'member': 'member', 'item_name': 'Tea', 'price_per_unit': '4.00'}
+        sales = [
+            {**sale, 'purchase_quantity': 1.5},
+            {**sale, 'purchase_quantity': True},
+            {**sale, 'purchase_quantity': '2', 'purchase_date': '2024-02-30T10:00:00'},
+            {**sale, 'purchase_quantity': '3.0'},
+        ]
+
+        response = self.client.post(reverse('import_sales'), json.dumps(sales), content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], [
+            'Row 1: purchase_quantity must be a whole number.',
+            'Row 2: purchase_quantity must be a whole number.',
+            'Row 3: purchase_date must be an ISO 8601 date and time.',
+        ])
+
+    def test_batch_exceeding_stock_is_rejected(self):
+        sales = [{'member': 'member', 'item_name': 'Tea', 'purchase_quantity': 600, 'price_per_unit': '1'}] * 2
+
+        response = self.client.post(reverse('import_sales'), json.dumps(sales), content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Sale.objects.exists())
+
+    def test_stock_taken_after_the_check_rejects_the_batch(self):
+        Inventory.objects.create(item_name='Tea', inventory_amount=10)
+        get_or_create_items = ingest._get_or_create_items
+
+        def sell_meanwhile(item_names):
+
+            # Another import takes stock after this one read the items
+            items = get_or_create_items(item_names)
+            Inventory.apply_sale_delta(items['Tea'].pk, 8, 8, 1, check_stock=True)
+            return items
+
+        sales = [{'member': 'member', 'item_name': 'Tea', 'purchase_quantity': 5, 'price_per_unit': '1'}]
+        with mock.patch('members.ingest._get_or_create_items', sell_meanwhile):
+            response = self.client.post(reverse('import_sales'), json.dumps(sales), content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Sale.objects.exists())
+        self.assertEqual(Inventory.objects.get(item_name='Tea').remaining_quantity, 10)
+
+    def test_only_superusers_can_import(self):
+        self.client.force_login(self.member)
+        response = self.client.post(reverse('import_sales'), '[]', content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+
+class StockReservationTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='staff', password='password')
+        self.client.force_login(self.user)
+        self.inventory = Inventory.objects.create(item_name='Oil', inventory_amount=10)
+
+    def test_record_sale_rejects_quantity_above_remaining_stock(self):
+        create_sale(self.user, 'Oil', 8, 1)
+
+        response = self.client.post(reverse('record_sale'), {'item_name': 'Oil', 'purchase_quantity': 3, 'price_per_unit': '1'}, follow=True)
+
+        self.assertContains(response, 'Purchase quantity exceeds available inventory (2) for Oil.')
+        self.assertEqual(Sale.objects.count(), 1)
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.remaining_quantity, 2)
+
+    def test_update_sale_can_reuse_its_own_quantity(self):
+        sale = create_sale(self.user, 'Oil', 8, 1)
+
+        self.client.post(reverse('update_sale', args=[sale.id]), {'item_name': 'Oil', 'purchase_quantity': 10, 'price_per_unit': '1'})
+        self.client.post(reverse('update_sale', args=[sale.id]), {'item_name': 'Oil', 'purchase_quantity': 11, 'price_per_unit': '1'})
+
+        sale.refresh_from_db()
+        self.inventory.refresh_from_db()
+        self.assertEqual(sale.purchase_quantity, 10)
+        self.assertEqual(self.inventory.remaining_quantity, 0)
+
+
+class ConcurrentStockReservationTests(TransactionTestCase):
+
+    def test_concurrent_sales_never_oversell(self):
+        members = [User.objects.create_user(username=f'worker{index}') for index in range(8)]
+        inventory = Inventory.objects.create(item_name='Flour', inventory_amount=50)
+        recorded = []
+
+        def sell(member):
+            try:
+                for _ in range(10):
+                    # Retry while another thread holds the SQLite write lock
+                    for attempt in range(50):
+                        try:
+                            with transaction.atomic():
+                                Sale.objects.create(member=member, item=inventory, purchase_quantity=3, price_per_unit=1)
+                            recorded.append(3)
+                            break
+                        except InsufficientStockError:
+                            break
+                        except OperationalError:
+                            time.sleep(0.01)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=sell, args=(member,)) for member in members]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        inventory.refresh_from_db()
+        sold = Sale.objects.aggregate(total=Sum('purchase_quantity'))['total']
+        self.assertEqual(sold, sum(recorded))
+        self.assertEqual(sold, 48)
+        self.assertEqual(inventory.total_purchase_quantity, sold)
+        self.assertEqual(inventory.remaining_quantity, 2)
+
+
+class OnlyLowInventoryRule(rules.LowInventoryRule):
+    threshold = 995
+
+
+@override_settings(NOTIFICATION_RULES_ASYNC=False)
+class NotificationRuleTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='staff', password='password')
+        self.client.force_login(self.user)
+
+    def record_sale(self, quantity, price_per_unit):
+        return self.client.post(reverse('record_sale'), {'item_name': 'Rice', 'purchase_quantity': quantity, 'price_per_unit': price_per_unit})
+
+    def test_rules_run_after_the_sale_commits(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.record_sale(960, '200')
+
+        # Nothing is evaluated in the request itself
+        self.assertFalse(Notification.objects.exists())
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(
+            sorted(Notification.objects.values_list('type', flat=True)),
+            ['high_purchase_quantity', 'high_sales_amount', 'low_inventory'],
+        )
+        self.assertEqual(Notification.objects.get(type='low_inventory').message, 'Inventory for Rice is low: 40 remaining.')
+
+    def test_sale_updates_only_check_purchase_quantity(self):
+        sale = create_sale(self.user, 'Rice', 1, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('update_sale', args=[sale.id]), {'item_name': 'Rice', 'purchase_quantity': 990, 'price_per_unit': '200'})
+
+        self.assertEqual(list(Notification.objects.values_list('type', flat=True)), ['high_purchase_quantity'])
+        self.assertIn('staff updated purchase quantity to a high value of 990 for Rice', Notification.objects.get().message)
+
+    @override_settings(NOTIFICATION_RULES=['members.tests.OnlyLowInventoryRule'])
+    def test_rules_are_configurable(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.record_sale(5, '1')
+
+        self.assertEqual(list(Notification.objects.values_list('type', flat=True)), ['low_inventory'])
+
+    @override_settings(NOTIFICATION_RULES_ASYNC=True)
+    def test_async_rules_are_submitted_to_the_worker_pool(self):
+        with mock.patch('members.rules.get_executor') as get_executor, self.captureOnCommitCallbacks(execute=True):
+            self.record_sale(150, '1')
+
+        get_executor.return_value.submit.assert_called_once()
+        self.assertFalse(Notification.objects.exists())
+
+
+@override_settings(NOTIFICATION_RULES_ASYNC=False, NOTIFICATION_COOLDOWNS={'low_inventory': 3600})
+class NotificationCoalescingTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='staff', password='password')
+        self.inventory = Inventory.objects.create(item_name='Salt', inventory_amount=55)
+
+    def sell(self, quantity=5):
+        create_sale(self.user, 'Salt', quantity, 1)
+        rules.evaluate([rules.SaleEvent('recorded', self.inventory.pk, 'Salt', quantity, self.user.pk, 'staff', self.user.pk, 'staff')])
+
+    def test_repeats_update_the_open_notification(self):
+        for _ in range(3):
+            self.sell()
+
+        notification = Notification.objects.get(type='low_inventory')
+        self.assertEqual(notification.occurrences, 3)
+        self.assertEqual(notification.message, 'Inventory for Salt is low: 40 remaining.')
+        self.assertEqual(notification.subject, f'item:{self.inventory.pk}')
+
+    def test_repeats_in_one_batch_are_merged(self):
+        event = rules.SaleEvent('recorded', self.inventory.pk, 'Salt', 150, self.user.pk, 'staff', self.user.pk, 'staff')
+        rules.evaluate([event] * 4)
+
+        notification = Notification.objects.get(type='high_purchase_quantity')
+        self.assertEqual(notification.occurrences, 4)
+
+    def test_cooldown_suppresses_new_notifications_after_reading(self):
+        self.sell()
+        Notification.objects.update(is_read=True)
+        self.sell()
+
+        # Within the cooldown the read notification absorbs the repeat
+        self.assertEqual(Notification.objects.count(), 1)
+        self.assertEqual(Notification.objects.get().occurrences, 2)
+
+        # Once the cooldown has passed a fresh unread notification is opened
+        Notification.objects.update(created_at=timezone.now() - timedelta(hours=2))
+        self.sell()
+        self.assertEqual(Notification.objects.filter(is_read=False).count(), 1)
+        self.assertEqual(Notification.objects.count(), 2)
+
+
+@override_settings(NOTIFICATIONS_PAGE_SIZE=2)
+class NotificationInboxTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='password')
+        self.client.force_login(self.admin)
+        for index in range(5):
+            Notification.objects.create(type='low_inventory', subject=f'item:{index}', message=f'Low {index}', triggered_by=self.admin)
+
+    def test_inbox_is_paginated_with_constant_queries(self):
+        with CaptureQueriesContext(connection) as first_page_queries:
+            first_page = self.client.get(reverse('notifications')).context['notifications']
+        second_page = self.client.get(reverse('notifications'), {'cursor': first_page.next_cursor}).context['notifications']
+
+        self.assertEqual([notification.message for notification in first_page], ['Low 4', 'Low 3'])
+        self.assertEqual([notification.message for notification in second_page], ['Low 2', 'Low 1'])
+
+        # Triggering users come from the same query as the notifications
+        with CaptureQueriesContext(connection) as larger_page_queries:
+            self.client.get(reverse('notifications'), {'page_size': 5})
+        self.assertEqual(len(first_page_queries), len(larger_page_queries))
+
+    def test_mark_selected_notifications_read(self):
+        selected = list(Notification.objects.values_list('id', flat=True)[:3])
+
+        self.client.post(reverse('mark_notifications_read'), {'notifications': selected})
+
+        self.assertEqual(Notification.objects.filter(is_read=False).count(), 2)
+
+    def test_non_numeric_notification_ids_are_rejected(self):
+        response = self.client.post(reverse('mark_notifications_read'), {'notifications': ['1', 'abc']})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Notification.objects.filter(is_read=False).count(), 5)
+
+    def test_mark_all_notifications_read_in_one_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('mark_notifications_read'), {'all': '1'})
+
+        self.assertFalse(Notification.objects.filter(is_read=False).exists())
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE "members_notification"')]), 1)
+
+
+@override_settings(
+    FORECAST_MODEL='moving_average',
+    FORECAST_WINDOW_DAYS=2,
+    FORECAST_LEAD_TIME_DAYS=1,
+    FORECAST_REVIEW_DAYS=1,
+    FORECAST_SERVICE_LEVEL_Z=0,
+)
+class InventoryRecommendationTests(TestCase):
+
+    def setUp(self):
+        aggregates.get_cache().clear()
+        self.admin = User.objects.create_superuser(username='admin', password='password')
+        self.client.force_login(self.admin)
+        self.today = timezone.localdate()
+        create_sale_on(self.admin, 'Beans', 3, self.today - timedelta(days=2))
+        create_sale_on(self.admin, 'Beans', 6, self.today - timedelta(days=1))
+        Inventory.objects.create(item_name='Lentils')
+
+    def test_page_is_read_only(self):
+        Inventory.objects.update(recommended_inventory_levels=7)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('inventory_recommendations'))
+
+        self.assertEqual([row['recommended_level'] for row in response.context['recommendations']], [7, 7])
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE')])
+
+    def test_refresh_recalculates_every_item_in_bulk(self):
+        self.assertEqual(Inventory.objects.get(item_name='Lentils').recommended_inventory_levels, 100)
+        Inventory.objects.update(recommended_inventory_levels=0)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('inventory_recommendations'))
+
+        levels = dict(Inventory.objects.values_list('item_name', 'recommended_inventory_levels'))
+        self.assertEqual(levels, {'Beans': 9, 'Lentils': 100})
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE "members_inventory"')]), 1)
+        self.assertEqual(len([query for query in queries if 'FROM "members_dailysalesrollup"' in query['sql']]), 1)
+        self.assertFalse([query for query in queries if 'FROM "members_sale"' in query['sql']])
+
+    def test_sales_no_longer_change_recommended_level(self):
+        Inventory.objects.update(recommended_inventory_levels=7)
+        create_sale(self.admin, 'Beans', 50, 1)
+        self.assertEqual(Inventory.objects.get(item_name='Beans').recommended_inventory_levels, 7)
+
+
+class ForecastingTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='staff', password='password')
+        self.today = timezone.localdate()
+
+    @override_settings(FORECAST_WINDOW_DAYS=2, FORECAST_SMOOTHING_ALPHA=0.5)
+    def test_models_forecast_each_series(self):
+        demand = np.array([[0, 0, 4, 4], [2, 2, 2, 2]], dtype=float)
+
+        self.assertEqual(forecasting.moving_average(demand).tolist(), [4, 2])
+        self.assertEqual(forecasting.exponential_smoothing(demand).tolist(), [3, 2])
+
+    @override_settings(FORECAST_WINDOW_DAYS=2, FORECAST_LEAD_TIME_DAYS=1, FORECAST_REVIEW_DAYS=3, FORECAST_SERVICE_LEVEL_Z=1)
+    def test_reorder_point_includes_safety_stock(self):
+        demand = np.array([[1, 3], [0, 0]], dtype=float)
+
+        daily_demand, deviation, safety_stock, reorder_point, recommended_level = forecasting.forecast(demand, 'moving_average')
+
+        # Deviation 1 over sqrt(4) days of cover gives 2 units of safety stock
+        self.assertEqual(safety_stock.tolist(), [2, 0])
+        self.assertEqual(reorder_point.tolist(), [4, 0])
+
+        # The item without sales keeps the default level
+        self.assertEqual(recommended_level.tolist(), [10, 100])
+
+    def test_demand_series_totals_units_per_day(self):
+        milk = create_sale_on(self.user, 'Milk', 2, self.today - timedelta(days=1)).item
+        create_sale_on(self.user, 'Milk', 3, self.today - timedelta(days=1))
+        create_sale_on(self.user, 'Milk', 4, self.today - timedelta(days=3))
+
+        # Sales from today and before the start are left out
+        create_sale_on(self.user, 'Milk', 5, self.today)
+        create_sale_on(self.user, 'Milk', 6, self.today - timedelta(days=10))
+        bread = Inventory.objects.create(item_name='Bread')
+
+        # A sale at midnight belongs to the day that starts then
+        midnight = create_sale_on(self.user, 'Milk', 1, self.today - timedelta(days=4))
+        midnight.purchase_date -= timedelta(hours=12)
+        midnight.save()
+
+        demand = forecasting.demand_series(np.array([milk.pk, bread.pk]), self.today - timedelta(days=4), self.today)
+
+        self.assertEqual(demand.tolist(), [[1, 4, 0, 5], [0, 0, 0, 0]])
+
+    @override_settings(FORECAST_WINDOW_DAYS=2, FORECAST_LEAD_TIME_DAYS=1, FORECAST_REVIEW_DAYS=1, FORECAST_SERVICE_LEVEL_Z=0)
+    def test_command_stores_forecasts(self):
+        create_sale_on(self.user, 'Milk', 3, self.today - timedelta(days=2))
+        create_sale_on(self.user, 'Milk', 6, self.today - timedelta(days=1))
+
+        call_command('refresh_forecasts', '--model', 'moving_average', '--batch-size', '1', stdout=StringIO())
+        call_command('refresh_forecasts', '--model', 'moving_average', stdout=StringIO())
+
+        forecast = DemandForecast.objects.get(inventory__item_name='Milk')
+        self.assertEqual((forecast.model, forecast.daily_demand, forecast.reorder_point), ('moving_average', 4.5, 5))
+        self.assertEqual(forecast.inventory.recommended_inventory_levels, 9)
+        self.assertEqual(DemandForecast.objects.count(), 1)
+
+    def test_unknown_model_is_rejected(self):
+        with self.assertRaises(ValueError):
+            forecasting.refresh_forecasts(model='crystal_ball')
+
+
+class DashboardAnalyticsTests(TestCase):
+
+    def setUp(self):
+        aggregates.get_cache().clear()
+        self.admin = User.objects.create_superuser(username='admin', password='password')
+        self.member = User.objects.create_user(username='member', password='password')
+        self.client.force_login(self.admin)
+        create_sale(self.member, 'Milk', 2, 3)
+        create_sale(self.admin, 'Bread', 1, 2)
+        create_sale(self.member, 'Bread', 960, 1)
+
+    def test_endpoints_group_sales(self):
+        revenue = self.client.get(reverse('dashboard_revenue'), {'days': 7}).json()
+        self.assertEqual(len(revenue['series']), 7)
+        self.assertEqual(revenue['series'][-1], {'date': str(timezone.localdate()), 'revenue': '968.00', 'quantity': 963, 'sales': 3})
+
+        items = self.client.get(reverse('dashboard_top_items'), {'limit': 1}).json()['items']
+        self.assertEqual([(item['item_name'], item['revenue']) for item in items], [('Bread', '962.00')])
+
+        members = self.client.get(reverse('dashboard_top_members')).json()['members']
+        self.assertEqual([(member['username'], member['sales']) for member in members], [('member', 2), ('admin', 1)])
+
+        low_stock = self.client.get(reverse('dashboard_low_stock')).json()
+        self.assertEqual((low_stock['items'], low_stock['low']), (2, 1))
+
+    def test_figures_are_cached_until_a_sale_is_written(self):
+        self.client.get(reverse('dashboard_top_items'))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('dashboard_top_items'))
+        self.assertFalse([query for query in queries if 'members_dailysalesrollup' in query['sql']])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_sale(self.admin, 'Cheese', 100, 100)
+
+        items = self.client.get(reverse('dashboard_top_items')).json()['items']
+        self.assertEqual(items[0]['item_name'], 'Cheese')
+
+    def test_endpoints_are_limited_to_superusers(self):
+        self.client.force_login(self.member)
+
+        self.assertEqual(self.client.get(reverse('dashboard_revenue')).status_code, 403)
+        self.assertNotContains(self.client.get(reverse('dashboard')), 'sales-analytics')
+
+
+class AggregatesCacheTests(TestCase):
+
+    def setUp(self):
+        aggregates.get_cache().clear()
+        self.admin = User.objects.create_superuser(username='admin', password='password')
+        self.milk = create_sale(self.admin, 'Milk', 2, Decimal('1.50')).item
+        create_sale(self.admin, 'Milk', 4, Decimal('1.75'))
+
+    def test_figures_are_cached_and_counted(self):
+        figures = aggregates.get_items([self.milk.pk])[self.milk.pk]
+        self.assertEqual((figures['total_sold'], figures['average_quantity'], figures['latest_price']), (6, 3, Decimal('1.75')))
+
+        with self.assertNumQueries(0):
+            aggregates.get_items([self.milk.pk])
+
+        stats = aggregates.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_ratio']), (1, 1, 0.5))
+
+    def test_sale_writes_invalidate_affected_items(self):
+        bread = Inventory.objects.create(item_name='Bread')
+        aggregates.get_items([self.milk.pk, bread.pk])
+
+        # Moving a sale drops the cached figures of both items once the write commits
+        sale = Sale.objects.filter(item=self.milk).latest('id')
+        with self.captureOnCommitCallbacks(execute=True):
+            sale.item = bread
+            sale.save()
+
+        figures = aggregates.get_items([self.milk.pk, bread.pk])
+        self.assertEqual((figures[self.milk.pk]['total_sold'], figures[bread.pk]['total_sold']), (2, 4))
+        self.assertEqual(aggregates.stats()['misses'], 4)
+
+    def test_stats_endpoint_is_limited_to_superusers(self):
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get(reverse('aggregates_stats')).json()['hits'], 0)
+
+        self.client.force_login(User.objects.create_user(username='member', password='password'))
+        self.assertEqual(self.client.get(reverse('aggregates_stats')).status_code, 403)
+
+
+
+@override_settings(REQUEST_QUERY_BUDGET=5, METRICS_TOKEN='secret')
+class RequestInstrumentationTests(TestCase):
+
+    def setUp(self):
+        instrumentation.reset()
+        aggregates.get_cache().clear()
+        self.admin = User.objects.create_superuser(username='admin', password='password')
+        self.client.force_login(self.admin)
+
+    def test_queries_and_time_are_recorded_per_view(self):
+        create_sale(self.admin, 'Milk', 2, Decimal('1.50'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('inventory_list'))
+
+        metrics = instrumentation.snapshot()['inventory_list']
+        self.assertEqual((metrics.requests, metrics.queries), (1, len(queries)))
+        self.assertGreater(metrics.seconds, 0)
+        self.assertEqual(metrics.buckets[-1], 1)
+
+    def test_streaming_responses_are_measured_once_sent(self):
+        create_sale(self.admin, 'Milk', 2, Decimal('1.50'))
+        response = self.client.get(reverse('export_sales_history'))
+        self.assertNotIn('export_sales_history', instrumentation.snapshot())
+
+        b''.join(response.streaming_content)
+        self.assertGreater(instrumentation.snapshot()['export_sales_history'].queries, 0)
+
+    def test_requests_over_the_query_budget_are_logged(self):
+        # One query per item stands in for an N+1 loop
+        items = [Inventory.objects.create(item_name=f'Item {index}') for index in range(10)]
+        with mock.patch('members.views.aggregates.get_items', lambda ids: {pk: Inventory.objects.filter(pk=pk).values().first() for pk in ids}):
+            with self.assertLogs('members.instrumentation', 'WARNING') as logs:
+                self.client.get(reverse('inventory_list'))
+
+        self.assertIn('Possible N+1 queries in inventory_list', logs.output[0])
+        self.assertIn(f'repeated {len(items)} times', logs.output[0])
+        self.assertEqual(instrumentation.snapshot()['inventory_list'].over_budget, 1)
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('sales_history'))
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('gotogro_requests_total{view="sales_history"} 1', body)
+        self.assertIn('gotogro_request_duration_seconds_bucket{view="sales_history",le="+Inf"} 1', body)
+
+        # Scrapers use the token, other members are refused
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.client.force_login(User.objects.create_user(username='member', password='password'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+
+class UserProfileSignalTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='member', password='password', first_name='Ada', last_name='Lovelace')
+
+    def test_profile_is_created_with_the_users_names(self):
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual((profile.first_name, profile.last_name), ('Ada', 'Lovelace'))
+
+    def test_profile_is_only_written_when_names_change(self):
+        # An unchanged save runs a single conditional UPDATE that matches no row
+        with CaptureQueriesContext(connection) as queries:
+            self.user.save()
+        profile_queries = [query['sql'] for query in queries if 'members_profile' in query['sql']]
+        self.assertEqual(len(profile_queries), 1)
+        self.assertTrue(profile_queries[0].startswith('UPDATE'))
+
+        self.user.first_name = 'Augusta'
+        self.user.save()
+        self.assertEqual(Profile.objects.get(user=self.user).first_name, 'Augusta')
+
+    def test_login_runs_a_fixed_number_of_queries(self):
+        # User lookup, session writes with their savepoints and the last_login update, nothing for the profile
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('login'), {'username': 'member', 'password': 'password'})
+
+        self.assertEqual(len(queries), 9)
+        self.assertFalse([query['sql'] for query in queries if 'members_profile' in query['sql']])
+
+
+@override_settings(MEMBER_IMPORT_HASH_WORKERS=1)
+class MemberImportTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='password')
+
+    def write_csv(self, text):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as file:
+            file.write(text)
+        self.addCleanup(os.remove, file.name)
+        return file.name
+
+    def test_command_creates_members_profiles_and_invites(self):
+        path = self.write_csv(
+            'username,email,first_name,last_name,password,city\n'
+            'ada,ada@example.com,Ada,Lovelace,,London\n'
+            'alan,alan@example.com,Alan,Turing,enigma-1912,Wilmslow\n'
+        )
+        invites = self.write_csv('')
+
+        call_command('import_members', path, '--invites', invites, '--base-url', 'https://shop.example', stdout=StringIO())
+
+        ada, alan = User.objects.get(username='ada'), User.objects.get(username='alan')
+        self.assertEqual((ada.profile.first_name, ada.profile.city), ('Ada', 'London'))
+        self.assertFalse(ada.has_usable_password())
+        self.assertTrue(alan.check_password('enigma-1912'))
+
+        with open(invites) as file:
+            rows = list(csv.reader(file))
+        self.assertEqual([row[0] for row in rows], ['Username', 'ada'])
+        self.assertTrue(rows[1][2].startswith('https://shop.example/invite/'))
+
+    def test_invalid_rows_reject_the_whole_file(self):
+        rows = [
+            {'username': 'ada', 'email': 'ada@example.com'},
+            {'username': 'ada', 'email': 'ada@example.com'},
+            {'username': 'admin', 'email': 'admin@example.com'},
+            {'username': 'bad name!', 'email': 'not-an-email'},
+            {'username': 'grace'},
+        ]
+
+        with self.assertRaises(ValidationError) as raised:
+            onboarding.import_members(rows)
+
+        self.assertEqual(len(raised.exception.messages), 4)
+        self.assertFalse(User.objects.filter(username='ada').exists())
+
+    def test_invite_link_sets_password_once(self):
+        user = onboarding.import_members([{'username': 'ada', 'email': 'ada@example.com'}])[0]
+        link = onboarding.invite_path(user)
+
+        response = self.client.post(link, {'new_password1': 'analytical-engine', 'new_password2': 'analytical-engine'})
+        self.assertRedirects(response, reverse('profile'))
+        self.assertTrue(User.objects.get(username='ada').check_password('analytical-engine'))
+
+        self.client.logout()
+        self.assertRedirects(self.client.get(link), reverse('login'))
+
+    def test_admin_upload_returns_invite_links(self):
+        self.client.force_login(self.admin)
+        upload = SimpleUploadedFile('members.csv', b'username,email,password\nada,ada@example.com,\nalan,alan@example.com,enigma-1912\n', content_type='text/csv')
+
+        with override_settings(MEMBER_IMPORT_HASH_WORKERS=4), mock.patch('members.onboarding.ProcessPoolExecutor') as pool:
+            response = self.client.post(reverse('admin:members_profile_import'), {'file': upload})
+
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="member_invites.csv"')
+        self.assertEqual(b''.join(response.streaming_content).decode().count('/invite/'), 2)
+        self.assertTrue(Profile.objects.filter(user__username='ada').exists())
+
+        # Passwords in the upload are not hashed in the request, the member chooses one through the invite
+        self.assertFalse(User.objects.get(username='alan').has_usable_password())
+        pool.assert_not_called()
+
+
+def create_transaction_on(user, amount, when):
+    # Transaction dates are set when the row is created, so the clock is moved there
+    with mock.patch('django.utils.timezone.now', return_value=when):
+        return Transaction.objects.create(user=user, amount=amount, description=f'{amount} on {when:%Y-%m-%d}')
+
+
+@override_settings(TRANSACTION_HISTORY_PAGE_SIZE=2)
+class TransactionHistoryTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='member', password='password')
+        self.client.force_login(self.user)
+        for amount, day in [(100, '2024-01-10'), (-30, '2024-01-20'), (50, '2024-02-05'), (10, '2024-02-06'), (5, '2024-03-01')]:
+            create_transaction_on(self.user, Decimal(amount), timezone.make_aware(datetime.fromisoformat(f'{day}T12:00:00')))
+
+    def pages(self, **params):
+        response = self.client.get(reverse('transaction_history'), params)
+        while True:
+            transactions = response.context['transactions']
+            yield [(row['amount'], row['month_to_date'], row['balance']) for row in transactions]
+            if not transactions.has_next:
+                return
+            response = self.client.get(reverse('transaction_history'), {**params, 'cursor': transactions.next_cursor})
+
+    def test_pages_carry_running_balances_and_month_to_date(self):
+        self.assertEqual([[(int(a), int(m), int(b)) for a, m, b in page] for page in self.pages()], [
+            [(5, 5, 135), (10, 60, 130)],
+            [(50, 50, 120), (-30, 70, 70)],
+            [(100, 100, 100)],
+        ])
+
+    def test_date_range_keeps_account_balances(self):
+        pages = list(self.pages(start_date='2024-02-01', end_date='2024-02-29'))
+        self.assertEqual([int(balance) for page in pages for _, _, balance in page], [130, 120])
+
+    def test_monthly_totals_follow_writes(self):
+        self.client.post(reverse('delete_transactions'), {'transactions': [Transaction.objects.get(amount=-30).pk]})
+        self.assertEqual(
+            list(MonthlyTransactionTotal.objects.order_by('month').values_list('total', 'transaction_count')),
+            [(Decimal('100.00'), 1), (Decimal('60.00'), 2), (Decimal('5.00'), 1)],
+        )
+
+        MonthlyTransactionTotal.rebuild()
+        self.assertEqual(MonthlyTransactionTotal.objects.get(month='2024-02-01').total, Decimal('60.00'))
+
+    def test_page_query_count_does_not_grow_with_history(self):
+        cursor = self.client.get(reverse('transaction_history')).context['transactions'].next_cursor
+        with CaptureQueriesContext(connection) as short_history:
+            self.client.get(reverse('transaction_history'), {'cursor': cursor})
+
+        for month in range(1, 13):
+            create_transaction_on(self.user, Decimal(1), timezone.make_aware(datetime(2023, month, 15, 12)))
+        with CaptureQueriesContext(connection) as long_history:
+            self.client.get(reverse('transaction_history'), {'cursor': cursor})
+
+        self.assertEqual(len(short_history), len(long_history))
+
+
+class StatementExportTests(TestCase):
+
+    def setUp(self):
+        self.member = User.objects.create_user(username='member', password='password')
+        self.client.force_login(self.member)
+        create_transaction_on(self.member, Decimal('20.00'), timezone.make_aware(datetime(2024, 1, 10, 12)))
+        create_transaction_on(self.member, Decimal('5.00'), timezone.make_aware(datetime(2024, 3, 1, 12)))
+        sale = create_sale(self.member, 'Milk', 2, Decimal('1.50'))
+        Sale.objects.filter(pk=sale.pk).update(purchase_date=timezone.make_aware(datetime(2024, 2, 1, 12)))
+        create_sale(User.objects.create_user(username='other', password='password'), 'Bread', 1, Decimal('3.00'))
+
+    def read(self, **params):
+        response = self.client.get(reverse('export_statement'), params)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_merges_transactions_and_sales_by_date(self):
+        rows = list(csv.reader(StringIO(self.read())))
+
+        self.assertEqual(rows[0], ['Type', 'Date', 'Description', 'Quantity', 'Price Per Unit', 'Amount'])
+        self.assertEqual([(row[0], row[2], row[5]) for row in rows[1:]], [
+            ('transaction', '20.00 on 2024-01-10', '20.00'),
+            ('sale', 'Milk', '3.00'),
+            ('transaction', '5.00 on 2024-03-01', '5.00'),
+        ])
+
+    def test_json_lines_in_date_range(self):
+        lines = [json.loads(line) for line in self.read(file_format='jsonl', start_date='2024-02-01', end_date='2024-03-31').splitlines()]
+
+        self.assertEqual([(line['type'], line['quantity'], line['amount']) for line in lines], [('sale', 2, '3.00'), ('transaction', None, '5.00')])
+
+    def test_other_members_statements_are_for_superusers(self):
+        self.assertEqual(self.client.get(reverse('export_statement'), {'member': 'other'}).status_code, 403)
+
+        self.client.force_login(User.objects.create_superuser(username='admin', password='password'))
+        rows = list(csv.reader(StringIO(self.read(member='other'))))
+        self.assertEqual([row[2] for row in rows[1:]], ['Bread'])
+
+
+class BatchedSaleDeletionTests(TestCase):
+
+    def setUp(self):
+        aggregates.get_cache().clear()
+        self.member = User.objects.create_user(username='member', password='password')
+        self.other = User.objects.create_user(username='other', password='password')
+        self.client.force_login(self.member)
+
+    def test_members_delete_only_their_own_sales_and_stock_is_restored(self):
+        own = [create_sale(self.member, 'Milk', quantity, Decimal('1.00')) for quantity in (2, 3)]
+        others = create_sale(self.other, 'Milk', 4, Decimal('1.00'))
+
+        self.client.post(reverse('delete_sales'), {'sales': [sale.pk for sale in own] + [others.pk]})
+
+        self.assertEqual(list(Sale.objects.values_list('pk', flat=True)), [others.pk])
+        milk = Inventory.objects.get(item_name='Milk')
+        self.assertEqual((milk.sale_count, milk.total_purchase_quantity, milk.remaining_quantity), (1, 4, 996))
+        self.assertEqual(DailySalesRollup.objects.aggregate(total=Sum('quantity'))['total'], 4)
+
+    def test_ids_are_chunked_to_the_parameter_limit(self):
+        sales = [create_sale(self.member, f'Item {index % 3}', 1, Decimal('2.00')) for index in range(120)]
+
+        with mock.patch.object(connection.features, 'max_query_params', 50):
+            deleted = ingest.delete_sales([sale.pk for sale in sales], self.member)
+
+        self.assertEqual(deleted, 120)
+        self.assertFalse(Sale.objects.exists())
+        self.assertEqual(set(Inventory.objects.values_list('sale_count', 'remaining_quantity', 'total_sales_amount')), {(0, 1000, Decimal('0.00'))})
+        self.assertFalse(DailySalesRollup.objects.exclude(sale_count=0).exists())
+
+    def test_superusers_delete_any_sale(self):
+        sale = create_sale(self.other, 'Milk', 1, Decimal('1.00'))
+        self.assertEqual(ingest.delete_sales([sale.pk], User.objects.create_superuser(username='admin', password='password')), 1)
+
+    def test_invalid_ids_are_rejected(self):
+        self.assertEqual(self.client.post(reverse('delete_sales'), {'sales': ['1', 'all']}).status_code, 400)
+
+
+@override_settings(BULK_SALE_ACTIONS_ASYNC=False)
+class BulkSaleActionTests(TestCase):
+
+    def setUp(self):
+        aggregates.get_cache().clear()
+        self.member = User.objects.create_user(username='member', password='password')
+        self.other = User.objects.create_user(username='other', password='password')
+        self.client.force_login(self.member)
+
+    def rollup(self):
+        return set(DailySalesRollup.objects.exclude(sale_count=0).values_list('date', 'item_id', 'member_id', 'quantity', 'revenue', 'sale_count'))
+
+    def assertCountersMatchSales(self):
+        for item in Inventory.objects.all():
+            sales = Sale.objects.filter(item=item).aggregate(quantity=Sum('purchase_quantity'), amount=Sum('total_price'))
+            self.assertEqual(item.total_purchase_quantity, sales['quantity'] or 0)
+            self.assertEqual(item.total_sales_amount, sales['amount'] or 0)
+            self.assertEqual(item.remaining_quantity, item.inventory_amount - (sales['quantity'] or 0))
+        rollup = self.rollup()
+        DailySalesRollup.rebuild()
+        self.assertEqual(rollup, self.rollup())
+
+    def test_dry_run_counts_matching_sales_without_changing_them(self):
+        create_sale(self.member, 'Milk', 2, Decimal('1.00'))
+        create_sale(self.member, 'Milk', 3, Decimal('5.00'))
+        create_sale(self.member, 'Bread', 1, Decimal('1.50'))
+
+        response = self.client.post(reverse('bulk_sales'), {
+            'action': 'reprice', 'price': '2.00', 'item': ['Milk', 'Bread'], 'max_price': '2.00', 'dry_run': 'on',
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'dry_run': True, 'matched': 2, 'quantity': 3, 'amount': '3.50', 'items': 2, 'repriced_amount': '6.00',
+        })
+        self.assertEqual(Sale.objects.filter(price_per_unit=Decimal('2.00')).count(), 0)
+        self.assertFalse(BulkSaleAction.objects.exists())
+
+    def test_delete_by_filters_only_touches_the_members_matching_sales(self):
+        old = create_sale_on(self.member, 'Milk', 2, timezone.localdate() - timedelta(days=10))
+        kept = create_sale(self.member, 'Milk', 3, Decimal('1.00'))
+        others = create_sale_on(self.other, 'Milk', 4, timezone.localdate() - timedelta(days=10))
+
+        response = self.client.post(reverse('bulk_sales'), {
+            'action': 'delete', 'end_date': (timezone.localdate() - timedelta(days=1)).isoformat(),
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['action']['affected'], 1)
+        self.assertEqual(set(Sale.objects.values_list('pk', flat=True)), {kept.pk, others.pk})
+        self.assertEqual(BulkSaleAction.objects.get().status, 'done')
+        self.assertCountersMatchSales()
+        self.assertFalse(Sale.objects.filter(pk=old.pk).exists())
+
+    def test_reprice_updates_totals_counters_and_daily_totals(self):
+        superuser = User.objects.create_superuser(username='admin', password='password')
+        self.client.force_login(superuser)
+        for member, quantity in ((self.member, 2), (self.other, 3)):
+            create_sale(member, 'Milk', quantity, Decimal('1.00'))
+        create_sale(self.member, 'Bread', 1, Decimal('1.00'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('bulk_sales'), {'action': 'reprice', 'item': 'Milk', 'price': '2.50'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['action']['affected'], 2)
+        self.assertEqual(sorted(Sale.objects.filter(item__item_name='Milk').values_list('total_price', flat=True)), [Decimal('5.00'), Decimal('7.50')])
+        self.assertEqual(Inventory.objects.get(item_name='Milk').total_sales_amount, Decimal('12.50'))
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE "members_sale"')]), 1)
+        self.assertCountersMatchSales()
+
+    def test_reprice_that_overflows_the_total_fails_without_changes(self):
+        create_sale(self.member, 'Milk', 1000, Decimal('1.00'))
+
+        response = self.client.post(reverse('bulk_sales'), {'action': 'reprice', 'item': 'Milk', 'price': '99999999.00'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['action']['status'], 'failed')
+        self.assertEqual(Sale.objects.get().total_price, Decimal('1000.00'))
+
+    def test_members_cannot_act_on_another_members_sales(self):
+        create_sale(self.other, 'Milk', 1, Decimal('1.00'))
+        response = self.client.post(reverse('bulk_sales'), {'action': 'delete', 'member': 'other'})
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(Sale.objects.exists())
+
+    def test_actions_without_filters_must_be_confirmed(self):
+        create_sale(self.member, 'Milk', 1, Decimal('1.00'))
+
+        for data in ({'action': 'delete'}, {'action': 'reprice', 'price': '2.00'}):
+            response = self.client.post(reverse('bulk_sales'), data)
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(Sale.objects.get().total_price, Decimal('1.00'))
+        self.assertFalse(BulkSaleAction.objects.exists())
+
+    @override_settings(BULK_SALE_ACTION_SYNC_LIMIT=1)
+    def test_large_matches_run_in_the_background(self):
+        for quantity in (1, 2):
+            create_sale(self.member, 'Milk', quantity, Decimal('1.00'))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('bulk_sales'), {'action': 'delete', 'all': 'on'})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(Sale.objects.count(), 2)
+
+        for callback in callbacks:
+            callback()
+        status = self.client.get(response.json()['action']['status_url']).json()
+        self.assertEqual((status['status'], status['affected']), ('done', 2))
+        self.assertFalse(Sale.objects.exists())
+        self.assertCountersMatchSales()
+
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(response.json()['action']['status_url']).status_code, 403)
+
+
+@override_settings(NOTIFICATION_RULES_ASYNC=False, MEMBER_IMPORT_HASH_WORKERS=1)
+class SearchTests(TestCase):
+
+    def setUp(self):
+        aggregates.get_cache().clear()
+        self.member = User.objects.create_user(username='member', password='password', first_name='Mary', last_name='Jones')
+        self.admin = User.objects.create_superuser(username='admin', password='password')
+
+    def item_names(self, query):
+        return [item['item_name'] for item in search.suggest_items(query, 10)]
+
+    def test_names_are_kept_in_step_by_signals(self):
+        milk = Inventory.objects.create(item_name='Chocolate Milk')
+        Inventory.objects.create(item_name='Crème Brûlée')
+        self.assertTrue(search.uses_fts())
+
+        self.assertEqual(self.item_names('choc mil'), ['Chocolate Milk'])
+        self.assertEqual(self.item_names('creme'), ['Crème Brûlée'])
+        self.assertEqual(self.item_names('"milk* (choc'), ['Chocolate Milk'])
+
+        milk.item_name = 'Oat Milk'
+        milk.save()
+        self.assertEqual(self.item_names('milk'), ['Oat Milk'])
+        milk.delete()
+        self.assertEqual(self.item_names('milk'), [])
+
+        self.member.last_name = 'Smith'
+        self.member.save()
+        self.assertEqual([member['username'] for member in search.suggest_members('smi', 10)], ['member'])
+        self.assertEqual(search.suggest_members('jones', 10), [])
+
+    def test_stock_edits_leave_the_search_table_alone(self):
+        milk = Inventory.objects.create(item_name='Milk')
+
+        with CaptureQueriesContext(connection) as queries:
+            milk.inventory_amount = 500
+            milk.save()
+            create_sale(self.member, 'Milk', 1, Decimal('1.00'))
+        self.assertFalse([query for query in queries if search.ITEM_TABLE in query['sql']])
+
+    def test_tables_created_after_a_failed_check_are_used(self):
+        search.FTS_DATABASES.clear()
+        with mock.patch('members.search._has_fts_tables', return_value=False):
+            self.assertFalse(search.uses_fts())
+        self.assertTrue(search.uses_fts())
+
+    def test_bulk_imports_are_searchable(self):
+        ingest.import_sales([{'member': 'member', 'item_name': 'Sparkling Water', 'purchase_quantity': 1, 'price_per_unit': '1.00'}])
+        onboarding.import_members([{'username': 'ada', 'email': 'ada@example.com', 'first_name': 'Ada', 'last_name': 'Lovelace'}])
+
+        self.assertEqual(self.item_names('spark'), ['Sparkling Water'])
+        self.assertEqual([member['username'] for member in search.suggest_members('love', 10)], ['ada'])
+
+    def test_sales_history_search_matches_items_and_for_superusers_members(self):
+        milk = create_sale(self.member, 'Milk', 1, Decimal('1.00'))
+        bread = create_sale(self.admin, 'Bread', 1, Decimal('1.00'))
+
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('sales_history'), {'q': 'mil'})
+        self.assertEqual([sale.pk for sale in response.context['sales']], [milk.pk])
+        response = self.client.get(reverse('sales_history'), {'q': 'mary'})
+        self.assertEqual([sale.pk for sale in response.context['sales']], [milk.pk])
+
+        self.client.force_login(self.member)
+        self.assertEqual(list(self.client.get(reverse('sales_history'), {'q': 'bread'}).context['sales']), [])
+        self.assertEqual(list(self.client.get(reverse('sales_history'), {'q': 'mary'}).context['sales']), [])
+        self.assertEqual([sale.pk for sale in self.client.get(reverse('sales_history')).context['sales']], [milk.pk])
+
+    def test_suggestions_only_include_members_for_superusers(self):
+        Inventory.objects.create(item_name='Mango')
+
+        self.client.force_login(self.member)
+        self.assertEqual(self.client.get(reverse('search_suggestions'), {'q': 'ma'}).json(), {'items': [{'id': Inventory.objects.get().pk, 'item_name': 'Mango'}]})
+
+        self.client.force_login(self.admin)
+        data = self.client.get(reverse('search_suggestions'), {'q': 'ma'}).json()
+        self.assertEqual([member['username'] for member in data['members']], ['member'])
+
+    def test_backends_without_fts_match_names_with_like(self):
+        Inventory.objects.create(item_name='Chocolate Milk')
+        with mock.patch('members.search.uses_fts', return_value=False):
+            self.assertEqual(self.item_names('late mil'), ['Chocolate Milk'])
+            self.assertEqual(list(Inventory.objects.filter(pk__in=search.item_ids('milk')).values_list('item_name', flat=True)), ['Chocolate Milk'])
+
+    def test_rebuild_command_restores_the_tables(self):
+        Inventory.objects.bulk_create([Inventory(item_name=f'Tea {index}') for index in range(3)])
+        self.assertEqual(self.item_names('tea'), [])
+
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(sorted(self.item_names('tea')), ['Tea 0', 'Tea 1', 'Tea 2'])
@@ -0,0 +1,11 @@
+# members/utils.py
+
+from django.db import connection
+
+def chunks(values, size=None):
+
+    # Split lookups so an IN clause never exceeds the backend's parameter limit
+    values = list(values)
+    size = size or connection.features.max_query_params or len(values) or 1
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
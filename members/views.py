@@ -1,14 +1,24 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib import messages
-from .forms import UserRegisterForm, UserUpdateForm, ProfileUpdateForm, CustomPasswordChangeForm, SaleUpdateForm, InventoryUpdateForm
+from .forms import UserRegisterForm, UserUpdateForm, ProfileUpdateForm, CustomPasswordChangeForm, SaleUpdateForm, InventoryUpdateForm, SaleFilterForm, DateRangeForm, StatementFilterForm, BulkSaleActionForm
 from django.contrib.auth.decorators import login_required
-from .models import Transaction, Profile, Sale, Inventory, Notification
-from django.db.models import Sum, Avg
+from .models import Transaction, Profile, Sale, Inventory, Notification, InsufficientStockError, BulkSaleAction
+from django.db.models import F, ProtectedError, Q
 from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse
-import csv
+from django.contrib.auth.forms import SetPasswordForm
+from django.utils.http import urlsafe_base64_decode
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse
+from django.conf import settings
+from .pagination import get_bounded_int, get_page_size, paginate_keyset
+from .exports import csv_lines, jsonl_lines, streaming_download
+from . import aggregates, analytics, bulk, forecasting, ingest, instrumentation, ledger, onboarding, rules, search
+from .utils import chunks
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_POST
 
 def home(request):
     return render(request, 'members/home.html')
@@ -46,6 +56,31 @@ def register(request):
     # Render registration template with form context    
     return render(request, 'members/register.html', {'form': form})
 
+# View where an imported member chooses a password from their invite link
+def accept_invite(request, uidb64, token):
+    try:
+        user = get_user_model().objects.get(pk=urlsafe_base64_decode(uidb64).decode())
+    except (ValueError, TypeError, OverflowError, get_user_model().DoesNotExist):
+        user = None
+
+    if user is None or not onboarding.invite_tokens.check_token(user, token):
+        messages.error(request, 'This invite link is invalid or has expired.')
+        return redirect('login')
+
+    if request.method == 'POST':
+        form = SetPasswordForm(user, request.POST)
+        if form.is_valid():
+
+            # Choosing a password and logging in both make the invite link invalid
+            form.save()
+            login(request, user)
+            messages.success(request, f'Welcome {user.username}, your password has been set.')
+            return redirect('profile')
+    else:
+        form = SetPasswordForm(user)
+
+    return render(request, 'members/accept_invite.html', {'form': form, 'invited_user': user})
+
 # View to handle display and update of user profile
 # Ensures that only validated users can access this view
 @login_required
@@ -81,8 +116,27 @@ def profile(request):
 
 @login_required
 def transaction_history(request):
-    transactions = Transaction.objects.filter(user=request.user).order_by('-date')
-    return render(request, 'members/transactions.html', {'transactions': transactions})
+    filters = DateRangeForm(request.GET)
+    if not filters.is_valid():
+        return HttpResponseBadRequest(filters.errors.as_text())
+
+    # Newest transactions first, one bounded page at a time keyed on (date, id) with running balances
+    page_size = get_page_size(request, settings.TRANSACTION_HISTORY_PAGE_SIZE, settings.TRANSACTION_HISTORY_MAX_PAGE_SIZE)
+    transactions = ledger.history_page(request.user, filters, request.GET.get('cursor'), page_size)
+
+    # Page links keep the date range and page size
+    query = request.GET.copy()
+    query.pop('cursor', None)
+    query['page_size'] = page_size
+
+    context = {
+        'transactions': transactions,
+        'months': ledger.monthly_totals(request.user, transactions.items),
+        'filters': filters,
+        'query': query.urlencode(),
+        'is_first_page': not request.GET.get('cursor'),
+    }
+    return render(request, 'members/transactions.html', context)
 
 
 @login_required
@@ -99,6 +153,45 @@ def add_transaction(request):
 def dashboard(request):
     return render(request, 'members/dashboard.html')
 
+def _analytics_forbidden():
+
+    # Dashboard figures cover every member's sales and are limited to superusers
+    return JsonResponse({'errors': ['Only superusers can view sales analytics.']}, status=403)
+
+@login_required
+def dashboard_revenue(request):
+    if not request.user.is_superuser:
+        return _analytics_forbidden()
+
+    # Revenue per day over the requested number of days, cached by members.analytics
+    days = get_bounded_int(request, 'days', settings.DASHBOARD_DAYS, settings.DASHBOARD_MAX_DAYS)
+    return JsonResponse({'days': days, 'series': analytics.revenue_over_time(days)})
+
+@login_required
+def dashboard_top_items(request):
+    if not request.user.is_superuser:
+        return _analytics_forbidden()
+
+    days = get_bounded_int(request, 'days', settings.DASHBOARD_DAYS, settings.DASHBOARD_MAX_DAYS)
+    limit = get_bounded_int(request, 'limit', settings.DASHBOARD_TOP_LIMIT, settings.DASHBOARD_MAX_TOP_LIMIT)
+    return JsonResponse({'days': days, 'items': analytics.top_items(days, limit)})
+
+@login_required
+def dashboard_top_members(request):
+    if not request.user.is_superuser:
+        return _analytics_forbidden()
+
+    days = get_bounded_int(request, 'days', settings.DASHBOARD_DAYS, settings.DASHBOARD_MAX_DAYS)
+    limit = get_bounded_int(request, 'limit', settings.DASHBOARD_TOP_LIMIT, settings.DASHBOARD_MAX_TOP_LIMIT)
+    return JsonResponse({'days': days, 'members': analytics.top_members(days, limit)})
+
+@login_required
+def dashboard_low_stock(request):
+    if not request.user.is_superuser:
+        return _analytics_forbidden()
+
+    return JsonResponse(analytics.low_stock())
+
 def custom_logout(request):
     logout(request)
     messages.success(request, 'You have logged out successfully.')
@@ -138,79 +231,149 @@ def record_sale(request):
 
         total_price = purchase_quantity * price_per_unit
         
-        # Fetch the inventory amount for the item or assume the default if it doesn't exist
         try:
-            inventory = Inventory.objects.get(item_name=item_name)
-            inventory_amount = inventory.inventory_amount
-
-        except Inventory.DoesNotExist:
-            inventory_amount = 1000  # Default inventory amount
-
-            # Create a new Inventory record with the default amount if it doesn't exist
-            inventory = Inventory.objects.create(item_name=item_name, inventory_amount=inventory_amount)
+            with transaction.atomic():
+
+                # Fetch and lock the inventory row for the item, creating it with the default amount if it doesn't exist
+                inventory, created = Inventory.objects.select_for_update().get_or_create(item_name=item_name)
+
+                # Record the sale, its stock reservation fails if the remaining quantity is too low
+                sale = Sale.objects.create(
+                    member = member,
+                    item = inventory,
+                    purchase_quantity = purchase_quantity,
+                    price_per_unit=price_per_unit,
+                    total_price = total_price
+                )
 
-        # Validate the purchase quantity against the inventory amount
-        if purchase_quantity > inventory_amount:
-            messages.error(request, f"Purchase quantity exceeds available inventory ({inventory_amount}) for {item_name}.")
+        except InsufficientStockError as error:
+            messages.error(request, f"Purchase quantity exceeds available inventory ({error.available}) for {item_name}.")
             return redirect('record_sale')
 
-        
-        # Proceed to record the sale
-        sale = Sale.objects.create(
-            member = member,
-            item_name = item_name,
-            purchase_quantity = purchase_quantity,
-            price_per_unit=price_per_unit,
-            total_price = total_price
-        )
-
-        # Update inventory remaining quantity
-        inventory.remaining_quantity -= purchase_quantity
-        inventory.save()
-
-        # Trigger notification based on conditions
-        if 100 <= purchase_quantity <= 1000:
-            Notification.objects.create(
-                type='high_purchase_quantity',
-                message = f"{member.username} recorded a high purchase quantity of {purchase_quantity} for {item_name}. Verification is required.",
-                triggered_by = member
-            )
-
-        # Check total sales amount for this item by the user
-        total_sales_amount = Sale.objects.filter(item_name=item_name, member=member).aggregate(total=Sum('total_price'))['total'] or 0
-        if total_sales_amount > 100000:
-            Notification.objects.create(
-                type='high_sales_amount',
-                message = f"{member.username} has exceeded a sales total of 100,000 for {item_name}. Verification is required.",
-                triggered_by = member
-            )
-
-        # Low inventory notification
-        if inventory.remaining_quantity <= 50:
-            Notification.objects.create(
-                type='low_inventory',
-                message=f"Inventory for {item_name} is low: {inventory.remaining_quantity} remaining.",
-                triggered_by = request.user
-            )    
+        # Notification rules are evaluated in the background once the sale is committed
+        rules.publish(rules.SaleEvent(
+            action='recorded',
+            item_id=inventory.pk,
+            item_name=item_name,
+            purchase_quantity=purchase_quantity,
+            member_id=member.pk,
+            member_username=member.username,
+            triggered_by_id=member.pk,
+            triggered_by_username=member.username,
+        ))
 
         return redirect('sales_history')
     
     return render(request, 'members/record_sale.html')
 
 
+def _sales_for_user(user):
+
+    if user.is_superuser:
+
+        return Sale.objects.select_related('member', 'item') #Superuser can see all sales
+
+    #Normal users can only see their sales
+    return Sale.objects.filter(member=user).select_related('item')
+
+
+def _search_sales(request, sales):
+
+    # ?q= keeps the sales of matching items, and for superusers the sales of matching members as well
+    query = request.GET.get('q', '').strip()
+    if not search.words(query):
+        return sales
+    condition = Q(item_id__in=search.item_ids(query))
+    if request.user.is_superuser:
+        condition |= Q(member_id__in=search.member_ids(query))
+    return sales.filter(condition)
+
+
 @login_required
 def sales_history(request):
 
-    if request.user.is_superuser:
-    
-        sales = Sale.objects.all() #Superuser can see all sales
-    
-    else:
+    # Newest sales first, one bounded page at a time keyed on (purchase_date, id)
+    page_size = get_page_size(request, settings.SALES_HISTORY_PAGE_SIZE, settings.SALES_HISTORY_MAX_PAGE_SIZE)
+    sales = paginate_keyset(_search_sales(request, _sales_for_user(request.user)), ('purchase_date', 'id'), request.GET.get('cursor'), page_size)
 
-        #Normal users can only see their sales
-        sales = Sale.objects.filter(member=request.user).order_by('-purchase_date')
-    
-    return render(request, 'members/sales_history.html', {'sales': sales})
+    context = {
+        'sales': sales,
+        'page_size': page_size,
+        'is_first_page': not request.GET.get('cursor'),
+        'query': request.GET.get('q', '').strip(),
+    }
+    return render(request, 'members/sales_history.html', context)
+
+
+@login_required
+def sales_history_more(request):
+
+    # JSON version of a sales history page for "load more" requests
+    page_size = get_page_size(request, settings.SALES_HISTORY_PAGE_SIZE, settings.SALES_HISTORY_MAX_PAGE_SIZE)
+    rows = _search_sales(request, _sales_for_user(request.user)).values(
+        'id', 'item__item_name', 'member__username', 'purchase_quantity', 'price_per_unit', 'total_price', 'purchase_date'
+    )
+    sales = paginate_keyset(rows, ('purchase_date', 'id'), request.GET.get('cursor'), page_size)
+
+    return JsonResponse({'sales': sales.items, 'next_cursor': sales.next_cursor})
+
+
+@login_required
+@require_POST
+def import_sales(request):
+
+    # Bulk import is limited to superusers
+    if not request.user.is_superuser:
+        return JsonResponse({'errors': ['Only superusers can import sales.']}, status=403)
+
+    # Sales come from an uploaded CSV/JSON file or from a JSON request body
+    try:
+        upload = request.FILES.get('file')
+        if upload:
+            file_format = request.POST.get('format') or upload.name.rsplit('.', 1)[-1].lower()
+            rows = ingest.read_sales(upload, file_format)
+        else:
+            rows = ingest.read_sales(request, 'json')
+        created = ingest.import_sales(rows, triggered_by=request.user)
+
+    except ValidationError as error:
+        return JsonResponse({'errors': error.messages}, status=400)
+
+    return JsonResponse({'created': created})
+
+
+@login_required
+@require_POST
+def bulk_sales(request):
+
+    # Deletes or reprices every sale matching the filters, members can only change their own sales
+    form = BulkSaleActionForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'errors': [
+            ' '.join(errors) if field == '__all__' else f'{field}: {" ".join(errors)}' for field, errors in form.errors.items()
+        ]}, status=400)
+
+    username = form.cleaned_data['member']
+    if username and username != request.user.username and not request.user.is_superuser:
+        return JsonResponse({'errors': ['Only superusers can change the sales of another member.']}, status=403)
+
+    price = form.cleaned_data['price'] if form.cleaned_data['action'] == 'reprice' else None
+    summary = bulk.summarize(bulk.matching_sales(form, request.user), price)
+    if form.cleaned_data['dry_run']:
+        return JsonResponse({'dry_run': True, **summary})
+
+    # Large matches are queued and reported as accepted, their status page shows when they finish
+    action = bulk.start(form, request.user, summary['matched'])
+    status = {'pending': 202, 'failed': 400}.get(action.status, 200)
+    return JsonResponse({**summary, 'action': bulk.describe(action)}, status=status)
+
+
+@login_required
+def bulk_sale_action(request, action_id):
+    action = get_object_or_404(BulkSaleAction, id=action_id)
+    if action.requested_by_id != request.user.pk and not request.user.is_superuser:
+        return JsonResponse({'errors': ['Only superusers can view the actions of another member.']}, status=403)
+    return JsonResponse(bulk.describe(action))
 
 
 @login_required
@@ -221,38 +384,34 @@ def update_sale(request, sale_id):
         form = SaleUpdateForm(request.POST, instance=sale)
         if form.is_valid():
             new_purchase_quantity = form.cleaned_data['purchase_quantity']
+            item_name = form.cleaned_data['item_name']
 
-            # Fetch inventory record for sale item
             try:
-                inventory = Inventory.objects.get(item_name=sale.item_name)
-                inventory_amount = inventory.inventory_amount
+                with transaction.atomic():
 
-            except Inventory.DoesNotExist:
-                #Default inventory amount if no record exists
-                inventory_amount = 1000
-                inventory = Inventory.objects.create(item_name=sale.item_name, inventory_amount=inventory_amount)
+                    # Fetch and lock the inventory record for the sale item, default inventory amount if no record exists
+                    inventory, created = Inventory.objects.select_for_update().get_or_create(item_name=item_name)
 
-            # Calculate available quantity including current sale quantity
-            available_quantity = inventory_amount + sale.purchase_quantity - new_purchase_quantity
+                    # Save updated sale, the old quantity is returned to stock before the new one is reserved
+                    sale.purchase_quantity = new_purchase_quantity 
+                    sale.item = inventory
+                    sale.save()
 
-            # Check if new purchase quantity exceeds available quantity
-            if new_purchase_quantity > available_quantity:
-                messages.error(request, f"Purchase quantity cannot exceed available inventory ({available_quantity}) for {sale.item_name}.")
+            except InsufficientStockError as error:
+                messages.error(request, f"Purchase quantity cannot exceed available inventory ({error.available}) for {item_name}.")
                 return redirect('update_sale', sale_id=sale_id)
 
-            # Save updated sale and adjust inventory's remaining quantity   
-            sale.purchase_quantity = new_purchase_quantity 
-            sale.save()
-            inventory.remaining_quantity = max(inventory.inventory_amount - new_purchase_quantity, 0)
-            inventory.save()
-
             # Trigger notifications based on conditions
-            if 100 <= new_purchase_quantity <= 1000:
-                Notification.objects.create(
-                    type='high_purchase_quantity',
-                    message = f"{request.user.username} updated purchase quantity to a high value of {new_purchase_quantity} for {sale.item_name}.",
-                    triggered_by = request.user
-                )
+            rules.publish(rules.SaleEvent(
+                action='updated',
+                item_id=inventory.pk,
+                item_name=item_name,
+                purchase_quantity=new_purchase_quantity,
+                member_id=sale.member_id,
+                member_username=sale.member.username,
+                triggered_by_id=request.user.pk,
+                triggered_by_username=request.user.username,
+            ))
 
             return redirect('sales_history')    
     
@@ -264,8 +423,17 @@ def update_sale(request, sale_id):
 @login_required
 def delete_sales(request):
     if request.method == 'POST':
-        sale_ids = request.POST.getlist('sales')
-        Sale.objects.filter(id__in=sale_ids).delete()
+
+        # Deleted in one transaction, members can only delete their own sales
+        try:
+            deleted = ingest.delete_sales(request.POST.getlist('sales'), request.user)
+        except ValueError:
+            return HttpResponseBadRequest('Sale ids must be numbers.')
+
+        if deleted:
+            messages.success(request, f'{deleted} selected sales have been deleted.')
+        else:
+            messages.warning(request, 'No sales have been selected for deletion.')
     return redirect('sales_history')
 
 @login_required
@@ -325,28 +493,18 @@ def change_password(request):
 
 @login_required
 def inventory_list(request):
+
+    # Total purchase quantity is kept on the inventory row itself, the latest sale price comes from the aggregates cache
     inventories = Inventory.objects.all()
-    
+    query = request.GET.get('q', '').strip()
+    if search.words(query):
+        inventories = inventories.filter(pk__in=search.item_ids(query))
+    inventories = list(inventories)
+    figures = aggregates.get_items(inventory.pk for inventory in inventories)
     for inventory in inventories:
-        # Fetch total purchase quantity for item
-        total_purchase_quantity = Sale.objects.filter(item_name=inventory.item_name).aggregate(
-            total=Sum('purchase_quantity')
-        )['total'] or 0 #default to 0 if no sales found
-
+        inventory.price_per_unit = figures.get(inventory.pk, {}).get('latest_price')
 
-        # Fetch latest sale price for item
-        latest_sale = Sale.objects.filter(item_name = inventory.item_name).order_by('-purchase_date').first()
-        price_per_unit = latest_sale.price_per_unit if latest_sale else None
-
-        # Add these attributes to each inventory item
-        inventory.total_purchase_quantity = total_purchase_quantity
-        inventory.price_per_unit = price_per_unit
-        
-        context = {
-            'inventories' : inventories
-        }
-
-    return render(request, 'members/inventory.html', {'inventories': inventories})
+    return render(request, 'members/inventory.html', {'inventories': inventories, 'query': query})
 
 @login_required
 def update_inventory(request, inventory_id):
@@ -359,30 +517,20 @@ def update_inventory(request, inventory_id):
             # Get the new inventory amount from form data
             new_inventory_amount = form.cleaned_data['inventory_amount']
 
-            # Calculate total purchase quantity for this item
-            total_purchase_quantity = Sale.objects.filter(item_name=inventory.item_name).aggregate(    
-                total=Sum('purchase_quantity')
-            )['total'] or 0
+            # Total purchase quantity for this item from the running counter
+            total_purchase_quantity = inventory.total_purchase_quantity
 
             # Check if new inventory amount is less than total purchase quantity
             if new_inventory_amount < total_purchase_quantity:
                 messages.error(request, f"Inventory amount cannot be less than the total purchase quantity ({total_purchase_quantity}) for {inventory.item_name}.")
                 return redirect('update_inventory', inventory_id = inventory_id)
             
-            # Update remaining quantity as the difference between new inventory amount and total purchase quantity
-            inventory.remaining_quantity = max(new_inventory_amount - total_purchase_quantity, 0)
+            # Save the inventory record, remaining quantity is recalculated from the new inventory amount
             inventory.inventory_amount = new_inventory_amount
-
-            # Save the inventory record
             inventory.save()
 
             # Trigger low inventory notification 
-            if inventory.remaining_quantity <= 50:
-                Notification.objects.create(
-                    type='low_inventory',
-                    message=f"Inventory for {inventory.item_name} is low: {inventory.remaining_quantity} remaining.",
-                     triggered_by=request.user
-                )
+            rules.publish(rules.InventoryEvent(item_id=inventory.pk, item_name=inventory.item_name, triggered_by_id=request.user.pk))
             
             return redirect('inventory_list')
     else:
@@ -394,60 +542,113 @@ def update_inventory(request, inventory_id):
 def delete_inventory(request):
     if request.method == 'POST':
         inventory_ids = request.POST.getlist('inventories')
-        Inventory.objects.filter(id__in=inventory_ids).delete()
+        try:
+            Inventory.objects.filter(id__in=inventory_ids).delete()
+        except ProtectedError:
+            messages.error(request, 'Inventory items with recorded sales cannot be deleted.')
         return redirect('inventory_list')  # Redirect to the inventory page after deletion
     
 
 # Sales History CSV Export
 @login_required
 def export_sales_history(request):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="sales_history.csv"'
-
-    writer = csv.writer(response)
-    writer.writerow(['First Name', 'Last Name', 'Item Name', 'Purchase Quantity', 'Price Per Unit', 'Total Price', 'Purchase Date'])
-
-    sales = Sale.objects.select_related('member')
-    for sale in sales:
-        writer.writerow([
-            sale.member.first_name,
-            sale.member.last_name,
-            sale.item_name,
-            sale.purchase_quantity,
-            sale.price_per_unit,
-            sale.total_price,
-            sale.purchase_date
-        ])
-
-    return response
+    filters = SaleFilterForm(request.GET)
+    if not filters.is_valid():
+        return HttpResponseBadRequest(filters.errors.as_text())
+
+    # Plain value tuples streamed from the database cursor, no model instances are built
+    sales = filters.filter_sales(Sale.objects.order_by('purchase_date', 'id')).values_list(
+        'member__first_name',
+        'member__last_name',
+        'item__item_name',
+        'purchase_quantity',
+        'price_per_unit',
+        'total_price',
+        'purchase_date'
+    ).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+    header = ['First Name', 'Last Name', 'Item Name', 'Purchase Quantity', 'Price Per Unit', 'Total Price', 'Purchase Date']
+    return streaming_download(csv_lines(header, sales), 'sales_history.csv', 'text/csv', filters.cleaned_data['gzip'])
 
 # Inventory CSV Export
 @login_required
 def export_inventory(request):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="inventory.csv"'
+    filters = SaleFilterForm(request.GET)
+    if not filters.is_valid():
+        return HttpResponseBadRequest(filters.errors.as_text())
 
-    writer = csv.writer(response)
-    writer.writerow(['Item Name', 'Inventory Amount', 'Remaining Quantity'])
+    inventories = filters.filter_inventory(Inventory.objects.order_by('id')).values_list(
+        'item_name',
+        'inventory_amount',
+        'remaining_quantity'
+    ).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
 
-    inventories = Inventory.objects.all()
-    for inventory in inventories:
-        writer.writerow([
-            inventory.item_name,
-            inventory.inventory_amount,
-            inventory.remaining_quantity
-        ])
+    header = ['Item Name', 'Inventory Amount', 'Remaining Quantity']
+    return streaming_download(csv_lines(header, inventories), 'inventory.csv', 'text/csv', filters.cleaned_data['gzip'])
+
+# Member statement export, transactions and sales of one member in CSV or JSON Lines
+@login_required
+def export_statement(request):
+    filters = StatementFilterForm(request.GET)
+    if not filters.is_valid():
+        return HttpResponseBadRequest(filters.errors.as_text())
+
+    # Members export their own statement, superusers can export anyone's
+    member = request.user
+    username = filters.cleaned_data['member']
+    if username and username != request.user.username:
+        if not request.user.is_superuser:
+            return HttpResponseForbidden('Only superusers can export the statement of another member.')
+        member = get_object_or_404(get_user_model(), username=username)
+
+    rows = ledger.statement_rows(member, filters)
+    if filters.cleaned_data['file_format'] == 'jsonl':
+        return streaming_download(
+            jsonl_lines(ledger.STATEMENT_FIELDS, rows), f'statement_{member.username}.jsonl', 'application/x-ndjson', filters.cleaned_data['gzip']
+        )
 
-    return response
+    header = ['Type', 'Date', 'Description', 'Quantity', 'Price Per Unit', 'Amount']
+    return streaming_download(csv_lines(header, rows), f'statement_{member.username}.csv', 'text/csv', filters.cleaned_data['gzip'])
 
 @login_required
 def notifications(request):
+    page_size = get_page_size(request, settings.NOTIFICATIONS_PAGE_SIZE, settings.NOTIFICATIONS_MAX_PAGE_SIZE)
+
     if request.user.is_superuser:
-        notifications = Notification.objects.filter(is_read=False).order_by('-created_at')
+
+        # Most recently seen unread notifications first, one page at a time
+        unread = Notification.objects.filter(is_read=False).select_related('triggered_by')
+        notifications = paginate_keyset(unread, ('last_seen_at', 'id'), request.GET.get('cursor'), page_size)
     else:
         notifications = []
 
-    return render(request, 'members/notifications.html', {'notifications': notifications})
+    context = {
+        'notifications': notifications,
+        'page_size': page_size,
+        'is_first_page': not request.GET.get('cursor'),
+    }
+    return render(request, 'members/notifications.html', context)
+
+@login_required
+@require_POST
+def mark_notifications_read(request):
+    if request.user.is_superuser:
+        unread = Notification.objects.filter(is_read=False)
+
+        # Everything unread is cleared with a single UPDATE
+        if request.POST.get('all'):
+            count = unread.update(is_read=True)
+        else:
+            try:
+                notification_ids = [int(notification_id) for notification_id in request.POST.getlist('notifications')]
+            except ValueError:
+                return HttpResponseBadRequest('Notification ids must be numbers.')
+            count = 0
+            for batch in chunks(notification_ids):
+                count += unread.filter(id__in=batch).update(is_read=True)
+
+        messages.success(request, f'{count} notifications marked as read.')
+    return redirect('notifications')
 
 @login_required
 def mark_notification_read(request, notification_id):
@@ -458,29 +659,55 @@ def mark_notification_read(request, notification_id):
     return redirect('notifications')
 
 @login_required
-def inventory_recommendations(request):
-    inventories = Inventory.objects.all()
-    recommendations = []
+def search_suggestions(request):
 
-    for inventory in inventories:
-        # Calculate average monthly sales for each item
-        sales = Sale.objects.filter(item_name=inventory.item_name)
-        total_sales = sales.aggregate(Sum('purchase_quantity'))['purchase_quantity__sum'] or 0
-        avg_sales = sales.aggregate(Avg('purchase_quantity'))['purchase_quantity__avg'] or 0
+    # Typeahead for the search boxes, member names are only suggested to superusers
+    query = request.GET.get('q', '')
+    limit = get_bounded_int(request, 'limit', settings.SEARCH_SUGGESTION_LIMIT, settings.SEARCH_MAX_SUGGESTION_LIMIT)
+    suggestions = {'items': search.suggest_items(query, limit)}
+    if request.user.is_superuser:
+        suggestions['members'] = search.suggest_members(query, limit)
+    return JsonResponse(suggestions)
+
+@login_required
+def aggregates_stats(request):
 
-        # Define recommendation logic (i.e inventory should be twice the average sale)
-        recommended_level = avg_sales * 2 if avg_sales else 100
+    # Hit and miss counters of the aggregates cache for monitoring
+    if not request.user.is_superuser:
+        return JsonResponse({'errors': ['Only superusers can view cache statistics.']}, status=403)
+    return JsonResponse(aggregates.stats())
 
-        # Update inventory's recommended level
-        inventory.recommended_inventory_level = recommended_level
-        inventory.save()
+def metrics(request):
 
-        recommendations.append({
-            'item_name': inventory.item_name,
-            'inventory_amount': inventory.inventory_amount,
-            'recommended_level': recommended_level,
-            'remaining_quantity': inventory.remaining_quantity
-        })
+    # Scrapers authenticate with METRICS_TOKEN, logged in superusers can read the figures too
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not (request.user.is_superuser or (settings.METRICS_TOKEN and constant_time_compare(token, settings.METRICS_TOKEN))):
+        return HttpResponse('Forbidden\n', status=403, content_type='text/plain')
+    return HttpResponse(instrumentation.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
-    return render(request, 'members/inventory_recommendations.html', {'recommendations': recommendations})
+@login_required
+def inventory_recommendations(request):
 
+    # Recommended levels come from the nightly forecast, or a refresh that is explicitly requested
+    if request.method == 'POST':
+        if request.user.is_superuser:
+            updated = forecasting.refresh_forecasts()
+            messages.success(request, f'Recommended levels refreshed for {updated} inventory items.')
+        return redirect('inventory_recommendations')
+
+    recommendations = list(Inventory.objects.order_by('item_name').values(
+        'pk',
+        'item_name',
+        'inventory_amount',
+        'remaining_quantity',
+        recommended_level=F('recommended_inventory_levels'),
+        daily_demand=F('forecast__daily_demand'),
+        reorder_point=F('forecast__reorder_point'),
+    ))
+
+    # Sales so far and the average sale quantity come from the aggregates cache
+    figures = aggregates.get_items(recommendation['pk'] for recommendation in recommendations)
+    for recommendation in recommendations:
+        recommendation.update(figures.get(recommendation['pk'], {}))
+
+    return render(request, 'members/inventory_recommendations.html', {'recommendations': recommendations})